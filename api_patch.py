@@ -3,6 +3,9 @@ import os
 import sqlite3
 import sys
 from database.models import Blogger, BloggerReferral, User, get_session
+from database import blogger_daily_stats
+from database.bloggers_db import get_bloggers_connection
+from database.sqlite_schema import get_bloggers_schema, get_schema
 from datetime import datetime
 from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker
@@ -13,7 +16,7 @@ from typing import Optional, Dict, Any, Union
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
 # Теперь можем импортировать config
-from config import BLOGGERS_DB_PATH, DATABASE_PATH
+from config import BLOGGERS_DB_PATH, BLOGGERS_SINGLE_DB, DATABASE_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -65,39 +68,40 @@ def track_referral_click(blogger_key: str, user_id: Union[int, str], username: O
         # Подготавливаем ключи для поиска
         key_variants = [f"blogger_{blogger_key}", f"ref_{blogger_key}", blogger_key]
         
-        # Сначала ищем в основной базе данных
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
+        blogger_id = None
         
-        # Проверяем существование таблицы blogger_referral_codes
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='blogger_referral_codes'")
-        if cursor.fetchone():
-            # Таблица существует, ищем блогера
-            placeholders = ', '.join(['?'] * len(key_variants))
-            cursor.execute(f"SELECT blogger_id FROM blogger_referral_codes WHERE code IN ({placeholders})", key_variants)
-            result = cursor.fetchone()
+        # В режиме единой базы коды из database.db перенесены в основную базу
+        if not BLOGGERS_SINGLE_DB:
+            conn = sqlite3.connect(DATABASE_PATH)
+            cursor = conn.cursor()
+        
+            # Проверяем существование таблицы blogger_referral_codes (схема из кэша)
+            if get_schema(conn).has_table('blogger_referral_codes'):
+                # Таблица существует, ищем блогера
+                placeholders = ', '.join(['?'] * len(key_variants))
+                cursor.execute(f"SELECT blogger_id FROM blogger_referral_codes WHERE code IN ({placeholders})", key_variants)
+                result = cursor.fetchone()
             
-            if result:
-                blogger_id = result[0]
-                logging.info(f"Найден блогер в database.db с ID: {blogger_id}")
+                if result:
+                    blogger_id = result[0]
+                    logging.info(f"Найден блогер в database.db с ID: {blogger_id}")
+                else:
+                    blogger_id = None
+                    logging.info("Блогер не найден в database.db")
             else:
                 blogger_id = None
-                logging.info("Блогер не найден в database.db")
-        else:
-            blogger_id = None
-            logging.info("Таблица blogger_referral_codes не существует в database.db")
+                logging.info("Таблица blogger_referral_codes не существует в database.db")
         
-        conn.close()
+            conn.close()
         
         # Если не нашли в основной базе, проверяем в базе блогеров
         if blogger_id is None and os.path.exists(BLOGGERS_DB_PATH):
-            conn = sqlite3.connect(BLOGGERS_DB_PATH)
+            conn = get_bloggers_connection()
             cursor = conn.cursor()
             
-            # Проверяем структуру таблицы bloggers
-            cursor.execute("PRAGMA table_info(bloggers)")
-            columns = [col[1] for col in cursor.fetchall()]
-            has_referral_code = 'referral_code' in columns
+            # Структура таблиц из кэша схемы
+            schema = get_bloggers_schema(conn)
+            has_referral_code = schema.has_column('bloggers', 'referral_code')
             
             # Ищем по ключу, учитывая наличие колонки referral_code
             placeholders = ', '.join(['?'] * len(key_variants))
@@ -109,19 +113,21 @@ def track_referral_click(blogger_key: str, user_id: Union[int, str], username: O
                 cursor.execute(query, key_variants)
             
             result = cursor.fetchone()
-            
+
+            # Коды, перенесенные из database.db, ищем тем же соединением
+            if not result and BLOGGERS_SINGLE_DB and schema.has_table('blogger_referral_codes'):
+                cursor.execute(f"SELECT blogger_id FROM blogger_referral_codes WHERE code IN ({placeholders})", key_variants)
+                result = cursor.fetchone()
+
             if result:
                 blogger_id = result[0]
-                logging.info(f"Найден блогер в willway_bloggers.db с ID: {blogger_id}")
+                logging.info(f"Найден блогер в {os.path.basename(BLOGGERS_DB_PATH)} с ID: {blogger_id}")
             else:
                 logging.warning(f"Блогер не найден ни в одной из баз данных с ключом: {blogger_key}")
                 conn.close()
                 return False, "Блогер не найден"
                 
-            # Проверяем структуру таблицы blogger_referrals
-            cursor.execute("PRAGMA table_info(blogger_referrals)")
-            columns = [col[1] for col in cursor.fetchall()]
-            logging.info(f"Колонки в таблице blogger_referrals: {columns}")
+            columns = schema.columns('blogger_referrals')
             
             # Определяем, какие колонки доступны
             has_source = 'source' in columns
@@ -162,6 +168,7 @@ def track_referral_click(blogger_key: str, user_id: Union[int, str], username: O
             logging.info(f"Значения для вставки: {insert_values}")
             
             cursor.execute(query, insert_values)
+            blogger_daily_stats.record_click(cursor, blogger_id, current_time)
             conn.commit()
             conn.close()
             
@@ -201,13 +208,11 @@ def register_conversion(user_id: Union[int, str], amount: float, username: Optio
         
         # Ищем запись в базе willway_bloggers.db
         if os.path.exists(BLOGGERS_DB_PATH):
-            conn = sqlite3.connect(BLOGGERS_DB_PATH)
+            conn = get_bloggers_connection()
             cursor = conn.cursor()
             
-            # Проверяем структуру таблицы
-            cursor.execute("PRAGMA table_info(blogger_referrals)")
-            columns = [col[1] for col in cursor.fetchall()]
-            logging.info(f"Колонки в таблице blogger_referrals: {columns}")
+            # Структура таблицы из кэша схемы
+            columns = get_bloggers_schema(conn).columns('blogger_referrals')
             
             # Определяем, какие колонки доступны
             has_source = 'source' in columns
@@ -271,6 +276,7 @@ def register_conversion(user_id: Union[int, str], amount: float, username: Optio
                     logging.info(f"Значения для обновления: {update_values}")
                     
                     cursor.execute(update_query, update_values)
+                    blogger_daily_stats.record_conversion(cursor, referral_id, commission)
                     conn.commit()
                     conn.close()
                     
@@ -283,14 +289,18 @@ def register_conversion(user_id: Union[int, str], amount: float, username: Optio
             else:
                 logging.warning(f"Запись о реферале не найдена для пользователя {user_id} / {username}")
                 conn.close()
-        
+
+        # В режиме единой базы старый файл database.db не используется
+        if BLOGGERS_SINGLE_DB:
+            return False
+
         # Если не нашли в willway_bloggers.db или её нет, проверяем в основной базе
         conn = sqlite3.connect(DATABASE_PATH)
         cursor = conn.cursor()
         
-        # Проверяем существование таблицы user_referrals
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_referrals'")
-        if cursor.fetchone():
+        # Проверяем существование таблицы user_referrals (схема из кэша)
+        main_schema = get_schema(conn)
+        if main_schema.has_table('user_referrals'):
             # Ищем реферальный код для пользователя
             cursor.execute("SELECT blogger_code FROM user_referrals WHERE user_id = ? ORDER BY created_at DESC LIMIT 1", 
                           (user_id_str,))
@@ -309,8 +319,7 @@ def register_conversion(user_id: Union[int, str], amount: float, username: Optio
                     
                     # Обновляем статистику блогера, добавляя конверсию
                     # Если у нас есть таблица для статистики блогеров
-                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='blogger_statistics'")
-                    if cursor.fetchone():
+                    if main_schema.has_table('blogger_statistics'):
                         # Проверяем наличие записи для этого блогера
                         today = datetime.now().strftime("%Y-%m-%d")
                         cursor.execute("SELECT id FROM blogger_statistics WHERE blogger_id = ? AND date = ?", 
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Кэш ответов Health ассистента на типовые вопросы
+
+Подписчики часто задают одни и те же короткие вопросы ("Программа тренировок",
+"Питание"). Ответ на такой вопрос зависит в основном от цели, пола и возраста
+пользователя, поэтому ключ кэша - нормализованный текст вопроса и "корзина"
+профиля (цель, пол, возрастная группа). Кэшируются только короткие вопросы
+(ASSISTANT_ANSWER_CACHE_MAX_QUESTION_LEN): длинные вопросы обычно личные и
+не повторяются.
+
+Ответ, полученный с историей диалога, зависит от контекста ("да", "а сколько
+раз в неделю?"), поэтому:
+- кэш читается и пополняется только на первом сообщении диалога (без истории);
+- при наличии истории из кэша берутся только ответы на вопросы из
+  ASSISTANT_ANSWER_CACHE_QUESTIONS (пункты приветствия ассистента), а
+  ответы, полученные с историей, в кэш не записываются.
+
+Кэш включается переменной ASSISTANT_ANSWER_CACHE, записи ограничены по времени
+жизни (TTL) и количеству (LRU). Отдельный ответ можно не кэшировать
+(use_cache=False при запросе или ttl=0 при записи).
+"""
+
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+ASSISTANT_ANSWER_CACHE_ENABLED = os.getenv("ASSISTANT_ANSWER_CACHE", "false").lower() in ("1", "true", "yes")
+ASSISTANT_ANSWER_CACHE_TTL = float(os.getenv("ASSISTANT_ANSWER_CACHE_TTL", str(6 * 60 * 60)))
+ASSISTANT_ANSWER_CACHE_SIZE = int(os.getenv("ASSISTANT_ANSWER_CACHE_SIZE", "2000"))
+ASSISTANT_ANSWER_CACHE_MAX_QUESTION_LEN = int(os.getenv("ASSISTANT_ANSWER_CACHE_MAX_QUESTION_LEN", "80"))
+
+# Вопросы, ответ на которые не зависит от предыдущего диалога (разделитель ";")
+ASSISTANT_ANSWER_CACHE_QUESTIONS = os.getenv(
+    "ASSISTANT_ANSWER_CACHE_QUESTIONS",
+    "Программа тренировок;Программа питания;Программа питания/разбор анализов;"
+    "Программа восстановления ментального состояния"
+)
+
+# Границы возрастных групп
+AGE_BANDS = (18, 25, 35, 45, 55)
+
+# Начало ответа, который движок отдает при ошибке, - такие ответы не кэшируются
+ERROR_ANSWER_PREFIX = "Извините, произошла ошибка"
+
+_punctuation_re = re.compile(r"[^\w\s]+", re.UNICODE)
+_spaces_re = re.compile(r"\s+")
+
+
+def normalize_question(text):
+    """Приводит вопрос к каноническому виду: регистр, ё, пунктуация, пробелы"""
+    text = (text or "").lower().replace("ё", "е")
+    text = _punctuation_re.sub(" ", text)
+    return _spaces_re.sub(" ", text).strip()
+
+
+def age_band(age):
+    """Возрастная группа пользователя, например '25-34'"""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return None
+    lower = None
+    for bound in AGE_BANDS:
+        if age < bound:
+            return f"{lower}-{bound - 1}" if lower is not None else f"<{bound}"
+        lower = bound
+    return f"{AGE_BANDS[-1]}+"
+
+
+def profile_bucket(profile):
+    """Часть профиля, от которой зависит ответ на типовой вопрос"""
+    if not profile:
+        return (None, None, None)
+    return (
+        normalize_question(profile.get('main_goal')) or None,
+        profile.get('gender'),
+        age_band(profile.get('age'))
+    )
+
+
+def answer_cache_key(question, profile, has_history=False):
+    """
+    Ключ кэша или None, если вопрос не подходит для кэширования.
+    При наличии истории диалога ключ есть только у вопросов из CONTEXT_FREE_QUESTIONS.
+    """
+    normalized = normalize_question(question)
+    if not normalized or len(normalized) > ASSISTANT_ANSWER_CACHE_MAX_QUESTION_LEN:
+        return None
+    if has_history and normalized not in CONTEXT_FREE_QUESTIONS:
+        return None
+    return (normalized,) + profile_bucket(profile)
+
+
+CONTEXT_FREE_QUESTIONS = frozenset(
+    filter(None, (normalize_question(q) for q in ASSISTANT_ANSWER_CACHE_QUESTIONS.split(";")))
+)
+
+
+def is_cacheable_answer(answer):
+    return bool(answer) and not answer.startswith(ERROR_ANSWER_PREFIX)
+
+
+class AnswerCache:
+    """Потокобезопасный TTL+LRU кэш ответов со счетчиками попаданий"""
+
+    def __init__(self, enabled=ASSISTANT_ANSWER_CACHE_ENABLED, ttl=ASSISTANT_ANSWER_CACHE_TTL,
+                 maxsize=ASSISTANT_ANSWER_CACHE_SIZE):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if not self.enabled or key is None:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, answer, ttl=None):
+        """Сохраняет ответ; ttl=0 - не кэшировать эту запись"""
+        ttl = self.ttl if ttl is None else ttl
+        if not self.enabled or key is None or ttl <= 0 or not is_cacheable_answer(answer):
+            return
+        with self._lock:
+            self._data[key] = (monotonic() + ttl, answer)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+answer_cache = AnswerCache()
+
+
+def get_answer_cache_stats():
+    """Счетчики попаданий/промахов кэша ответов"""
+    return answer_cache.stats()
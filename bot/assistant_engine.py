@@ -0,0 +1,546 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Асинхронный движок Health ассистента
+
+Обработчики Telegram работают в потоках диспетчера, поэтому синхронный запрос к
+OpenAI занимал поток на всё время генерации ответа. Движок выполняет запросы
+в отдельном потоке с собственным циклом asyncio и асинхронным клиентом OpenAI:
+
+- число одновременных запросов к API ограничено семафором;
+- запросы одного пользователя выполняются строго по очереди;
+- каждый запрос ограничен таймаутом, запросы пользователя можно отменить;
+- сообщения, пришедшие, пока предыдущий запрос пользователя еще выполняется,
+  объединяются в один следующий запрос;
+- частота запросов пользователя ограничена "ведром токенов", а общая очередь -
+  ASSISTANT_MAX_QUEUE; при превышении submit() выбрасывает AssistantBusyError;
+- результат передается в колбэк on_reply/on_error, который выполняется в пуле
+  потоков (отправка сообщения через Bot - блокирующий вызов);
+- сжатие выпавшей из окна истории (compact=True) выполняется отдельной задачей
+  после освобождения очереди пользователя через тот же асинхронный бэкенд,
+  поэтому следующий ответ не ждет запроса на краткое содержание.
+
+Адрес API берется из OPENAI_BASE_URL, поэтому движок можно проверить
+на локальном сервере-заглушке, реализующем /v1/chat/completions
+(tests/test_assistant_engine.py).
+
+В потоковом режиме (передан колбэк on_partial) ответ читается из модели по
+частям, а накопленный текст периодически передается в on_partial для
+редактирования сообщения в Telegram. Правки отправляются не чаще
+ASSISTANT_STREAM_EDIT_INTERVAL и не чаще лимита Telegram для одного чата;
+промежуточные фрагменты, пришедшие между правками, объединяются.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from functools import partial
+from time import monotonic
+
+from bot.gpt_assistant import (
+    ASSISTANT_MAX_TOKENS, ASSISTANT_MODEL, ASSISTANT_TEMPERATURE,
+    build_assistant_messages, get_async_client, get_cached_answer, save_chat_turn
+)
+from bot.answer_cache import answer_cache
+from bot.assistant_history import (
+    HISTORY_SUMMARY_MAX_TOKENS, HISTORY_SUMMARY_TEMPERATURE,
+    fallback_summary, overflow_turns, plan_compaction, save_summary, summary_request_messages
+)
+
+logger = logging.getLogger(__name__)
+
+ASSISTANT_MAX_CONCURRENCY = int(os.getenv("ASSISTANT_MAX_CONCURRENCY", "8"))
+ASSISTANT_TIMEOUT = float(os.getenv("ASSISTANT_TIMEOUT", "60"))
+ASSISTANT_STREAMING = os.getenv("ASSISTANT_STREAMING", "true").lower() in ("1", "true", "yes")
+ASSISTANT_STREAM_EDIT_INTERVAL = float(os.getenv("ASSISTANT_STREAM_EDIT_INTERVAL", "1.5"))
+
+# Telegram допускает не больше одного сообщения (или правки) в секунду в одном чате
+TELEGRAM_CHAT_MIN_INTERVAL = 1.0
+
+# Ограничение частоты: ASSISTANT_RATE_PER_MINUTE запросов в минуту с запасом ASSISTANT_RATE_BURST
+ASSISTANT_RATE_PER_MINUTE = float(os.getenv("ASSISTANT_RATE_PER_MINUTE", "6"))
+ASSISTANT_RATE_BURST = int(os.getenv("ASSISTANT_RATE_BURST", "3"))
+# Максимум запросов в очереди движка (ожидающих и выполняющихся)
+ASSISTANT_MAX_QUEUE = int(os.getenv("ASSISTANT_MAX_QUEUE", "100"))
+# Сколько ждать следующих сообщений пользователя перед отправкой запроса (0 - не ждать)
+ASSISTANT_COALESCE_WINDOW = float(os.getenv("ASSISTANT_COALESCE_WINDOW", "0"))
+
+
+class AssistantBusyError(Exception):
+    """Запрос не принят: пользователь превысил лимит или движок перегружен"""
+
+    RATE_LIMITED = "rate_limited"
+    OVERLOADED = "overloaded"
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        self._refill(monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else None
+
+    def is_full(self):
+        self._refill(monotonic())
+        return self.tokens >= self.capacity
+
+
+class AssistantRequest:
+    """Запрос к ассистенту; пока он не начал выполняться, к нему добавляются новые сообщения"""
+
+    def __init__(self, user_id, user_message, history_loader, on_reply, on_error, on_partial, use_cache,
+                 compact=False):
+        self.user_id = user_id
+        self.messages = [user_message]
+        self.history_loader = history_loader
+        self.on_reply = on_reply
+        self.on_error = on_error
+        self.on_partial = on_partial
+        self.use_cache = use_cache
+        self.compact = compact
+        self.started = False
+        self.future = None
+        self.last_added = monotonic()
+
+    @property
+    def text(self):
+        return "\n".join(self.messages)
+
+
+class OpenAIChatBackend:
+    """Бэкенд, обращающийся к chat completions через асинхронный клиент OpenAI"""
+
+    def __init__(self, client=None, model=ASSISTANT_MODEL,
+                 max_tokens=ASSISTANT_MAX_TOKENS, temperature=ASSISTANT_TEMPERATURE):
+        self._client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_async_client()
+        return self._client
+
+    async def complete(self, messages, max_tokens=None, temperature=None):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens or self.max_tokens,
+            temperature=self.temperature if temperature is None else temperature
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, messages):
+        """Асинхронный генератор фрагментов ответа (stream=True)"""
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # При отмене или таймауте закрываем HTTP-соединение
+            await stream.close()
+
+
+class FakeStreamingBackend:
+    """
+    Бэкенд-заглушка для проверки движка без обращения к API: возвращает
+    заданный текст фрагментами по chunk_size символов с задержкой delay
+    """
+
+    def __init__(self, text="Тестовый ответ Health ассистента.", chunk_size=4, delay=0.05, first_delay=None):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.first_delay = delay if first_delay is None else first_delay
+
+    async def complete(self, messages, max_tokens=None, temperature=None):
+        await asyncio.sleep(self.first_delay + self.delay * (len(self.text) // self.chunk_size))
+        return self.text
+
+    async def stream(self, messages):
+        await asyncio.sleep(self.first_delay)
+        for i in range(0, len(self.text), self.chunk_size):
+            if i:
+                await asyncio.sleep(self.delay)
+            yield self.text[i:i + self.chunk_size]
+
+
+class AssistantEngine:
+    """Очередь запросов к ассистенту, обслуживаемая циклом asyncio в фоновом потоке"""
+
+    def __init__(self, backend=None, max_concurrency=ASSISTANT_MAX_CONCURRENCY, timeout=ASSISTANT_TIMEOUT,
+                 edit_interval=ASSISTANT_STREAM_EDIT_INTERVAL, rate_per_minute=ASSISTANT_RATE_PER_MINUTE,
+                 rate_burst=ASSISTANT_RATE_BURST, max_queue=ASSISTANT_MAX_QUEUE,
+                 coalesce_window=ASSISTANT_COALESCE_WINDOW):
+        self.backend = backend or OpenAIChatBackend()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.edit_interval = max(edit_interval, TELEGRAM_CHAT_MIN_INTERVAL)
+        self.rate = rate_per_minute / 60.0
+        self.rate_burst = rate_burst
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._user_locks = {}
+        self._user_futures = {}
+        # Запрос пользователя, который еще не начал выполняться (к нему добавляются новые сообщения)
+        self._queued = {}
+        self._buckets = {}
+        # Пользователи, для которых выполняется сжатие истории (только в потоке цикла)
+        self._compacting = set()
+        self._background_tasks = set()
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.rejected = 0
+
+    def start(self):
+        """Запускает поток с циклом событий (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run_loop, args=(loop, ready), name="assistant-engine", daemon=True
+            )
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            logger.info(f"[ASSISTANT] Движок запущен: max_concurrency={self.max_concurrency}, timeout={self.timeout}s")
+
+    def _run_loop(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def stop(self):
+        """Отменяет все запросы и останавливает цикл событий"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            futures = [f for user_futures in self._user_futures.values() for f in user_futures]
+            self._user_futures.clear()
+        if loop is None:
+            return
+        for future in futures:
+            future.cancel()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
+
+    def submit(self, user_id, user_message, history_loader=None, on_reply=None, on_error=None, on_partial=None,
+               use_cache=True, compact=False):
+        """
+        Ставит запрос пользователя в очередь и сразу возвращает concurrent.futures.Future.
+
+        Args:
+            user_id: ID пользователя в Telegram
+            user_message: Текст сообщения
+            history_loader: Функция без аргументов, возвращающая историю диалога.
+                Вызывается, когда подходит очередь запроса, чтобы история
+                включала ответы на предыдущие сообщения пользователя
+            on_reply: Колбэк on_reply(response), вызывается после получения ответа
+            on_error: Колбэк on_error(exception) при ошибке или таймауте
+            on_partial: Колбэк on_partial(text) с накопленным текстом ответа.
+                Если передан и бэкенд поддерживает stream(), ответ читается потоково
+            use_cache: Разрешить ответ из кэша типовых вопросов (bot/answer_cache.py)
+            compact: После ответа сжать выпавшую из окна историю (bot/assistant_history.py)
+        """
+        self.start()
+        key = str(user_id)
+
+        with self._lock:
+            # Пока предыдущее сообщение ждет очереди, новое дописывается к нему
+            queued = self._queued.get(key)
+            if queued is not None and not queued.started:
+                queued.messages.append(user_message)
+                queued.last_added = monotonic()
+                self.coalesced += 1
+                logger.info(f"[ASSISTANT] Сообщение пользователя {user_id} объединено с ожидающим запросом")
+                return queued.future
+
+            if sum(len(f) for f in self._user_futures.values()) >= self.max_queue:
+                self.rejected += 1
+                raise AssistantBusyError(AssistantBusyError.OVERLOADED)
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._prune_buckets()
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.rate_burst)
+            if not bucket.take():
+                self.rejected += 1
+                raise AssistantBusyError(AssistantBusyError.RATE_LIMITED, bucket.retry_after())
+
+            request = AssistantRequest(user_id, user_message, history_loader, on_reply, on_error, on_partial,
+                                       use_cache, compact)
+            request.future = asyncio.run_coroutine_threadsafe(self._process(key, request), self._loop)
+            self._queued[key] = request
+            self._user_futures.setdefault(key, set()).add(request.future)
+
+        request.future.add_done_callback(partial(self._forget, key, request))
+        return request.future
+
+    def _prune_buckets(self):
+        # Полные ведра ничем не отличаются от новых, их можно не хранить
+        if len(self._buckets) > 10000:
+            for bucket_key in [k for k, b in self._buckets.items() if b.is_full()]:
+                del self._buckets[bucket_key]
+
+    def _forget(self, key, request, future):
+        with self._lock:
+            if self._queued.get(key) is request:
+                del self._queued[key]
+            user_futures = self._user_futures.get(key)
+            if user_futures is not None:
+                user_futures.discard(future)
+                if not user_futures:
+                    del self._user_futures[key]
+
+    def cancel_user(self, user_id):
+        """Отменяет ожидающие и выполняющиеся запросы пользователя"""
+        with self._lock:
+            futures = list(self._user_futures.get(str(user_id), ()))
+        for future in futures:
+            future.cancel()
+        if futures:
+            logger.info(f"[ASSISTANT] Отменено запросов пользователя {user_id}: {len(futures)}")
+        return len(futures)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": sum(len(f) for f in self._user_futures.values()),
+                "max_queue": self.max_queue,
+                "max_concurrency": self.max_concurrency,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected
+            }
+
+    def pending(self, user_id=None):
+        """Количество незавершенных запросов (всего или для пользователя)"""
+        with self._lock:
+            if user_id is not None:
+                return len(self._user_futures.get(str(user_id), ()))
+            return sum(len(f) for f in self._user_futures.values())
+
+    async def _process(self, key, request):
+        loop = asyncio.get_running_loop()
+        user_id = request.user_id
+
+        # asyncio.Lock пропускает ожидающих в порядке FIFO, это и задает порядок сообщений пользователя.
+        # Блокировка хранится вместе со счетчиком запросов и удаляется после последнего из них
+        entry = self._user_locks.get(key)
+        if entry is None:
+            entry = self._user_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        lock = entry[0]
+
+        try:
+            async with lock:
+                # Даем пользователю дописать сообщение, если включено ожидание
+                while self.coalesce_window > 0:
+                    delay = request.last_added + self.coalesce_window - monotonic()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+
+                with self._lock:
+                    request.started = True
+                    if self._queued.get(key) is request:
+                        del self._queued[key]
+                user_message = request.text
+                on_reply, on_error = request.on_reply, request.on_error
+
+                try:
+                    response = await asyncio.wait_for(
+                        self._respond(user_id, user_message, request.history_loader,
+                                      request.on_partial, request.use_cache),
+                        self.timeout
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        logger.warning(f"[ASSISTANT] Таймаут ответа для пользователя {user_id} ({self.timeout}s)")
+                    else:
+                        logger.error(f"[ASSISTANT] Ошибка при получении ответа для пользователя {user_id}: {e}")
+                    if on_error:
+                        await loop.run_in_executor(None, on_error, e)
+                    raise
+
+                # Ответ доставляется до освобождения блокировки, чтобы сохранить порядок
+                if on_reply:
+                    await loop.run_in_executor(None, on_reply, response)
+
+            # Сжатие истории не задерживает следующие сообщения пользователя
+            if request.compact:
+                self._start_compaction(key, user_id)
+            return response
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._user_locks.pop(key, None)
+
+    def _start_compaction(self, key, user_id):
+        if key in self._compacting:
+            return
+        self._compacting.add(key)
+        task = asyncio.get_running_loop().create_task(self._compact(user_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(partial(self._compaction_done, key))
+
+    def _compaction_done(self, key, task):
+        self._compacting.discard(key)
+        self._background_tasks.discard(task)
+
+    async def _compact(self, user_id):
+        """Сжимает выпавшую из окна часть диалога в краткое содержание"""
+        loop = asyncio.get_running_loop()
+        try:
+            plan = await loop.run_in_executor(None, plan_compaction, user_id)
+            if plan is None:
+                return False
+            previous_summary, overflow = plan
+            turns = overflow_turns(overflow)
+
+            summary = None
+            try:
+                async with self._semaphore:
+                    summary = await asyncio.wait_for(self.backend.complete(
+                        summary_request_messages(previous_summary, turns),
+                        max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+                        temperature=HISTORY_SUMMARY_TEMPERATURE
+                    ), self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[ASSISTANT] Не удалось получить краткое содержание диалога пользователя {user_id}: {e}")
+
+            summary = (summary or "").strip() or fallback_summary(previous_summary, turns)
+            return await loop.run_in_executor(None, save_summary, user_id, overflow, summary)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[ASSISTANT] Ошибка при сжатии истории диалога пользователя {user_id}: {e}")
+            return False
+
+    async def _respond(self, user_id, user_message, history_loader, on_partial=None, use_cache=True):
+        loop = asyncio.get_running_loop()
+        asked_at = datetime.now()
+
+        # Работа с базой данных синхронная, выполняем ее в пуле потоков
+        conversation_history = None
+        if history_loader:
+            conversation_history = await loop.run_in_executor(None, history_loader)
+
+        # Типовой вопрос с готовым ответом не требует обращения к модели.
+        # С историей диалога кэш используется только для вопросов, не зависящих от контекста
+        cache_key = None
+        if use_cache and answer_cache.enabled:
+            cache_key, cached_answer = await loop.run_in_executor(
+                None, get_cached_answer, user_id, user_message, conversation_history
+            )
+            if cached_answer:
+                await loop.run_in_executor(None, save_chat_turn, user_id, user_message, cached_answer, asked_at)
+                return cached_answer
+        messages = await loop.run_in_executor(
+            None, build_assistant_messages, user_id, user_message, conversation_history
+        )
+
+        last_edit = None
+        async with self._semaphore:
+            if on_partial and hasattr(self.backend, "stream"):
+                response, last_edit = await self._stream(user_id, messages, on_partial)
+            else:
+                response = await self.backend.complete(messages)
+
+        # Вопрос и ответ записываются в журнал диалога одной транзакцией
+        await loop.run_in_executor(None, save_chat_turn, user_id, user_message, response, asked_at)
+        answer_cache.set(cache_key, response)
+
+        # Итоговая правка сообщения тоже должна уложиться в лимит чата
+        if last_edit is not None:
+            delay = last_edit + self.edit_interval - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return response
+
+    async def _stream(self, user_id, messages, on_partial):
+        """
+        Читает ответ потоково и передает накопленный текст в on_partial.
+        Одновременно выполняется не больше одной правки; фрагменты, пришедшие
+        пока правка отправляется или не истек интервал, попадут в следующую.
+
+        Returns:
+            tuple: (полный текст ответа, время последней правки или None)
+        """
+        loop = asyncio.get_running_loop()
+        started = monotonic()
+        text = ""
+        last_edit = None
+        in_flight = None
+
+        async for delta in self.backend.stream(messages):
+            if not text:
+                logger.info(f"[ASSISTANT] Первый фрагмент ответа для пользователя {user_id} через {monotonic() - started:.2f}s")
+            text += delta
+
+            now = monotonic()
+            if (in_flight is None or in_flight.done()) and text.strip() and \
+                    (last_edit is None or now - last_edit >= self.edit_interval):
+                last_edit = now
+                in_flight = loop.run_in_executor(None, self._safe_partial, on_partial, user_id, text)
+
+        if in_flight is not None:
+            await in_flight
+        logger.info(f"[ASSISTANT] Потоковый ответ для пользователя {user_id} получен за {monotonic() - started:.2f}s")
+        return text, last_edit
+
+    @staticmethod
+    def _safe_partial(on_partial, user_id, text):
+        try:
+            on_partial(text)
+        except Exception as e:
+            logger.warning(f"[ASSISTANT] Не удалось обновить сообщение пользователя {user_id}: {e}")
+
+
+assistant_engine = AssistantEngine()
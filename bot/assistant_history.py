@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+История диалога с Health ассистентом в пределах бюджета токенов
+
+В запрос к модели попадают последние сообщения, которые помещаются в бюджет
+HISTORY_TOKEN_BUDGET; слишком длинные сообщения обрезаются. Сообщения, которые
+выпали из окна, периодически сжимаются в краткое содержание (таблица
+conversation_summaries), и оно передается модели вместо них.
+
+Чтение истории - один диапазонный запрос по индексу (user_id, timestamp)
+начиная с момента, до которого диалог уже сжат.
+"""
+
+import os
+import logging
+
+from database.models import ChatHistory, ConversationSummary, get_session
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_TURN_MAX_TOKENS = int(os.getenv("HISTORY_TURN_MAX_TOKENS", "400"))
+HISTORY_FETCH_LIMIT = int(os.getenv("HISTORY_FETCH_LIMIT", "20"))
+# Сжатие запускается, когда из окна выпало не меньше HISTORY_SUMMARY_BATCH сообщений
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "6"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_SUMMARY_TEMPERATURE = 0.3
+# Сколько сообщений за пределами окна читается при сжатии
+HISTORY_COMPACT_MAX_ROWS = 40
+
+# Служебные токены на каждое сообщение в формате chat completions
+MESSAGE_OVERHEAD_TOKENS = 4
+# Оценка для русского текста, если tiktoken не установлен
+CHARS_PER_TOKEN = 3
+
+SUMMARY_PROMPT = (
+    "Ты сжимаешь историю диалога пользователя с Health ассистентом. "
+    "Объедини предыдущее краткое содержание и новые сообщения в один короткий текст "
+    "(не больше 5-7 пунктов): цели пользователя, ограничения по здоровью, "
+    "договоренности и рекомендации ассистента. Пиши по-русски, без вступлений."
+)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """Количество токенов в тексте (точно через tiktoken или оценка по длине)"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Обрезает текст до max_tokens токенов"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]).rstrip() + "…"
+    return text[:max_tokens * CHARS_PER_TOKEN].rstrip() + "…"
+
+
+def _load_recent(session, model, user_id, since, limit):
+    """Последние сообщения пользователя после since, от новых к старым"""
+    query = session.query(model.role, model.content, model.timestamp).filter(model.user_id == user_id)
+    if since is not None:
+        query = query.filter(model.timestamp > since)
+    return query.order_by(model.timestamp.desc()).limit(limit).all()
+
+
+def _summary_message(summary):
+    text = truncate_to_tokens(summary, HISTORY_SUMMARY_MAX_TOKENS)
+    return {"role": "system", "content": f"Краткое содержание предыдущего диалога с пользователем:\n{text}"}
+
+
+def select_window(rows, budget):
+    """
+    Набирает сообщения от новых к старым, пока они помещаются в бюджет.
+
+    Returns:
+        tuple: (окно от новых к старым в формате API, строки, не вошедшие в окно)
+    """
+    used = 0
+    window = []
+    for i, row in enumerate(rows):
+        content = truncate_to_tokens(row.content or "", HISTORY_TURN_MAX_TOKENS)
+        cost = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            return window, rows[i:]
+        used += cost
+        window.append({"role": row.role, "content": content})
+    return window, []
+
+
+def build_history(user_id, model=ChatHistory, limit=HISTORY_FETCH_LIMIT, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Возвращает историю диалога для запроса к модели: краткое содержание
+    старой части (если есть) и последние сообщения в пределах бюджета
+
+    Args:
+        user_id: ID пользователя в Telegram
+        model: Таблица журнала диалогов
+        limit: Максимальное количество читаемых сообщений
+        budget: Бюджет токенов на всю историю
+    """
+    session = get_session()
+    try:
+        summary = session.query(ConversationSummary)\
+            .filter(ConversationSummary.user_id == str(user_id))\
+            .first()
+        since = summary.summarized_until if summary else None
+        summary_text = summary.summary if summary else None
+        rows = _load_recent(session, model, user_id, since, limit)
+    except Exception as e:
+        logger.error(f"Ошибка при получении истории диалога пользователя {user_id}: {e}")
+        return []
+    finally:
+        session.close()
+
+    messages = []
+    if summary_text:
+        summary_message = _summary_message(summary_text)
+        messages.append(summary_message)
+        budget -= count_tokens(summary_message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    window, _ = select_window(rows, max(budget, 0))
+    window.reverse()
+    return messages + window
+
+
+def summary_request_messages(previous_summary, turns):
+    """Сообщения запроса к модели для сжатия выпавших из окна сообщений"""
+    transcript = "\n".join(
+        f"{'Пользователь' if role == 'user' else 'Ассистент'}: {truncate_to_tokens(content or '', HISTORY_TURN_MAX_TOKENS)}"
+        for role, content in turns
+    )
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Предыдущее краткое содержание:\n{previous_summary or 'нет'}\n\nНовые сообщения:\n{transcript}"}
+    ]
+
+
+def fallback_summary(previous_summary, turns):
+    """Краткое содержание без обращения к модели: последние вопросы пользователя"""
+    questions = [f"- {truncate_to_tokens(content, 40)}" for role, content in turns if role == "user" and content]
+    combined = "\n".join(filter(None, [previous_summary] + questions))
+    return combined[-HISTORY_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN:]
+
+
+def summarize_turns(previous_summary, turns):
+    """
+    Объединяет предыдущее краткое содержание с выпавшими из окна сообщениями
+    (синхронный запрос к модели). При недоступности модели сохраняет последние
+    вопросы пользователя.
+    """
+    try:
+        from bot.gpt_assistant import ASSISTANT_MODEL, client
+        response = client.chat.completions.create(
+            model=ASSISTANT_MODEL,
+            messages=summary_request_messages(previous_summary, turns),
+            max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+            temperature=HISTORY_SUMMARY_TEMPERATURE
+        )
+        text = (response.choices[0].message.content or "").strip()
+        if text:
+            return text
+    except Exception as e:
+        logger.warning(f"Не удалось получить краткое содержание диалога от модели: {e}")
+    return fallback_summary(previous_summary, turns)
+
+
+def plan_compaction(user_id, model=ChatHistory, limit=HISTORY_FETCH_LIMIT, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Определяет сообщения, которые уже не помещаются в окно истории.
+
+    Returns:
+        tuple: (предыдущее краткое содержание, выпавшие строки от новых к старым)
+               или None, если сжимать пока нечего
+    """
+    session = get_session()
+    try:
+        summary = session.query(ConversationSummary)\
+            .filter(ConversationSummary.user_id == str(user_id))\
+            .first()
+        since = summary.summarized_until if summary else None
+        previous_summary = summary.summary if summary else None
+        rows = _load_recent(session, model, user_id, since, limit + HISTORY_COMPACT_MAX_ROWS)
+    finally:
+        session.close()
+
+    if previous_summary:
+        budget -= count_tokens(_summary_message(previous_summary)["content"]) + MESSAGE_OVERHEAD_TOKENS
+    window, _ = select_window(rows[:limit], max(budget, 0))
+    overflow = rows[len(window):]
+
+    if len(overflow) < HISTORY_SUMMARY_BATCH:
+        return None
+    # Сообщения старше прочитанного диапазона в краткое содержание не попадают,
+    # как и раньше они не попадали в запрос к модели
+    return previous_summary, overflow
+
+
+def overflow_turns(overflow):
+    """Выпавшие строки в хронологическом порядке в виде пар (роль, текст)"""
+    return [(row.role, row.content) for row in reversed(overflow)]
+
+
+def save_summary(user_id, overflow, new_summary):
+    """
+    Сохраняет краткое содержание, включающее выпавшие строки overflow.
+
+    Returns:
+        bool: True, если краткое содержание обновлено
+    """
+    session = get_session()
+    try:
+        summary = session.query(ConversationSummary)\
+            .filter(ConversationSummary.user_id == str(user_id))\
+            .first()
+        if summary is None:
+            summary = ConversationSummary(user_id=str(user_id), summarized_count=0)
+            session.add(summary)
+        elif summary.summarized_until and summary.summarized_until >= overflow[0].timestamp:
+            # Эти сообщения уже сжаты параллельным вызовом
+            return False
+        summary.summary = new_summary
+        summary.summarized_until = overflow[0].timestamp
+        summary.summarized_count = (summary.summarized_count or 0) + len(overflow)
+        session.commit()
+        logger.info(f"[HISTORY] Сжато {len(overflow)} сообщений диалога пользователя {user_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении краткого содержания диалога пользователя {user_id}: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+
+def compact_history(user_id, model=ChatHistory, limit=HISTORY_FETCH_LIMIT, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Синхронно сжимает сообщения, которые уже не помещаются в окно истории.
+    Бот сжимает историю в движке ассистента (AssistantEngine, compact=True),
+    не задерживая ответы пользователю.
+
+    Returns:
+        bool: True, если краткое содержание обновлено
+    """
+    plan = plan_compaction(user_id, model, limit, budget)
+    if plan is None:
+        return False
+    previous_summary, overflow = plan
+    return save_summary(user_id, overflow, summarize_turns(previous_summary, overflow_turns(overflow)))
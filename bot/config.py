@@ -3,78 +3,271 @@
 
 """
 Модуль для работы с конфигурацией бота
+
+Конфигурация читается из bot_config.json один раз и хранится в памяти в виде
+неизменяемого снимка. Обработчики получают снимок без обращения к диску:
+пути к изображениям и видео вычисляются и проверяются при загрузке, а
+изменения файла отслеживаются фоновым потоком по времени модификации (mtime).
 """
 
 import os
+import copy
 import json
 import logging
+import threading
+from types import MappingProxyType
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Корневая директория проекта и путь к файлу конфигурации
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_CONFIG_FILE = os.path.join(PROJECT_ROOT, 'bot_config.json')
+
+# Интервал проверки изменений файла конфигурации (в секундах)
+CONFIG_POLL_INTERVAL = float(os.getenv("BOT_CONFIG_POLL_INTERVAL", "5"))
+
+# Значения по умолчанию, если в файле их нет
+DEFAULT_CONFIG = {
+    "trainer_username": "telegram",
+    "manager_username": "telegram",
+    "cancel_subscription_url": "https://willway.pro/cancelmembers",
+    "reviews_channel_url": "https://willway.pro/feedback",
+    "channel_url": "https://t.me/willway_channel"
+}
+
+# Поля с путями к медиафайлам и соответствующие им вычисляемые абсолютные пути
+MEDIA_PATH_FIELDS = {
+    "description_pic_url": "description_pic_absolute_path",
+    "botpic_url": "botpic_absolute_path",
+    "intro_video_url": "intro_video_absolute_path"
+}
+
+
+def resolve_media_path(path):
+    """Преобразует путь из конфигурации в абсолютный путь внутри проекта"""
+    if path.startswith('/'):
+        # Если путь начинается с /, убираем его
+        path = path[1:]
+    return os.path.join(PROJECT_ROOT, path)
+
+
+class BotConfig:
+    """Неизменяемый снимок конфигурации бота с типизированными аксессорами"""
+
+    def __init__(self, data, mtime=None, file_keys=()):
+        self._data = MappingProxyType(data)
+        self.mtime = mtime
+        # Ключи, заданные в файле (остальные - значения по умолчанию и вычисляемые пути)
+        self.file_keys = frozenset(file_keys)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def keys(self):
+        return self._data.keys()
+
+    def as_dict(self):
+        """Возвращает изменяемую копию конфигурации (для совместимости со старым кодом)"""
+        return copy.deepcopy(dict(self._data))
+
+    @property
+    def bot_token(self) -> str:
+        return self._data.get("bot_token") or os.getenv("TELEGRAM_TOKEN")
+
+    @property
+    def bot_name(self) -> str:
+        return self._data.get("bot_name", "willway_bot")
+
+    @property
+    def trainer_username(self) -> str:
+        return self._data.get("trainer_username", DEFAULT_CONFIG["trainer_username"])
+
+    @property
+    def manager_username(self) -> str:
+        return self._data.get("manager_username", DEFAULT_CONFIG["manager_username"])
+
+    @property
+    def channel_url(self) -> str:
+        return self._data.get("channel_url", DEFAULT_CONFIG["channel_url"])
+
+    @property
+    def reviews_channel_url(self) -> str:
+        return self._data.get("reviews_channel_url", DEFAULT_CONFIG["reviews_channel_url"])
+
+    @property
+    def cancel_subscription_url(self) -> str:
+        return self._data.get("cancel_subscription_url", DEFAULT_CONFIG["cancel_subscription_url"])
+
+    @property
+    def intro_video_file_id(self):
+        return self._data.get("intro_video_file_id")
+
+    @property
+    def intro_video_path(self):
+        """Абсолютный путь к вступительному видео (None, если файл не найден при загрузке)"""
+        return self._data.get("intro_video_absolute_path")
+
+    @property
+    def video_settings(self) -> dict:
+        return dict(self._data.get("video_settings") or {})
+
+    def __repr__(self):
+        return f"<BotConfig(keys={list(self._data.keys())}, mtime={self.mtime})>"
+
+
+def load_config_file(config_file=BOT_CONFIG_FILE):
+    """
+    Читает файл конфигурации и вычисляет абсолютные пути к медиафайлам.
+    Вызывается только при первой загрузке и при изменении файла.
+    """
+    config = dict(DEFAULT_CONFIG)
+    mtime = None
+    file_keys = ()
+
+    try:
+        mtime = os.stat(config_file).st_mtime
+        with open(config_file, 'r', encoding='utf-8') as f:
+            file_data = json.load(f)
+        # Абсолютные пути из старых версий файла не используются: они вычисляются ниже
+        file_data = {k: v for k, v in file_data.items() if k not in MEDIA_PATH_FIELDS.values()}
+        config.update(file_data)
+        file_keys = file_data.keys()
+        logger.info(f"Конфигурация загружена из {config_file}: {list(config.keys())}")
+    except FileNotFoundError:
+        logger.warning(f"Файл конфигурации не найден: {config_file}")
+    except Exception as e:
+        logger.error(f"Ошибка при чтении конфигурации бота: {e}")
+
+    # Проверка и обработка путей медиафайлов выполняется один раз при загрузке
+    for url_field, abs_field in MEDIA_PATH_FIELDS.items():
+        path = config.get(url_field)
+        if not path:
+            continue
+
+        abs_path = resolve_media_path(path)
+        if os.path.exists(abs_path):
+            config[abs_field] = abs_path
+        else:
+            logger.warning(f"Файл {url_field} не существует: {abs_path}")
+
+    return BotConfig(config, mtime, file_keys)
+
+
+class ConfigStore:
+    """
+    Хранилище снимка конфигурации.
+
+    get() не выполняет файлового ввода-вывода: снимок заменяется целиком
+    фоновым потоком, который следит за mtime файла, либо явным вызовом reload().
+    """
+
+    def __init__(self, config_file=BOT_CONFIG_FILE, poll_interval=CONFIG_POLL_INTERVAL):
+        self.config_file = config_file
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop_event = threading.Event()
+
+    def get(self) -> BotConfig:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = load_config_file(self.config_file)
+                    self._start_watcher()
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self) -> BotConfig:
+        """Принудительно перечитывает файл конфигурации"""
+        with self._lock:
+            self._snapshot = load_config_file(self.config_file)
+            self._start_watcher()
+            return self._snapshot
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.config_file).st_mtime
+        except OSError:
+            return None
+
+    def _start_watcher(self):
+        if self.poll_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="bot-config-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                snapshot = self._snapshot
+                if snapshot is not None and self._current_mtime() != snapshot.mtime:
+                    logger.info(f"Обнаружено изменение файла конфигурации {self.config_file}, перечитываем")
+                    with self._lock:
+                        self._snapshot = load_config_file(self.config_file)
+            except Exception as e:
+                logger.error(f"Ошибка при отслеживании изменений конфигурации: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+config_store = ConfigStore()
+
+
+def get_config() -> BotConfig:
+    """Возвращает текущий снимок конфигурации бота (без обращения к диску)"""
+    return config_store.get()
+
+
+def reload_bot_config() -> BotConfig:
+    """Перечитывает конфигурацию с диска"""
+    return config_store.reload()
+
+
 def get_bot_config():
-    """Получает конфигурацию бота из файла"""
-    logger.info("Попытка чтения конфигурации бота")
-    # Путь к файлу конфигурации (относительно корневой директории проекта)
-    BOT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_config.json')
-    
-    logger.info(f"Путь к файлу конфигурации: {BOT_CONFIG_FILE}")
-    logger.info(f"Файл существует: {os.path.exists(BOT_CONFIG_FILE)}")
-    
-    config = {
-        "trainer_username": "telegram",
-        "manager_username": "telegram",
-        "cancel_subscription_url": "https://willway.pro/cancelmembers"
+    """Получает конфигурацию бота в виде словаря (копия снимка в памяти)"""
+    return config_store.get().as_dict()
+
+
+def get_bot_token():
+    """Возвращает токен бота из конфигурации или переменной окружения TELEGRAM_TOKEN"""
+    return config_store.get().bot_token
+
+
+def config_to_file_data(config, file_keys=()):
+    """
+    Оставляет только ключи, которые нужно хранить в файле: без абсолютных путей
+    из MEDIA_PATH_FIELDS (они зависят от машины и вычисляются при загрузке) и без
+    неизмененных значений DEFAULT_CONFIG, которых не было в файле.
+    """
+    computed = set(MEDIA_PATH_FIELDS.values())
+    return {
+        k: v for k, v in config.items()
+        if k not in computed and not (k in DEFAULT_CONFIG and k not in file_keys and v == DEFAULT_CONFIG[k])
     }
-    
+
+
+def save_bot_config(config):
+    """Сохраняет конфигурацию в файл и сразу обновляет снимок в памяти"""
     try:
-        with open(BOT_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            loaded_config = json.load(f)
-            config.update(loaded_config)
-            logger.info(f"Конфигурация загружена: {config.keys()}")
-            
-            # Проверка и обработка путей изображений
-            if 'description_pic_url' in config and config['description_pic_url']:
-                path = config['description_pic_url']
-                logger.info(f"Найден путь изображения описания: {path}")
-                
-                # Преобразуем относительный путь в абсолютный
-                if path.startswith('/'):
-                    # Если путь начинается с /, убираем его
-                    path = path[1:]
-                
-                # Преобразуем в абсолютный путь
-                abs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
-                logger.info(f"Абсолютный путь изображения описания: {abs_path}")
-                
-                # Проверяем существование файла
-                if os.path.exists(abs_path):
-                    logger.info("Файл изображения описания существует")
-                    config['description_pic_absolute_path'] = abs_path
-                else:
-                    logger.warning(f"Файл изображения описания не существует: {abs_path}")
-            
-            if 'botpic_url' in config and config['botpic_url']:
-                path = config['botpic_url']
-                logger.info(f"Найден путь изображения бота: {path}")
-                
-                # Преобразуем относительный путь в абсолютный
-                if path.startswith('/'):
-                    # Если путь начинается с /, убираем его
-                    path = path[1:]
-                
-                # Преобразуем в абсолютный путь
-                abs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
-                logger.info(f"Абсолютный путь изображения бота: {abs_path}")
-                
-                # Проверяем существование файла
-                if os.path.exists(abs_path):
-                    logger.info("Файл изображения бота существует")
-                    config['botpic_absolute_path'] = abs_path
-                else:
-                    logger.warning(f"Файл изображения бота не существует: {abs_path}")
-                
+        config = config_to_file_data(config, config_store.get().file_keys)
+
+        with open(config_store.config_file, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+
+        config_store.reload()
+        logger.info(f"Конфигурация бота успешно сохранена в файл {config_store.config_file}")
+        return True
     except Exception as e:
-        logger.error(f"Ошибка при чтении конфигурации бота: {e}")
-    
-    return config 
\ No newline at end of file
+        logger.error(f"Ошибка при сохранении конфигурации бота: {e}")
+        return False
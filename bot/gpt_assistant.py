@@ -1,8 +1,11 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 from database.models import get_session, User, ChatHistory
 from datetime import datetime, timedelta
+from bot.assistant_history import build_history
+from bot.prompt_builder import PromptBuilder
+from bot.answer_cache import answer_cache, answer_cache_key
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -10,17 +13,24 @@ load_dotenv()
 # Инициализируем клиент OpenAI
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Загружаем промпт из файла
-def load_prompt_from_file(file_path="bot/gpt/WILLWAY_health_assistant_prompt.txt"):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except Exception as e:
-        print(f"Ошибка при чтении файла промпта: {e}")
-        return ""
+# Параметры запроса к модели
+ASSISTANT_MODEL = os.getenv("ASSISTANT_MODEL", "gpt-4o-mini")  # Можно улучшить до gpt-4o
+ASSISTANT_MAX_TOKENS = 1000
+ASSISTANT_TEMPERATURE = 0.7
+
+# Асинхронный клиент создается по требованию (используется движком bot/assistant_engine.py).
+# Адрес API берется из OPENAI_BASE_URL, что позволяет направить запросы на локальную заглушку.
+_async_client = None
 
-# Загружаем наш новый промпт
-HEALTH_SYSTEM_PROMPT = load_prompt_from_file()
+def get_async_client():
+    """Возвращает общий асинхронный клиент OpenAI"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None
+        )
+    return _async_client
 
 # Функции для работы с историей чата
 def save_message_to_history(user_id, role, content):
@@ -41,24 +51,37 @@ def save_message_to_history(user_id, role, content):
     finally:
         db_session.close()
 
-def get_chat_history(user_id, limit=10):
-    """Получает историю диалога пользователя"""
+def save_chat_turn(user_id, user_message, assistant_message, asked_at=None):
+    """
+    Сохраняет вопрос пользователя и ответ ассистента одной транзакцией
+    
+    Args:
+        user_id: ID пользователя в Telegram
+        user_message (str): Сообщение пользователя
+        assistant_message (str): Ответ ассистента
+        asked_at (datetime, optional): Время получения сообщения пользователя
+    """
+    asked_at = asked_at or datetime.now()
+    # Ответ всегда идет в журнале после вопроса
+    answered_at = max(datetime.now(), asked_at + timedelta(microseconds=1))
+    
     db_session = get_session()
     try:
-        history = db_session.query(ChatHistory)\
-            .filter(ChatHistory.user_id == user_id)\
-            .order_by(ChatHistory.timestamp.desc())\
-            .limit(limit)\
-            .all()
-        # Переворачиваем список, чтобы сообщения шли в хронологическом порядке
-        history.reverse()
-        return [{"role": msg.role, "content": msg.content} for msg in history]
+        db_session.add_all([
+            ChatHistory(user_id=user_id, role="user", content=user_message, timestamp=asked_at),
+            ChatHistory(user_id=user_id, role="assistant", content=assistant_message, timestamp=answered_at)
+        ])
+        db_session.commit()
     except Exception as e:
-        print(f"Ошибка при получении истории: {e}")
-        return []
+        print(f"Ошибка при сохранении сообщений: {e}")
+        db_session.rollback()
     finally:
         db_session.close()
 
+def get_chat_history(user_id, limit=10):
+    """Получает историю диалога пользователя (в пределах бюджета токенов)"""
+    return build_history(user_id, ChatHistory, limit=limit)
+
 def get_user_profile(user_id):
     """Получает профиль пользователя из базы данных"""
     db_session = get_session()
@@ -102,24 +125,34 @@ def format_user_profile_for_gpt(profile):
 - Частота тренировок: {profile['sport_frequency'] or 'Не указана'}
 """
 
-def get_health_assistant_response(user_id, user_message, conversation_history=None):
+# Системный промпт кэшируется по пользователям, шаблон перечитывается при изменении файла
+prompt_builder = PromptBuilder(get_user_profile, format_user_profile_for_gpt)
+
+def invalidate_user_prompt(user_id):
+    """Сбрасывает кэш системного промпта пользователя (вызывается при изменении анкеты)"""
+    prompt_builder.invalidate_user(user_id)
+
+def get_cached_answer(user_id, user_message, conversation_history=None):
     """
-    Получает ответ от GPT на запрос пользователя с сохранением истории
+    Ищет готовый ответ на типовой вопрос в кэше ответов
     
-    Args:
-        user_id (int): ID пользователя в Telegram
-        user_message (str): Сообщение пользователя
-        conversation_history (list, optional): История диалога
-        
     Returns:
-        str: Ответ от модели GPT
+        tuple: (ключ для записи ответа или None, ответ из кэша или None)
     """
-    # Получаем информацию о пользователе
-    user_profile = get_user_profile(user_id)
-    profile_text = format_user_profile_for_gpt(user_profile)
-    
-    # Формируем полный промпт с учетом информации о пользователе
-    full_prompt = f"{HEALTH_SYSTEM_PROMPT}\n\n{profile_text}"
+    if not answer_cache.enabled:
+        return None, None
+    has_history = bool(conversation_history)
+    key = answer_cache_key(user_message, prompt_builder.get_profile(user_id), has_history)
+    # Ответ, полученный с историей диалога, зависит от нее и в кэш не записывается
+    return (None if has_history else key), answer_cache.get(key)
+
+def build_assistant_messages(user_id, user_message, conversation_history=None):
+    """
+    Формирует список сообщений для API: системный промпт с профилем пользователя,
+    история диалога и текущее сообщение
+    """
+    # Полный промпт с учетом информации о пользователе
+    full_prompt = prompt_builder.get_system_prompt(user_id)
     
     # Получаем историю диалога из базы данных
     # Если история уже передана, используем ее
@@ -137,24 +170,49 @@ def get_health_assistant_response(user_id, user_message, conversation_history=No
     
     # Добавляем текущее сообщение пользователя
     messages.append({"role": "user", "content": user_message})
+    return messages
+
+def get_health_assistant_response(user_id, user_message, conversation_history=None, use_cache=True):
+    """
+    Получает ответ от GPT на запрос пользователя с сохранением истории
     
-    try:
-        # Сохраняем сообщение пользователя в историю
-        save_message_to_history(user_id, "user", user_message)
+    Args:
+        user_id (int): ID пользователя в Telegram
+        user_message (str): Сообщение пользователя
+        conversation_history (list, optional): История диалога
+        use_cache (bool): Использовать кэш ответов на типовые вопросы
         
+    Returns:
+        str: Ответ от модели GPT
+    """
+    asked_at = datetime.now()
+    
+    if conversation_history is None:
+        conversation_history = get_chat_history(user_id)
+    
+    cache_key, cached_answer = get_cached_answer(user_id, user_message, conversation_history) \
+        if use_cache else (None, None)
+    if cached_answer:
+        save_chat_turn(user_id, user_message, cached_answer, asked_at)
+        return cached_answer
+    
+    messages = build_assistant_messages(user_id, user_message, conversation_history)
+    
+    try:
         # Отправляем запрос к API OpenAI
         response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Можно улучшить до gpt-4o
+            model=ASSISTANT_MODEL,
             messages=messages,
-            max_tokens=1000,
-            temperature=0.7
+            max_tokens=ASSISTANT_MAX_TOKENS,
+            temperature=ASSISTANT_TEMPERATURE
         )
         
         # Получаем ответ
         assistant_response = response.choices[0].message.content
         
-        # Сохраняем ответ ассистента в историю
-        save_message_to_history(user_id, "assistant", assistant_response)
+        # Сохраняем вопрос и ответ в историю
+        save_chat_turn(user_id, user_message, assistant_response, asked_at)
+        answer_cache.set(cache_key, assistant_response)
         
         # Возвращаем текст ответа
         return assistant_response
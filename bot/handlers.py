@@ -28,8 +28,16 @@ TIMEZONE = pytz.timezone('Europe/Moscow')
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database.models import User, get_session, AdminUser, MessageHistory, ReferralCode, ReferralUse, ChatHistory, Payment
-from bot.gpt_assistant import get_health_assistant_response
+from database.models import User, get_session, with_session_scope, AdminUser, MessageHistory, ReferralCode, ReferralUse, ChatHistory, Payment
+from database.subscription_cache import get_subscription_status, invalidate_subscription
+from bot.gpt_assistant import get_health_assistant_response, invalidate_user_prompt, save_message_to_history as save_chat_message
+from bot.assistant_engine import ASSISTANT_STREAMING, AssistantBusyError, assistant_engine
+from bot.assistant_history import build_history
+from bot.outbound_queue import start_outbound_sender
+from bot.notification_dispatcher import schedule_notification_dispatcher
+from database.dashboard_metrics import schedule_metrics_refresh
+from bot.subscription_sweeper import schedule_subscription_sweeper
+from bot.config import BOT_CONFIG_FILE, get_bot_config, get_config, reload_bot_config, save_bot_config
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, Bot, ChatAction
 from telegram.ext import Updater, CallbackContext, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, Filters
@@ -99,8 +107,6 @@ TOKEN = os.getenv('BOT_TOKEN')
 # API интеграции отключены
 logger.info("API интеграции отключены")
 
-BOT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_config.json')
-
 def fix_image_paths(config):
     updates = {}
     
@@ -156,73 +162,6 @@ def fix_image_paths(config):
     
     return config
 
-# Получение настроек бота из конфигурационного файла
-def get_bot_config():
-    """Получает конфигурацию бота из файла"""
-    logger.info("Попытка чтения конфигурации бота")
-    # Путь к файлу конфигурации (относительно корневой директории проекта)
-    BOT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_config.json')
-    
-    logger.info(f"Путь к файлу конфигурации: {BOT_CONFIG_FILE}")
-    logger.info(f"Файл существует: {os.path.exists(BOT_CONFIG_FILE)}")
-    
-    config = {
-        "trainer_username": "telegram",
-        "manager_username": "telegram"
-    }
-    
-    try:
-        with open(BOT_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            loaded_config = json.load(f)
-            config.update(loaded_config)
-            logger.info(f"Конфигурация загружена: {config.keys()}")
-            
-            # Проверка и обработка путей изображений
-            if 'description_pic_url' in config and config['description_pic_url']:
-                path = config['description_pic_url']
-                logger.info(f"Найден путь изображения описания: {path}")
-                
-                # Преобразуем относительный путь в абсолютный
-                if path.startswith('/'):
-                    # Если путь начинается с /, убираем его
-                    path = path[1:]
-                
-                # Преобразуем в абсолютный путь
-                abs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
-                logger.info(f"Абсолютный путь изображения описания: {abs_path}")
-                
-                # Проверяем существование файла
-                if os.path.exists(abs_path):
-                    logger.info("Файл изображения описания существует")
-                    config['description_pic_absolute_path'] = abs_path
-                else:
-                    logger.warning(f"Файл изображения описания не существует: {abs_path}")
-            
-            if 'botpic_url' in config and config['botpic_url']:
-                path = config['botpic_url']
-                logger.info(f"Найден путь изображения бота: {path}")
-                
-                # Преобразуем относительный путь в абсолютный
-                if path.startswith('/'):
-                    # Если путь начинается с /, убираем его
-                    path = path[1:]
-                
-                # Преобразуем в абсолютный путь
-                abs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
-                logger.info(f"Абсолютный путь изображения бота: {abs_path}")
-                
-                # Проверяем существование файла
-                if os.path.exists(abs_path):
-                    logger.info("Файл изображения бота существует")
-                    config['botpic_absolute_path'] = abs_path
-                else:
-                    logger.warning(f"Файл изображения бота не существует: {abs_path}")
-                
-    except Exception as e:
-        logger.error(f"Ошибка при чтении конфигурации бота: {e}")
-    
-    return config
-
 # Применение конфигурации бота
 def apply_bot_config(bot, config):
     """Применяет настройки из конфигурации к боту"""
@@ -354,8 +293,8 @@ def menu_keyboard():
     ]
 
 def support_keyboard():
-    # Каждый раз читаем конфигурацию заново
-    config = get_bot_config()
+    # Конфигурация берется из снимка в памяти
+    config = get_config()
     trainer_username = config.get("trainer_username", "willway_trainer")
     manager_username = config.get("manager_username", "willway_manager")
     
@@ -419,7 +358,7 @@ def reload_config(update: Update, context: CallbackContext) -> int:
     
     # Перезагружаем конфигурацию
     logger.info(f"Пользователь {user_id} имеет права администратора, загружаем конфигурацию")
-    config = get_bot_config()
+    config = reload_bot_config().as_dict()
     logger.info(f"Загруженная конфигурация: {config}")
     
     # Применяем конфигурацию к боту
@@ -565,34 +504,22 @@ def health_assistant_button(update: Update, context: CallbackContext):
         user_conversations[user_id] = []
 
 # Функция для получения истории сообщений пользователя из базы данных
-def get_user_conversation_history(user_id, limit=10):
+def get_user_conversation_history(user_id, limit=None):
     """
     Получает историю сообщений пользователя из базы данных
     
     Args:
         user_id: ID пользователя в Telegram
-        limit: Максимальное количество сообщений для извлечения (пар вопрос-ответ)
+        limit: Максимальное количество сообщений для извлечения (пар вопрос-ответ).
+            По умолчанию - окно HISTORY_FETCH_LIMIT, от которого движок сжимает старую часть
         
     Returns:
         list: История диалога в формате для OpenAI API
     """
-    session = get_session()
-    
-    # Получаем последние сообщения пользователя, отсортированные по времени
-    messages = session.query(MessageHistory)\
-        .filter(MessageHistory.user_id == user_id)\
-        .order_by(MessageHistory.timestamp.desc())\
-        .limit(limit * 2)\
-        .all()
-    
-    # Преобразуем в формат для OpenAI API и меняем порядок на хронологический
-    conversation_history = [
-        {"role": msg.role, "content": msg.content}
-        for msg in sorted(messages, key=lambda x: x.timestamp)
-    ]
-    
-    session.close()
-    return conversation_history
+    # Окно последних сообщений в пределах бюджета токенов и краткое содержание старой части
+    if limit is None:
+        return build_history(user_id, ChatHistory)
+    return build_history(user_id, ChatHistory, limit=limit * 2)
 
 # Функция для сохранения сообщения в базе данных
 def save_message_to_history(user_id, role, content):
@@ -604,19 +531,8 @@ def save_message_to_history(user_id, role, content):
         role: Роль ('user' или 'assistant')
         content: Текст сообщения
     """
-    session = get_session()
-    
-    # Создаем новую запись в базе данных
-    message = MessageHistory(
-        user_id=user_id,
-        role=role,
-        content=content
-    )
-    
-    # Добавляем и сохраняем
-    session.add(message)
-    session.commit()
-    session.close()
+    # Единый журнал диалогов - таблица chat_history
+    save_chat_message(user_id, role, content)
 
 # Обработчик для текстовых сообщений в режиме Health ассистента
 def handle_health_assistant_message(update: Update, context: CallbackContext):
@@ -663,53 +579,60 @@ def handle_health_assistant_message(update: Update, context: CallbackContext):
     # Отправляем индикатор набора текста
     context.bot.send_chat_action(chat_id=user_id, action=ChatAction.TYPING)
     
-    try:
-        # Получаем историю диалога из базы данных
-        conversation_history = get_user_conversation_history(user_id, limit=5)
-        
-        # Получаем ответ от GPT
-        response = get_health_assistant_response(
-            user_id, 
-            user_message, 
-            conversation_history
-        )
-        
-        # Сохраняем сообщение пользователя и ответ в базе данных
-        save_message_to_history(user_id, "user", user_message)
-        save_message_to_history(user_id, "assistant", response)
-        
-        # Отправляем ответ пользователю
-        if update.callback_query:
-            update.callback_query.message.reply_text(
-                response,
-                reply_markup=ReplyKeyboardMarkup([["Назад"]], resize_keyboard=True)
-            )
+    reply_message = update.callback_query.message if update.callback_query else message
+    reply_markup = ReplyKeyboardMarkup([["Назад"]], resize_keyboard=True)
+    
+    # Сообщение, которое редактируется по мере получения ответа (потоковый режим)
+    stream_state = {'message': None, 'text': None}
+    
+    def on_partial(text):
+        if stream_state['message'] is None:
+            stream_state['message'] = reply_message.reply_text(text, reply_markup=reply_markup)
         else:
-            message.reply_text(
-                response,
-                reply_markup=ReplyKeyboardMarkup([["Назад"]], resize_keyboard=True)
-            )
-            
-        # Поддерживаем флаг активности для следующих сообщений
-        context.user_data['health_assistant_active'] = True
+            stream_state['message'].edit_text(text)
+        stream_state['text'] = text
+    
+    def on_reply(response):
+        # Вопрос и ответ уже сохранены движком ассистента в журнал диалогов
+        # Отправляем ответ пользователю (или дописываем уже отправленное сообщение)
+        if stream_state['message'] is None:
+            reply_message.reply_text(response, reply_markup=reply_markup)
+        elif stream_state['text'] != response:
+            stream_state['message'].edit_text(response)
         logger.info(f"[HEALTH] Отправлен ответ от Health ассистента пользователю {user_id}")
-    except Exception as e:
-        logger.error(f"Ошибка при обработке запроса к Health ассистенту: {e}")
+    
+    def on_error(error):
+        logger.error(f"Ошибка при обработке запроса к Health ассистенту: {error}")
         
         # Отправляем сообщение об ошибке
         error_message = "Произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте позже."
-        
-        if update.callback_query:
-            update.callback_query.message.reply_text(
-                error_message,
-                reply_markup=ReplyKeyboardMarkup([["Назад"]], resize_keyboard=True)
-            )
+        reply_message.reply_text(error_message, reply_markup=reply_markup)
+    
+    # Запрос к модели выполняется движком ассистента, поток диспетчера сразу освобождается.
+    # История читается, когда подходит очередь запроса, чтобы учесть предыдущие ответы
+    # Сообщения, отправленные подряд, объединяются движком в один запрос
+    try:
+        assistant_engine.submit(
+            user_id,
+            user_message,
+            # Окно истории совпадает с окном сжатия: все, что в него не попало, сжимается
+            history_loader=lambda: get_user_conversation_history(user_id),
+            on_reply=on_reply,
+            on_error=on_error,
+            on_partial=on_partial if ASSISTANT_STREAMING else None,
+            # Выпавшая из окна часть диалога сжимается движком после ответа
+            compact=True
+        )
+    except AssistantBusyError as e:
+        logger.warning(f"[HEALTH] Запрос пользователя {user_id} к Health ассистенту отклонен: {e.reason}")
+        if e.reason == AssistantBusyError.RATE_LIMITED:
+            busy_message = "Вы отправляете сообщения слишком часто. Подождите немного и повторите вопрос."
         else:
-            message.reply_text(
-                error_message,
-                reply_markup=ReplyKeyboardMarkup([["Назад"]], resize_keyboard=True)
-            )
-            
+            busy_message = "Health ассистент сейчас перегружен. Пожалуйста, попробуйте через минуту."
+        reply_message.reply_text(busy_message, reply_markup=reply_markup)
+    
+    # Поддерживаем флаг активности для следующих сообщений
+    context.user_data['health_assistant_active'] = True
     return
 
 # Обработчик кнопки "Назад" (не очищает историю, так как она сохраняется в базе данных)
@@ -724,6 +647,9 @@ def back_to_main_menu(update: Update, context: CallbackContext):
     if context.user_data.get('health_assistant_active'):
         context.user_data['health_assistant_active'] = False
         logger.info(f"Сброшен флаг health_assistant_active при возврате в меню для пользователя {user_id}")
+        
+        # Незавершенные запросы к ассистенту больше не нужны
+        assistant_engine.cancel_user(user_id)
     
     # Проверяем, заполнил ли пользователь анкету
     session = get_session()
@@ -887,6 +813,7 @@ def start(update: Update, context: CallbackContext) -> int:
                         user.payment_status = "completed"
                         
                         session.commit()
+                        invalidate_subscription(user_id)
                         logger.info(f"[PAYMENT_SUCCESS] Активирована подписка для пользователя {user_id}")
                         
                         # Отправляем сообщение об успешной активации подписки
@@ -1081,7 +1008,7 @@ def start(update: Update, context: CallbackContext) -> int:
         return ConversationHandler.END
 
 def send_welcome_video(update, context):
-    config = get_bot_config()
+    config = get_config()
     
     keyboard = [
         [InlineKeyboardButton("Подобрать персональную программу", callback_data="start_survey")]
@@ -1122,11 +1049,11 @@ def send_welcome_video(update, context):
         video_path = config.get('intro_video_url', '')
         
         if video_path and video_path.startswith('/'):
-            clean_path = video_path[1:]
-            abs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), clean_path)
+            # Абсолютный путь вычисляется и проверяется при загрузке конфигурации
+            abs_path = config.intro_video_path
             logger.info(f"Попытка отправки видео из: {abs_path}")
             
-            if os.path.exists(abs_path):
+            if abs_path:
                 logger.info(f"Видео файл существует, отправляем...")
                 try:
                     message = update.message.reply_video(
@@ -1146,8 +1073,9 @@ def send_welcome_video(update, context):
                         logger.info(f"Получен новый file_id для видео: {new_file_id}")
                         
                         try:
-                            config['intro_video_file_id'] = new_file_id
-                            save_bot_config(config)
+                            updated_config = config.as_dict()
+                            updated_config['intro_video_file_id'] = new_file_id
+                            save_bot_config(updated_config)
                             logger.info("File ID видео успешно сохранен в конфигурации")
                         except Exception as save_err:
                             logger.error(f"Ошибка при сохранении file_id в конфигурации: {save_err}")
@@ -1170,7 +1098,7 @@ def send_welcome_video(update, context):
                         reply_markup=reply_markup
                     )
             else:
-                logger.error(f"Файл видео не найден по пути: {abs_path}")
+                logger.error(f"Файл видео не найден по пути: {video_path}")
                 update.message.reply_text(
                     caption,
                     reply_markup=reply_markup
@@ -1320,6 +1248,7 @@ def gender(update: Update, context: CallbackContext) -> int:
         if user:
             user.gender = context.user_data['gender']
             session.commit()
+            invalidate_user_prompt(user_id)
             logger.info(f"[SURVEY_GENDER] Данные о поле пользователя {user_id} сохранены в БД")
         session.close()
     except Exception as e:
@@ -1388,6 +1317,7 @@ def age(update: Update, context: CallbackContext) -> int:
             if user:
                 user.age = user_age
                 session.commit()
+                invalidate_user_prompt(user_id)
                 logger.info(f"[SURVEY_AGE] Возраст пользователя {user_id} сохранен в БД")
             session.close()
         except Exception as e:
@@ -1466,6 +1396,7 @@ def height(update: Update, context: CallbackContext) -> int:
         if user:
             user.height = user_height
             session.commit()
+            invalidate_user_prompt(user_id)
         session.close()
         
         if 'bot_messages' in context.user_data:
@@ -1525,6 +1456,7 @@ def weight(update: Update, context: CallbackContext) -> int:
         if user:
             user.weight = user_weight
             session.commit()
+            invalidate_user_prompt(user_id)
         session.close()
         
         if 'bot_messages' in context.user_data:
@@ -1604,6 +1536,7 @@ def main_goal(update: Update, context: CallbackContext) -> int:
         if user:
             user.main_goal = selected_goals_text
             session.commit()
+            invalidate_user_prompt(user_id)
         session.close()
         
         try:
@@ -1695,6 +1628,7 @@ def additional_goal(update: Update, context: CallbackContext) -> int:
         if user:
             user.additional_goal = selected_goals_text
             session.commit()
+            invalidate_user_prompt(user_id)
         session.close()
         
         try:
@@ -1783,6 +1717,7 @@ def work_format(update: Update, context: CallbackContext) -> int:
     if user:
         user.work_format = user_work_format
         session.commit()
+        invalidate_user_prompt(user_id)
     session.close()
     
     if 'bot_messages' in context.user_data:
@@ -1841,6 +1776,7 @@ def sport_frequency(update: Update, context: CallbackContext) -> int:
         user.sport_frequency = user_sport_frequency
         user.registered = True  # Отмечаем, что основная регистрация завершена
         session.commit()
+        invalidate_user_prompt(user_id)
     session.close()
     
     is_subscribed, paid_till = check_subscription_status(user_id)
@@ -2011,7 +1947,7 @@ def handle_menu_callback(update: Update, context: CallbackContext):
                     sub_type = "месячная" if subscription_type == "monthly" else "годовая"
                     
                     # Получаем username менеджера из конфигурации
-                    config = get_bot_config()
+                    config = get_config()
                     manager_username = config.get("manager_username", "willway_manager")
                     
                     # Создаем клавиатуру для управления подпиской
@@ -2548,7 +2484,7 @@ def send_successful_payment_messages(update: Update, context: CallbackContext, s
     )
     
     # Получаем URL канала из конфигурации
-    config = get_bot_config()
+    config = get_config()
     channel_url = config.get("channel_url", "https://t.me/willway_channel")
     
     # Создаем InlineKeyboard с кнопками
@@ -2649,7 +2585,7 @@ def handle_support_messages(update, context):
 
     if text == "Связаться с тренером":
         # Получаем имя пользователя тренера из конфигурации
-        config = get_bot_config()
+        config = get_config()
         trainer_username = config.get('trainer_username', '')
         
         if trainer_username:
@@ -2665,7 +2601,7 @@ def handle_support_messages(update, context):
     
     elif text == "Связаться с менеджером":
         # Получаем имя пользователя менеджера из конфигурации
-        config = get_bot_config()
+        config = get_config()
         manager_username = config.get('manager_username', '')
         
         if manager_username:
@@ -2794,6 +2730,9 @@ def main():
             
         dispatcher = updater.dispatcher
         
+        # Один апдейт - одна сессия и одно соединение с базой данных
+        dispatcher.process_update = with_session_scope(dispatcher.process_update)
+        
         # Настраиваем цветное логирование
         setup_colored_logging()
         
@@ -2803,6 +2742,18 @@ def main():
         # Настраиваем бота в соответствии с конфигурацией
         apply_bot_config(updater.bot, config)
         
+        # Отправитель очереди исходящих сообщений (уведомления об оплате из веб-сервера)
+        start_outbound_sender(updater.bot)
+        
+        # Отложенные уведомления (pending_notifications), если диспетчер не запущен отдельно
+        schedule_notification_dispatcher(updater.job_queue)
+        
+        # Пересчет дневных метрик панели администратора
+        schedule_metrics_refresh(updater.job_queue)
+        
+        # Отключение истекших подписок и напоминания об окончании подписки
+        schedule_subscription_sweeper(updater.job_queue)
+        
         # Основной обработчик диалога
         conv_handler = ConversationHandler(
             entry_points=[
@@ -2903,15 +2854,6 @@ def main():
         
         # Блокировка до прерывания работы
         updater.idle()
-        
-        # Запускаем ежедневную проверку истекающих подписок в 10:00 утра
-        job_queue = updater.job_queue
-        job_queue.run_daily(
-            send_subscription_expiration_reminder,
-            time=time(hour=10, minute=0, second=0),
-            days=(0, 1, 2, 3, 4, 5, 6),
-            context=None
-        )
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         return
@@ -2961,18 +2903,16 @@ def update_subscription_status(user_id, context, send_welcome=False):
     Returns:
         bool: True если подписка активна, False в противном случае
     """
-    session = get_session()
-    user = session.query(User).filter(User.user_id == user_id).first()
+    status = get_subscription_status(user_id)
     
-    if not user:
-        session.close()
+    if not status:
         return False
     
     is_subscribed = False
     
-    if user.is_subscribed and user.subscription_expires:
+    if status.is_subscribed and status.subscription_expires:
         # Преобразуем в aware datetime если нужно
-        expiry_date = make_aware(user.subscription_expires)
+        expiry_date = make_aware(status.subscription_expires)
         now = datetime.now(TIMEZONE)
         
         if expiry_date > now:
@@ -2987,10 +2927,19 @@ def update_subscription_status(user_id, context, send_welcome=False):
                 ).start()
         else:
             # Подписка истекла, обновляем статус
-            user.is_subscribed = False
-            session.commit()
+            session = get_session()
+            try:
+                user = session.query(User).filter(User.user_id == str(user_id)).first()
+                if user and user.is_subscribed:
+                    user.is_subscribed = False
+                    session.commit()
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении статуса подписки пользователя {user_id}: {e}")
+                session.rollback()
+            finally:
+                session.close()
+            invalidate_subscription(user_id)
     
-    session.close()
     return is_subscribed
 
 def check_subscription_status(user_id):
@@ -2998,20 +2947,17 @@ def check_subscription_status(user_id):
     Проверяет статус подписки пользователя только в локальной базе данных.
     Airtable больше не используется.
     """
-    session = get_session()
-    user = session.query(User).filter(User.user_id == user_id).first()
+    status = get_subscription_status(user_id)
     
-    if user and user.is_subscribed and user.subscription_expires:
+    if status and status.is_subscribed and status.subscription_expires:
         # Преобразуем в aware datetime если нужно
-        expiry_date = make_aware(user.subscription_expires)
+        expiry_date = make_aware(status.subscription_expires)
         now = datetime.now(TIMEZONE)
         
         if expiry_date > now:
             paid_till = expiry_date.strftime("%Y-%m-%d")
-            session.close()
             return True, paid_till
     
-    session.close()
     return False, None
 
 # Команда для проверки статуса подписки
@@ -3129,7 +3075,7 @@ def handle_text_messages(update: Update, context: CallbackContext):
                     
                     sub_type = "месячная" if subscription_type == "monthly" else "годовая"
                     
-                    config = get_bot_config()
+                    config = get_config()
                     manager_username = config.get("manager_username", "willway_manager")
                     
                     keyboard = [
@@ -3347,7 +3293,7 @@ def send_welcome_subscription_messages(context, user_id):
             logger.error(f"[SUBSCRIPTION_WELCOME] Пользователь {user_id} не найден в базе данных")
             return
         
-        config = get_bot_config()
+        config = get_config()
         channel_url = config.get("channel_url", "https://t.me/willway_channel")
         
         welcome_text = (
@@ -3416,6 +3362,7 @@ def activate_test_subscription(update: Update, context: CallbackContext):
     expiry_date = user.subscription_expires.strftime("%d.%m.%Y")
     
     session.commit()
+    invalidate_subscription(user_id)
     logger.info(f"Активирована тестовая подписка для пользователя {user_id} до {expiry_date}")
     session.close()
     
@@ -3575,7 +3522,7 @@ def handle_support_messages(update, context):
 
     if text == "Связаться с тренером":
         # Получаем имя пользователя тренера из конфигурации
-        config = get_bot_config()
+        config = get_config()
         trainer_username = config.get('trainer_username', '')
         
         if trainer_username:
@@ -3591,7 +3538,7 @@ def handle_support_messages(update, context):
     
     elif text == "Связаться с менеджером":
         # Получаем имя пользователя менеджера из конфигурации
-        config = get_bot_config()
+        config = get_config()
         manager_username = config.get('manager_username', '')
         
         if manager_username:
@@ -3625,13 +3572,6 @@ def handle_other_messages(update, context):
         reply_markup=get_main_keyboard()
     )
 
-def send_subscription_expiration_reminder(context: CallbackContext):
-    message = (
-        "Привет! Напоминаю, что срок действия твоей подписки подходит к концу.\n\n"
-        "Для того, чтобы продолжить пользоваться всеми функциями бота, "
-        "тебе нужно продлить подписку."
-    )
-
 PAYMENT_STATUS = {
     'PENDING': 'pending',
     'PROCESSING': 'processing',
@@ -3726,19 +3666,6 @@ def get_payment_keyboard_inline(user_id):
     
     return keyboard
 
-def save_bot_config(config):
-    try:
-        BOT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_config.json')
-        
-        with open(BOT_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
-        
-        logger.info(f"Конфигурация бота успешно сохранена в файл {BOT_CONFIG_FILE}")
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении конфигурации бота: {e}")
-        return False
-
 def help_command(update: Update, context: CallbackContext):
     message = (
         "Привет! Я твой помощник в WILLWAY.\n\n"
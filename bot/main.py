@@ -15,7 +15,7 @@ import re
 # Добавляем путь к корневой директории проекта
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database.models import init_db, User, get_session
+from database.models import init_db, User, get_session, with_session_scope
 from bot.handlers import (
     start, gender, age, height, weight, main_goal, additional_goal,
     work_format, sport_frequency, payment, handle_menu_callback, cancel, clear,
@@ -190,6 +190,9 @@ def main():
     updater = Updater(token)
     dispatcher = updater.dispatcher
     
+    # Один апдейт - одна сессия и одно соединение с базой данных
+    dispatcher.process_update = with_session_scope(dispatcher.process_update)
+    
     # Создание обработчика диалога для регистрации и сбора данных
     conv_handler = ConversationHandler(
         entry_points=[
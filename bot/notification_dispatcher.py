@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Отправка отложенных уведомлений из таблицы pending_notifications
+
+Уведомления попадают в таблицу, когда их не удалось отправить сразу
+(например, send_referral_bonus_notification при недоступном боте).
+Диспетчер периодически:
+
+- забирает пачку готовых записей одним UPDATE с арендой (locked_until и
+  claim_token) - запись не достанется двум отправителям одновременно, а
+  после падения отправителя вернется в очередь по окончании аренды;
+- отправляет пачку параллельно (NOTIFICATION_WORKERS потоков);
+- при ошибке откладывает запись с экспоненциальной задержкой (retries,
+  next_attempt_at), а после NOTIFICATION_MAX_RETRIES попыток или при
+  окончательной ошибке Telegram переносит в "мертвые" (dead_lettered_at).
+
+Аренда, задержка повторов и разбор ошибок - общие с очередью исходящих
+сообщений (bot/queue_worker.py).
+
+Запуск: задачей JobQueue в процессе бота (по умолчанию) или отдельным
+процессом python -m bot.notification_dispatcher (NOTIFICATION_DISPATCHER_STANDALONE=true,
+процесс запускает run_bots.py).
+"""
+
+import os
+import json
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.queue_worker import (
+    ERROR_PERMANENT, ERROR_RETRY_AFTER, backoff_delay, classify_error, lease_free, lease_until, retry_after_delay
+)
+from database.models import PendingNotification, ReferralUse, User, Session
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_DISPATCHER_STANDALONE = os.getenv("NOTIFICATION_DISPATCHER_STANDALONE", "false").lower() in ("1", "true", "yes")
+NOTIFICATION_POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "30"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "50"))
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "4"))
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", "6"))
+NOTIFICATION_BACKOFF_BASE = float(os.getenv("NOTIFICATION_BACKOFF_BASE", "60"))
+NOTIFICATION_BACKOFF_MAX = float(os.getenv("NOTIFICATION_BACKOFF_MAX", str(6 * 60 * 60)))
+NOTIFICATION_LEASE_SECONDS = int(os.getenv("NOTIFICATION_LEASE_SECONDS", "300"))
+
+
+def render_referral_bonus(session, notification, data):
+    """Уведомление о бонусном месяце за приглашенного друга"""
+    user = session.query(User).filter(User.user_id == str(notification.user_id)).first()
+    subscription_end = user.subscription_expires.strftime("%d.%m.%Y") \
+        if user and user.subscription_expires else "неизвестно"
+    text = (
+        f"🎁 *Поздравляем!* Вы получили бонусный месяц подписки!\n\n"
+        f"Ваш друг *{data.get('referral_username', '')}* только что оплатил подписку по вашей реферальной ссылке.\n\n"
+        f"Срок действия вашей подписки был продлен на 30 дней.\n"
+        f"Текущая дата окончания подписки: *{subscription_end}*\n\n"
+        f"Продолжайте приглашать друзей и получать бонусные месяцы!"
+    )
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(text="Пригласить еще друзей", callback_data="invite_friend")],
+        [InlineKeyboardButton(text="Управление подпиской", callback_data="subscription_management")]
+    ])
+    return {"text": text, "parse_mode": "Markdown", "reply_markup": keyboard}
+
+
+def mark_referral_reward_processed(session, notification, data):
+    """После отправки бонуса отмечает последнюю оплаченную реферальную запись (как при прямой отправке)"""
+    user = session.query(User).filter(User.user_id == str(notification.user_id)).first()
+    if not user:
+        return
+    ref_use = session.query(ReferralUse)\
+        .filter_by(referrer_id=user.id, subscription_purchased=True)\
+        .order_by(ReferralUse.purchase_date.desc())\
+        .first()
+    if ref_use and not ref_use.reward_processed:
+        ref_use.reward_processed = True
+
+
+# message_type -> (функция формирования сообщения, действие после отправки или None)
+NOTIFICATION_HANDLERS = {
+    "referral_bonus": (render_referral_bonus, mark_referral_reward_processed),
+}
+
+
+def _ready(now):
+    """Условие: запись не отправлена, не в "мертвых", срок попытки наступил и аренда свободна"""
+    return and_(
+        or_(PendingNotification.sent == False, PendingNotification.sent.is_(None)),
+        PendingNotification.dead_lettered_at.is_(None),
+        or_(PendingNotification.next_attempt_at.is_(None), PendingNotification.next_attempt_at <= now),
+        lease_free(PendingNotification.locked_until, now)
+    )
+
+
+class NotificationDispatcher:
+    """
+    Отправитель отложенных уведомлений
+
+    Args:
+        bot: Экземпляр telegram.Bot
+    """
+
+    def __init__(self, bot, batch_size=NOTIFICATION_BATCH_SIZE, workers=NOTIFICATION_WORKERS,
+                 max_retries=NOTIFICATION_MAX_RETRIES, lease_seconds=NOTIFICATION_LEASE_SECONDS):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.lease_seconds = lease_seconds
+
+    def claim_batch(self):
+        """
+        Забирает пачку уведомлений одним UPDATE ... WHERE id IN (SELECT ... LIMIT n).
+        Условие готовности проверяется повторно для каждой строки, поэтому
+        параллельные отправители не получат одну и ту же запись.
+        """
+        now = datetime.now()
+        token = str(uuid.uuid4())
+        session = Session()
+        try:
+            candidates = session.query(PendingNotification.id)\
+                .filter(_ready(now))\
+                .order_by(PendingNotification.id)\
+                .limit(self.batch_size)\
+                .subquery()
+            claimed = session.query(PendingNotification)\
+                .filter(PendingNotification.id.in_(session.query(candidates.c.id)), _ready(now))\
+                .update({
+                    PendingNotification.locked_until: lease_until(now, self.lease_seconds),
+                    PendingNotification.claim_token: token
+                }, synchronize_session=False)
+            session.commit()
+            if not claimed:
+                return []
+            notifications = session.query(PendingNotification)\
+                .filter(PendingNotification.claim_token == token)\
+                .order_by(PendingNotification.id)\
+                .all()
+            session.expunge_all()
+            return notifications
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _update(self, notification_id, token, values):
+        """Сохраняет результат, только если запись все еще арендована этим отправителем"""
+        values = dict(values, locked_until=None, claim_token=None)
+        session = Session()
+        try:
+            session.query(PendingNotification)\
+                .filter(PendingNotification.id == notification_id, PendingNotification.claim_token == token)\
+                .update(values, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            logger.error(f"[NOTIFY] Ошибка при обновлении уведомления {notification_id}: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def _dead_letter(self, notification, retries, error):
+        logger.error(f"[NOTIFY] Уведомление {notification.id} ({notification.message_type}) "
+                     f"для {notification.user_id} перенесено в мертвые: {error}")
+        self._update(notification.id, notification.claim_token, {
+            "retries": retries,
+            "last_error": str(error),
+            "dead_lettered_at": datetime.now()
+        })
+        return "dead"
+
+    def process(self, notification):
+        """Формирует и отправляет одно уведомление; возвращает sent, retry или dead"""
+        handler = NOTIFICATION_HANDLERS.get(notification.message_type)
+        if handler is None:
+            return self._dead_letter(notification, notification.retries or 0,
+                                     f"Неизвестный тип уведомления: {notification.message_type}")
+        render, after_send = handler
+
+        session = Session()
+        try:
+            data = json.loads(notification.data) if notification.data else {}
+            message = render(session, notification, data)
+            self.bot.send_message(chat_id=notification.user_id, **message)
+
+            if after_send is not None:
+                try:
+                    after_send(session, notification, data)
+                    session.commit()
+                except Exception as e:
+                    logger.error(f"[NOTIFY] Ошибка после отправки уведомления {notification.id}: {e}")
+                    session.rollback()
+        except Exception as e:
+            error_kind = classify_error(e)
+            if error_kind == ERROR_RETRY_AFTER:
+                # Ограничение частоты - не ошибка уведомления, попытка не тратится
+                self._update(notification.id, notification.claim_token, {
+                    "last_error": str(e),
+                    "next_attempt_at": datetime.now() + timedelta(seconds=retry_after_delay(e))
+                })
+                return "retry"
+            retries = (notification.retries or 0) + 1
+            if error_kind == ERROR_PERMANENT:
+                # Бот заблокирован или чат не найден - повтор не поможет
+                return self._dead_letter(notification, retries, e)
+            if retries >= self.max_retries:
+                return self._dead_letter(notification, retries, e)
+            delay = backoff_delay(retries, NOTIFICATION_BACKOFF_BASE, NOTIFICATION_BACKOFF_MAX)
+            logger.warning(f"[NOTIFY] Ошибка отправки уведомления {notification.id} (попытка {retries}), "
+                           f"повтор через {delay} с: {e}")
+            self._update(notification.id, notification.claim_token, {
+                "retries": retries,
+                "last_error": str(e),
+                "next_attempt_at": datetime.now() + timedelta(seconds=delay)
+            })
+            return "retry"
+        finally:
+            session.close()
+
+        self._update(notification.id, notification.claim_token, {
+            "sent": True,
+            "sent_at": datetime.now(),
+            "last_error": None
+        })
+        return "sent"
+
+    def run_once(self):
+        """Отправляет одну пачку; возвращает счетчики результатов"""
+        notifications = self.claim_batch()
+        counts = {"sent": 0, "retry": 0, "dead": 0}
+        if not notifications:
+            return counts
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notify") as executor:
+            for result in executor.map(self.process, notifications):
+                counts[result] += 1
+        logger.info(f"[NOTIFY] Обработано уведомлений: {len(notifications)} "
+                    f"(отправлено {counts['sent']}, отложено {counts['retry']}, в мертвые {counts['dead']})")
+        return counts
+
+    def drain(self):
+        """Отправляет пачки, пока есть готовые уведомления"""
+        total = {"sent": 0, "retry": 0, "dead": 0}
+        while True:
+            counts = self.run_once()
+            for key, value in counts.items():
+                total[key] += value
+            if sum(counts.values()) < self.batch_size:
+                return total
+
+
+def dispatch_pending_notifications_job(context):
+    """Задача JobQueue: отправляет готовые отложенные уведомления"""
+    try:
+        NotificationDispatcher(context.bot).drain()
+    except Exception as e:
+        logger.error(f"[NOTIFY] Ошибка при отправке отложенных уведомлений: {e}")
+
+
+def schedule_notification_dispatcher(job_queue):
+    """Регистрирует диспетчер в JobQueue бота, если он не запущен отдельным процессом"""
+    if NOTIFICATION_DISPATCHER_STANDALONE:
+        logger.info("[NOTIFY] Диспетчер уведомлений работает отдельным процессом")
+        return None
+    return job_queue.run_repeating(
+        dispatch_pending_notifications_job,
+        interval=NOTIFICATION_POLL_INTERVAL,
+        first=10,
+        name="pending_notifications"
+    )
+
+
+def run_standalone():
+    """Отдельный процесс диспетчера"""
+    import time
+    from telegram import Bot
+    from telegram.utils.request import Request
+    from bot.config import get_bot_token
+
+    token = os.getenv("TELEGRAM_TOKEN") or get_bot_token()
+    if not token:
+        logger.error("Не указан токен бота (TELEGRAM_TOKEN или bot_config.json)")
+        return
+    request = Request(con_pool_size=NOTIFICATION_WORKERS + 1, proxy_url=os.getenv("TELEGRAM_PROXY_URL"))
+    dispatcher = NotificationDispatcher(Bot(token=token, request=request))
+    logger.info("[NOTIFY] Диспетчер отложенных уведомлений запущен")
+    while True:
+        try:
+            dispatcher.drain()
+        except Exception as e:
+            logger.error(f"[NOTIFY] Ошибка при отправке отложенных уведомлений: {e}")
+        time.sleep(NOTIFICATION_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        run_standalone()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Очередь исходящих сообщений Telegram
+
+HTTP-обработчики (вебхуки оплаты) не отправляют сообщения сами, а кладут их
+описание (текст, разметка, parse_mode) в таблицу outbound_messages и сразу
+отвечают. Отправитель OutboundSender в процессе бота забирает сообщения
+пачками и отправляет их с повторами и экспоненциальной задержкой, поэтому
+время ответа вебхука не зависит от Telegram.
+
+- Ключ идемпотентности: повторный вебхук с тем же ключом не ставит сообщение
+  в очередь второй раз.
+- Сообщения одного чата отправляются строго в порядке постановки: следующее
+  ждет, пока предыдущее не будет отправлено или не завершится с ошибкой.
+- Запись забирается с арендой (locked_until): если отправитель упал, после
+  окончания аренды сообщение заберет следующий. Сообщение, отправленное
+  прямо перед падением, может уйти повторно (доставка "хотя бы один раз").
+- Отправка идет не быстрее OUTBOUND_RATE сообщений в секунду (RateLimiter
+  из bot/rate_limit.py, как у рассылок), ответ 429 приостанавливает все
+  отправки, поэтому массовые напоминания не упираются в лимиты Telegram.
+
+Аренда, задержка повторов и разбор ошибок Telegram общие с отложенными
+уведомлениями (bot/queue_worker.py).
+
+Отдельный запуск отправителя: python -m bot.outbound_queue
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, exists
+from sqlalchemy.orm import aliased
+from telegram import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
+
+from bot.queue_worker import (
+    ERROR_CHAT_MIGRATED, ERROR_PERMANENT, ERROR_RETRY_AFTER,
+    backoff_delay, classify_error, lease_free, lease_until, retry_after_delay
+)
+from database.models import OutboundMessage, Session, get_session
+from bot.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_BATCH_SIZE = int(os.getenv("OUTBOUND_BATCH_SIZE", "20"))
+OUTBOUND_POLL_INTERVAL = float(os.getenv("OUTBOUND_POLL_INTERVAL", "2"))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "8"))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "5"))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", "900"))
+OUTBOUND_LEASE_SECONDS = int(os.getenv("OUTBOUND_LEASE_SECONDS", "120"))
+# Ограничение частоты отправки: сообщений в секунду на бота, запас и интервал в один чат
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "25"))
+OUTBOUND_BURST = float(os.getenv("OUTBOUND_BURST", "5"))
+OUTBOUND_CHAT_INTERVAL = float(os.getenv("OUTBOUND_CHAT_INTERVAL", "0"))
+# Сколько дней хранить отправленные и неотправленные сообщения
+OUTBOUND_RETENTION_DAYS = int(os.getenv("OUTBOUND_RETENTION_DAYS", "14"))
+OUTBOUND_PURGE_INTERVAL = 60 * 60
+
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_SENDING)
+
+# Отправитель текущего процесса: enqueue будит его без ожидания опроса
+_sender = None
+
+
+def markup_to_dict(markup):
+    """Разметка клавиатуры в виде словаря Bot API"""
+    if markup is None:
+        return None
+    return markup.to_dict() if hasattr(markup, 'to_dict') else markup
+
+
+def markup_from_dict(data):
+    """Восстанавливает объект разметки из словаря Bot API"""
+    if not data:
+        return None
+    if 'inline_keyboard' in data:
+        return InlineKeyboardMarkup.de_json(data, None)
+    if 'keyboard' in data:
+        options = {key: value for key, value in data.items() if key != 'keyboard'}
+        keyboard = [
+            [KeyboardButton(**button) if isinstance(button, dict) else button for button in row]
+            for row in data['keyboard']
+        ]
+        return ReplyKeyboardMarkup(keyboard, **options)
+    if data.get('remove_keyboard'):
+        return ReplyKeyboardRemove(selective=data.get('selective', False))
+    return None
+
+
+def build_message(chat_id, text, reply_markup=None, parse_mode=None,
+                  disable_web_page_preview=None, idempotency_key=None):
+    """Описание сообщения для enqueue_messages"""
+    return {
+        'chat_id': chat_id,
+        'text': text,
+        'reply_markup': reply_markup,
+        'parse_mode': parse_mode,
+        'disable_web_page_preview': disable_web_page_preview,
+        'idempotency_key': idempotency_key
+    }
+
+
+def enqueue_messages(messages):
+    """
+    Ставит сообщения в очередь одной транзакцией
+
+    Args:
+        messages (list): Описания сообщений из build_message (в порядке отправки)
+
+    Returns:
+        int: Количество новых сообщений (дубликаты по ключу идемпотентности пропускаются)
+    """
+    keys = [message['idempotency_key'] for message in messages if message.get('idempotency_key')]
+    session = get_session()
+    try:
+        existing = set()
+        if keys:
+            existing = {
+                row.idempotency_key for row in session.query(OutboundMessage.idempotency_key)
+                .filter(OutboundMessage.idempotency_key.in_(keys))
+            }
+
+        added = 0
+        for message in messages:
+            key = message.get('idempotency_key')
+            if key and key in existing:
+                logger.info(f"[OUTBOUND] Сообщение {key} уже в очереди, пропускаем")
+                continue
+            payload = {'text': message['text']}
+            if message.get('parse_mode'):
+                payload['parse_mode'] = message['parse_mode']
+            if message.get('reply_markup') is not None:
+                payload['reply_markup'] = markup_to_dict(message['reply_markup'])
+            if message.get('disable_web_page_preview') is not None:
+                payload['disable_web_page_preview'] = message['disable_web_page_preview']
+            session.add(OutboundMessage(
+                chat_id=message['chat_id'],
+                payload=json.dumps(payload, ensure_ascii=False),
+                idempotency_key=key,
+                status=STATUS_PENDING,
+                attempts=0,
+                next_attempt_at=datetime.now()
+            ))
+            added += 1
+        session.commit()
+    except Exception as e:
+        logger.error(f"[OUTBOUND] Ошибка при постановке сообщений в очередь: {e}")
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    if added and _sender is not None:
+        _sender.wake()
+    return added
+
+
+def enqueue_message(chat_id, text, reply_markup=None, parse_mode=None,
+                    disable_web_page_preview=None, idempotency_key=None):
+    """Ставит одно сообщение в очередь; возвращает True, если оно добавлено"""
+    return enqueue_messages([build_message(
+        chat_id, text, reply_markup, parse_mode, disable_web_page_preview, idempotency_key
+    )]) == 1
+
+
+def _claimable(model, now):
+    """Условие: сообщение готово к отправке и перед ним нет неотправленных сообщений того же чата"""
+    earlier = aliased(OutboundMessage)
+    blocked = exists().where(and_(
+        earlier.chat_id == model.chat_id,
+        earlier.id < model.id,
+        earlier.status.in_(ACTIVE_STATUSES)
+    ))
+    return and_(
+        or_(
+            and_(model.status == STATUS_PENDING, model.next_attempt_at <= now, lease_free(model.locked_until, now)),
+            and_(model.status == STATUS_SENDING, model.locked_until < now)
+        ),
+        ~blocked
+    )
+
+
+def purge_old_messages(days=OUTBOUND_RETENTION_DAYS):
+    """Удаляет отправленные и окончательно неотправленные сообщения старше days дней"""
+    session = Session()
+    try:
+        deleted = session.query(OutboundMessage)\
+            .filter(OutboundMessage.status.in_((STATUS_SENT, STATUS_FAILED)),
+                    OutboundMessage.created_at < datetime.now() - timedelta(days=days))\
+            .delete(synchronize_session=False)
+        session.commit()
+        if deleted:
+            logger.info(f"[OUTBOUND] Удалено {deleted} старых сообщений очереди")
+        return deleted
+    except Exception as e:
+        logger.error(f"[OUTBOUND] Ошибка при очистке очереди: {e}")
+        session.rollback()
+        return 0
+    finally:
+        session.close()
+
+
+def get_outbound_queue_stats():
+    """Количество сообщений очереди по статусам"""
+    from sqlalchemy import func
+    session = get_session()
+    try:
+        rows = session.query(OutboundMessage.status, func.count(OutboundMessage.id))\
+            .group_by(OutboundMessage.status).all()
+        return {status: count for status, count in rows}
+    except Exception as e:
+        logger.error(f"[OUTBOUND] Ошибка при получении статистики очереди: {e}")
+        return {}
+    finally:
+        session.close()
+
+
+class OutboundSender:
+    """
+    Фоновый отправитель очереди исходящих сообщений
+
+    Args:
+        bot: Экземпляр telegram.Bot (в процессе бота - updater.bot)
+    """
+
+    def __init__(self, bot, batch_size=OUTBOUND_BATCH_SIZE, poll_interval=OUTBOUND_POLL_INTERVAL,
+                 max_attempts=OUTBOUND_MAX_ATTEMPTS, lease_seconds=OUTBOUND_LEASE_SECONDS, rate_limiter=None):
+        self.bot = bot
+        self.rate_limiter = rate_limiter or RateLimiter(
+            rate=OUTBOUND_RATE, burst=OUTBOUND_BURST, chat_interval=OUTBOUND_CHAT_INTERVAL
+        )
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._next_purge = datetime.now()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="outbound-sender", daemon=True)
+        self._thread.start()
+        logger.info("[OUTBOUND] Отправитель очереди сообщений запущен")
+        return self
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.run_once()
+                if datetime.now() >= self._next_purge:
+                    self._next_purge = datetime.now() + timedelta(seconds=OUTBOUND_PURGE_INTERVAL)
+                    purge_old_messages()
+            except Exception as e:
+                logger.error(f"[OUTBOUND] Ошибка в цикле отправителя: {e}")
+                processed = 0
+            # Полная пачка - вероятно, есть еще сообщения, забираем сразу
+            if processed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def claim_batch(self):
+        """Забирает пачку сообщений в аренду; возвращает их в порядке постановки"""
+        now = datetime.now()
+        session = Session()
+        try:
+            candidate_ids = [
+                row.id for row in session.query(OutboundMessage.id)
+                .filter(_claimable(OutboundMessage, now))
+                .order_by(OutboundMessage.id)
+                .limit(self.batch_size)
+            ]
+            claimed = []
+            lease = lease_until(now, self.lease_seconds)
+            for message_id in candidate_ids:
+                # Условное обновление: запись достается только одному отправителю
+                updated = session.query(OutboundMessage)\
+                    .filter(OutboundMessage.id == message_id, _claimable(OutboundMessage, now))\
+                    .update({OutboundMessage.status: STATUS_SENDING, OutboundMessage.locked_until: lease},
+                            synchronize_session=False)
+                if updated:
+                    claimed.append(message_id)
+            session.commit()
+            if not claimed:
+                return []
+            messages = session.query(OutboundMessage)\
+                .filter(OutboundMessage.id.in_(claimed))\
+                .order_by(OutboundMessage.id).all()
+            session.expunge_all()
+            return messages
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def deliver(self, message):
+        """Отправляет одно сообщение; исключения Telegram пробрасываются"""
+        payload = json.loads(message.payload)
+        kwargs = {'chat_id': message.chat_id, 'text': payload['text']}
+        if payload.get('parse_mode'):
+            kwargs['parse_mode'] = payload['parse_mode']
+        if payload.get('reply_markup'):
+            kwargs['reply_markup'] = markup_from_dict(payload['reply_markup'])
+        if 'disable_web_page_preview' in payload:
+            kwargs['disable_web_page_preview'] = payload['disable_web_page_preview']
+        return self.bot.send_message(**kwargs)
+
+    def _finish(self, message_id, **values):
+        session = Session()
+        try:
+            session.query(OutboundMessage)\
+                .filter(OutboundMessage.id == message_id)\
+                .update(values, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            logger.error(f"[OUTBOUND] Ошибка при обновлении сообщения {message_id}: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def _release(self, message_ids):
+        """Возвращает сообщения в очередь без траты попытки"""
+        if not message_ids:
+            return
+        session = Session()
+        try:
+            session.query(OutboundMessage)\
+                .filter(OutboundMessage.id.in_(message_ids), OutboundMessage.status == STATUS_SENDING)\
+                .update({OutboundMessage.status: STATUS_PENDING, OutboundMessage.locked_until: None},
+                        synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            logger.error(f"[OUTBOUND] Ошибка при возврате сообщений в очередь: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def process(self, message):
+        """
+        Отправляет сообщение и сохраняет результат
+
+        Returns:
+            bool: True, если сообщение отправлено или окончательно отклонено
+                  (следующие сообщения чата можно отправлять)
+        """
+        attempts = (message.attempts or 0) + 1
+        try:
+            self.rate_limiter.acquire(message.chat_id)
+            self.deliver(message)
+        except Exception as e:
+            error_kind = classify_error(e)
+            if error_kind == ERROR_CHAT_MIGRATED:
+                self._finish(message.id, chat_id=e.new_chat_id, status=STATUS_PENDING, locked_until=None,
+                             last_error=str(e))
+                return False
+            if error_kind == ERROR_RETRY_AFTER:
+                delay = retry_after_delay(e)
+                logger.warning(f"[OUTBOUND] Ограничение Telegram для чата {message.chat_id}, повтор через {delay} с")
+                self.rate_limiter.pause(delay)
+                # Ограничение частоты не считается неудачной попыткой
+                self._finish(message.id, status=STATUS_PENDING, locked_until=None, last_error=str(e),
+                             next_attempt_at=datetime.now() + timedelta(seconds=delay))
+                self.retried += 1
+                return False
+            if error_kind == ERROR_PERMANENT:
+                # Бот заблокирован, чат не найден, неверная разметка - повтор не поможет
+                logger.error(f"[OUTBOUND] Сообщение {message.id} для чата {message.chat_id} отклонено: {e}")
+                self._finish(message.id, status=STATUS_FAILED, attempts=attempts, locked_until=None,
+                             last_error=str(e))
+                self.failed += 1
+                return True
+            if attempts >= self.max_attempts:
+                logger.error(f"[OUTBOUND] Сообщение {message.id} для чата {message.chat_id} не отправлено "
+                             f"после {attempts} попыток: {e}")
+                self._finish(message.id, status=STATUS_FAILED, attempts=attempts, locked_until=None,
+                             last_error=str(e))
+                self.failed += 1
+                return True
+            delay = backoff_delay(attempts, OUTBOUND_BACKOFF_BASE, OUTBOUND_BACKOFF_MAX)
+            logger.warning(f"[OUTBOUND] Ошибка отправки сообщения {message.id} (попытка {attempts}), "
+                           f"повтор через {delay} с: {e}")
+            self._finish(message.id, status=STATUS_PENDING, attempts=attempts, locked_until=None, last_error=str(e),
+                         next_attempt_at=datetime.now() + timedelta(seconds=delay))
+            self.retried += 1
+            return False
+
+        self._finish(message.id, status=STATUS_SENT, attempts=attempts, locked_until=None,
+                     last_error=None, sent_at=datetime.now())
+        self.sent += 1
+        return True
+
+    def run_once(self):
+        """Отправляет одну пачку сообщений; возвращает размер пачки"""
+        messages = self.claim_batch()
+        blocked_chats = set()
+        skipped = []
+        for message in messages:
+            if self._stopped.is_set() or message.chat_id in blocked_chats:
+                skipped.append(message.id)
+                continue
+            if not self.process(message):
+                # Остальные сообщения чата ждут повтора этого, чтобы не нарушить порядок
+                blocked_chats.add(message.chat_id)
+        self._release(skipped)
+        return len(messages)
+
+    def stats(self):
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried
+        }
+
+
+def start_outbound_sender(bot):
+    """Запускает отправитель очереди в текущем процессе (один на процесс)"""
+    global _sender
+    if _sender is None:
+        _sender = OutboundSender(bot)
+    return _sender.start()
+
+
+def stop_outbound_sender():
+    if _sender is not None:
+        _sender.stop()
+
+
+if __name__ == "__main__":
+    import time
+    from telegram import Bot
+    from bot.config import get_bot_token
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    token = os.getenv("TELEGRAM_TOKEN") or get_bot_token()
+    if not token:
+        logger.error("Не указан токен бота (TELEGRAM_TOKEN или bot_config.json)")
+        raise SystemExit(1)
+    start_outbound_sender(Bot(token=token))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_outbound_sender()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сборка системного промпта Health ассистента
+
+Системный промпт = шаблон из файла + профиль пользователя из анкеты. Готовый
+текст кэшируется для каждого пользователя, поэтому профиль не читается из базы
+на каждое сообщение. Кэш пользователя сбрасывается обработчиками анкеты при
+изменении профиля, а весь кэш - при изменении файла шаблона (файл
+перечитывается без перезапуска бота по времени модификации).
+
+Админ-панель работает в отдельном процессе, поэтому ее правки профиля
+попадают в промпт не позже чем через PROMPT_CACHE_TTL секунд.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from bot.config import PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE_FILE = os.getenv(
+    "HEALTH_PROMPT_FILE",
+    os.path.join(PROJECT_ROOT, "bot", "gpt", "WILLWAY_health_assistant_prompt.txt")
+)
+# Как часто проверять mtime файла шаблона (в секундах)
+PROMPT_TEMPLATE_CHECK_INTERVAL = float(os.getenv("PROMPT_TEMPLATE_CHECK_INTERVAL", "5"))
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "5000"))
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "600"))
+
+
+def read_prompt_template(file_path=PROMPT_TEMPLATE_FILE):
+    """Читает шаблон промпта из файла"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read()
+    except Exception as e:
+        logger.error(f"Ошибка при чтении файла промпта {file_path}: {e}")
+        return ""
+
+
+class PromptBuilder:
+    """
+    Кэш отрисованных системных промптов по пользователям.
+
+    Args:
+        profile_loader: Функция user_id -> профиль пользователя
+        profile_formatter: Функция профиль -> текст для промпта
+    """
+
+    def __init__(self, profile_loader, profile_formatter, template_file=PROMPT_TEMPLATE_FILE,
+                 check_interval=PROMPT_TEMPLATE_CHECK_INTERVAL, maxsize=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL):
+        self.profile_loader = profile_loader
+        self.profile_formatter = profile_formatter
+        self.template_file = template_file
+        self.check_interval = check_interval
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._template = None
+        self._template_mtime = None
+        self._next_check = 0.0
+        self._prompts = OrderedDict()
+        # Увеличивается при каждом сбросе, чтобы не сохранить промпт по устаревшему профилю
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.template_file).st_mtime
+        except OSError:
+            return None
+
+    def get_template(self):
+        """Текущий шаблон; при изменении файла перечитывает его и сбрасывает кэш промптов"""
+        now = monotonic()
+        if self._template is not None and now < self._next_check:
+            return self._template
+
+        with self._lock:
+            if self._template is not None and now < self._next_check:
+                return self._template
+            self._next_check = now + self.check_interval
+            mtime = self._file_mtime()
+            if self._template is None or mtime != self._template_mtime:
+                if self._template is not None:
+                    logger.info(f"Обнаружено изменение шаблона промпта {self.template_file}, перечитываем")
+                self._template = read_prompt_template(self.template_file)
+                self._template_mtime = mtime
+                self._prompts.clear()
+                self._version += 1
+            return self._template
+
+    def _get_entry(self, user_id):
+        """(промпт, профиль) пользователя из кэша или с чтением профиля из базы"""
+        template = self.get_template()
+        key = str(user_id)
+
+        with self._lock:
+            entry = self._prompts.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self._prompts.move_to_end(key)
+                return entry[1], entry[2]
+            version = self._version
+
+        profile = self.profile_loader(user_id)
+        prompt = f"{template}\n\n{self.profile_formatter(profile)}"
+
+        with self._lock:
+            # Шаблон или профиль могли измениться, пока читался профиль
+            if version == self._version:
+                self._prompts[key] = (monotonic() + self.ttl, prompt, profile)
+                self._prompts.move_to_end(key)
+                while len(self._prompts) > self.maxsize:
+                    self._prompts.popitem(last=False)
+        return prompt, profile
+
+    def get_system_prompt(self, user_id):
+        """Системный промпт с профилем пользователя (из кэша, если профиль не менялся)"""
+        return self._get_entry(user_id)[0]
+
+    def get_profile(self, user_id):
+        """Профиль пользователя, использованный для промпта (может быть None)"""
+        return self._get_entry(user_id)[1]
+
+    def invalidate_user(self, user_id):
+        """Сбрасывает промпт пользователя после изменения его профиля"""
+        with self._lock:
+            self._prompts.pop(str(user_id), None)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._prompts.clear()
+            self._version += 1
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Общие части очередей отправки сообщений
+
+Очередь исходящих сообщений (bot/outbound_queue.py) и отложенные
+уведомления (bot/notification_dispatcher.py) одинаково забирают записи
+в аренду (locked_until), повторяют неудачные отправки с экспоненциальной
+задержкой и разбирают ошибки Telegram. Эти правила собраны здесь, чтобы
+обе очереди вели себя одинаково.
+"""
+
+from datetime import timedelta
+
+from sqlalchemy import or_
+from telegram.error import RetryAfter, Unauthorized, BadRequest, ChatMigrated
+
+# Виды ошибок отправки (classify_error)
+ERROR_RETRY_AFTER = 'retry_after'      # 429: подождать retry_after, попытка не тратится
+ERROR_CHAT_MIGRATED = 'chat_migrated'  # группа стала супергруппой, у чата новый id
+ERROR_PERMANENT = 'permanent'          # бот заблокирован, чат не найден, неверный запрос - повтор не поможет
+ERROR_TRANSIENT = 'transient'          # сеть, таймаут, ошибка Telegram - повторить позже
+
+
+def classify_error(error):
+    """Вид ошибки отправки Telegram"""
+    if isinstance(error, ChatMigrated):
+        return ERROR_CHAT_MIGRATED
+    if isinstance(error, RetryAfter):
+        return ERROR_RETRY_AFTER
+    if isinstance(error, (Unauthorized, BadRequest)):
+        return ERROR_PERMANENT
+    return ERROR_TRANSIENT
+
+
+def retry_after_delay(error):
+    """Сколько ждать после ответа 429 (с запасом в секунду)"""
+    return float(error.retry_after) + 1
+
+
+def backoff_delay(attempts, base, maximum):
+    """Задержка перед следующей попыткой: base * 2^(attempts - 1), не больше maximum"""
+    return min(base * (2 ** max(attempts - 1, 0)), maximum)
+
+
+def lease_until(now, seconds):
+    """Срок аренды записи отправителем"""
+    return now + timedelta(seconds=seconds)
+
+
+def lease_free(locked_until, now):
+    """Условие: запись никем не арендована или аренда истекла (отправитель упал)"""
+    return or_(locked_until.is_(None), locked_until < now)
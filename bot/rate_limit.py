@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ограничение частоты отправки сообщений Telegram
+
+Общий для рассылок админ-панели (web_admin/broadcast.py) и очереди
+исходящих сообщений бота (bot/outbound_queue.py): Telegram принимает
+около 30 сообщений в секунду от бота и не больше одного сообщения
+в секунду в один чат, а при превышении отвечает 429 с retry_after.
+"""
+
+import time
+import threading
+from time import monotonic
+
+
+class RateLimiter:
+    """
+    Ограничитель отправки: ведро токенов на бота и минимальный
+    интервал между сообщениями в один чат. Потокобезопасен.
+    """
+
+    def __init__(self, rate, burst, chat_interval):
+        self.rate = rate
+        self.capacity = max(burst, 1.0)
+        self.chat_interval = chat_interval
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._chat_last = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Приостанавливает все отправки (ответ 429 от Telegram)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    def _prune(self, now):
+        if len(self._chat_last) > 10000:
+            self._chat_last = {
+                chat_id: sent_at for chat_id, sent_at in self._chat_last.items()
+                if now - sent_at < self.chat_interval
+            }
+
+    def acquire(self, chat_id):
+        """Блокирует поток, пока отправка в chat_id не станет разрешена"""
+        while True:
+            with self._lock:
+                now = monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    chat_wait = self._chat_last.get(chat_id, now - self.chat_interval) + self.chat_interval - now
+                    if chat_wait > 0:
+                        wait = chat_wait
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        self._chat_last[chat_id] = now
+                        self._prune(now)
+                        return
+                    else:
+                        wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
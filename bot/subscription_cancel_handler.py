@@ -14,8 +14,9 @@ import json
 
 # Импорт моделей базы данных
 from database.models import User, get_session
+from database.subscription_cache import invalidate_subscription
 # Импорт функции для получения конфигурации
-from bot.config import get_bot_config
+from bot.config import get_config
 
 # Настройка логирования
 logging.basicConfig(
@@ -216,7 +217,7 @@ def collect_second_reason(update: Update, context: CallbackContext):
 Отменить действие будет невозможно."""
     
     # Получаем URL для отмены подписки
-    config = get_bot_config()
+    config = get_config()
     cancel_url = f"{config['cancel_subscription_url']}?user_id={user_id}"
     
     # Создаем клавиатуру с кнопкой отмены (ссылка) и кнопкой возврата в меню
@@ -265,7 +266,7 @@ def confirm_cancellation(update: Update, context: CallbackContext):
         logger.error(f"[ERROR] Ошибка при сохранении причин отмены для пользователя {user_id}: {str(e)}")
     
     # Отправляем пользователя на страницу подтверждения отмены
-    config = get_bot_config()
+    config = get_config()
     cancel_url = f"{config['cancel_subscription_url']}?user_id={user_id}"
     
     logger.info(f"[DEBUG] URL отмены подписки для пользователя {user_id}: {cancel_url}")
@@ -403,6 +404,7 @@ def process_subscription_webhook(data, bot=None, task_id=None):
             # Сохраняем метаданные
             user.metadata = json.dumps(metadata)
             session.commit()
+            invalidate_subscription(user_id)
             
             logger.info(f"Установлен флаг отмены подписки для пользователя {user_id}")
             
@@ -630,7 +632,7 @@ def route_cancellation_message(update: Update, context: CallbackContext):
                 logger.error(f"[ERROR] Ошибка при сохранении дополнительного комментария: {e}")
         
         # Получаем URL для отмены
-        config = get_bot_config()
+        config = get_config()
         cancel_url = f"{config['cancel_subscription_url']}?user_id={user_id}"
         
         message = """❗️ Подписка пока НЕ отменена❗️
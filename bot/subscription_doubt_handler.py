@@ -11,28 +11,12 @@ from telegram.ext import CallbackContext, CallbackQueryHandler, ConversationHand
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from database.models import User, get_session
+from bot.config import get_config
 
 # Настраиваем логгер для этого модуля
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Определяем функцию get_bot_config
-def get_bot_config():
-    """Возвращает конфигурацию бота из файла bot_config.json"""
-    try:
-        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_config.json')
-        
-        if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            return config
-        else:
-            logger.warning(f"Файл конфигурации не найден: {config_path}")
-            return {'reviews_channel_url': 'https://willway.pro/feedback'}
-    except Exception as e:
-        logger.error(f"Ошибка при чтении конфигурации: {e}")
-        return {'reviews_channel_url': 'https://willway.pro/feedback'}
-
 # Создаем класс для генерации ссылок на оплату
 class PaymentHelper:
     @staticmethod
@@ -68,7 +52,7 @@ def get_subscription_keyboard(user_id=None):
         [InlineKeyboardButton("1 год | 13.333 руб (- 30%) + тренер", url=payment_url)],
     ]
     
-    config = get_bot_config()
+    config = get_config()
     reviews_url = config.get('reviews_channel_url', 'https://willway.pro/feedback')
     
     keyboard.extend([
@@ -199,7 +183,7 @@ def handle_result_doubt(update: Update, context: CallbackContext):
                    "А мы поможем пройти это")
     
     # Получаем URL канала отзывов из конфигурации
-    config = get_bot_config()
+    config = get_config()
     reviews_url = config.get('reviews_channel_url', 'https://willway.pro/feedback')
     
     # Форматируем текст, добавляя URL канала отзывов
@@ -274,7 +258,7 @@ def handle_expensive_no(update: Update, context: CallbackContext):
             "напишешь в поддержку и мы вернем деньги")
     
     # Получаем URL канала отзывов из конфигурации
-    config = get_bot_config()
+    config = get_config()
     reviews_url = config.get('reviews_channel_url', 'https://willway.pro/feedback')
     
     # Форматируем текст, добавляя URL канала отзывов
@@ -410,7 +394,7 @@ def handle_final_no(update: Update, context: CallbackContext):
     logger.info(f"[FINAL_NO] Отправлено сообщение с финальным текстом пользователю {user_id}")
     
     # Отправляем уведомление админам о том, что пользователь отказался
-    config = get_bot_config()
+    config = get_config()
     manager_username = config.get('manager_username', 'telegram')
     
     # Формируем сообщение для администратора
@@ -478,7 +462,7 @@ def handle_user_feedback(update: Update, context: CallbackContext):
             logger.info(f"[FEEDBACK_HANDLER] Отправлено сообщение благодарности пользователю {user_id}")
             
             # Отправляем уведомление администратору
-            config = get_bot_config()
+            config = get_config()
             manager_username = config.get('manager_username', 'telegram')
             
             admin_message = (
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Периодическая проверка подписок: отключение истекших и напоминания
+
+Раньше истекшая подписка отключалась только в update_subscription_status,
+когда пользователь писал боту, а напоминание об окончании подписки не
+отправлялось вовсе. Задача JobQueue раз в SUBSCRIPTION_SWEEP_INTERVAL секунд:
+
+- отключает истекшие подписки пачками по SUBSCRIPTION_SWEEP_CHUNK_SIZE:
+  выбирает id по индексу (is_subscribed, subscription_expires) и снимает
+  флаг одним UPDATE на пачку, затем сбрасывает кэш подписок;
+- для каждого срока из SUBSCRIPTION_REMINDER_DAYS (по умолчанию 3 и 1 день)
+  проходит пользователей, чья подписка заканчивается в этот день, keyset-
+  пагинацией по (subscription_expires, id) и ставит напоминания в очередь
+  исходящих сообщений (bot/outbound_queue.py) - отправитель очереди
+  соблюдает ограничения частоты Telegram. Ключ идемпотентности включает
+  дату окончания, поэтому повторные проходы не дублируют напоминание,
+  а после продления пользователь получит новое;
+- после каждой пачки сохраняет этап, курсор и счетчики в subscription_sweeps.
+
+Одновременно выполняется только один проход: новый не начнется, пока
+предыдущий обновлял прогресс меньше SUBSCRIPTION_SWEEP_LEASE_SECONDS назад.
+
+Разовый запуск: python -m bot.subscription_sweeper
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from bot.outbound_queue import build_message, enqueue_messages
+from database.models import Session, SubscriptionSweep, User
+from database.subscription_cache import invalidate_subscription
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_SWEEP_INTERVAL = int(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL", "3600"))
+SUBSCRIPTION_SWEEP_CHUNK_SIZE = int(os.getenv("SUBSCRIPTION_SWEEP_CHUNK_SIZE", "500"))
+SUBSCRIPTION_SWEEP_LEASE_SECONDS = int(os.getenv("SUBSCRIPTION_SWEEP_LEASE_SECONDS", "900"))
+# За сколько дней до окончания подписки отправляются напоминания
+SUBSCRIPTION_REMINDER_DAYS = tuple(
+    int(days) for days in os.getenv("SUBSCRIPTION_REMINDER_DAYS", "3,1").split(",") if days.strip()
+)
+
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+PHASE_EXPIRE = 'expire'
+
+
+def _days_word(days):
+    if days % 10 == 1 and days % 100 != 11:
+        return "день"
+    if days % 10 in (2, 3, 4) and days % 100 not in (12, 13, 14):
+        return "дня"
+    return "дней"
+
+
+def reminder_text(days, expires):
+    """Текст напоминания об окончании подписки"""
+    return (
+        f"Привет! Напоминаю, что срок действия твоей подписки заканчивается через {days} {_days_word(days)} "
+        f"({expires.strftime('%d.%m.%Y')}).\n\n"
+        "Для того, чтобы продолжить пользоваться всеми функциями бота, "
+        "тебе нужно продлить подписку."
+    )
+
+
+def _start_sweep(now):
+    """Создает запись прохода; возвращает ее id или None, если проход уже выполняется"""
+    session = Session()
+    try:
+        running = session.query(SubscriptionSweep).filter(SubscriptionSweep.status == STATUS_RUNNING).all()
+        for sweep in running:
+            if sweep.updated_at and sweep.updated_at > now - timedelta(seconds=SUBSCRIPTION_SWEEP_LEASE_SECONDS):
+                logger.info(f"[SWEEP] Проход {sweep.id} еще выполняется, пропускаем")
+                return None
+            # Процесс упал посреди прохода: повторный проход безопасен (UPDATE и ключи идемпотентности)
+            sweep.status = STATUS_FAILED
+            sweep.finished_at = now
+            sweep.last_error = "Проход прерван"
+        sweep = SubscriptionSweep(status=STATUS_RUNNING, started_at=now, updated_at=now,
+                                  deactivated=0, reminders=0)
+        session.add(sweep)
+        session.commit()
+        return sweep.id
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _save_progress(session, sweep_id, deactivated=0, reminders=0, **values):
+    """Обновляет прогресс прохода в текущей транзакции"""
+    values[SubscriptionSweep.updated_at] = datetime.now()
+    if deactivated:
+        values[SubscriptionSweep.deactivated] = SubscriptionSweep.deactivated + deactivated
+    if reminders:
+        values[SubscriptionSweep.reminders] = SubscriptionSweep.reminders + reminders
+    session.query(SubscriptionSweep).filter(SubscriptionSweep.id == sweep_id)\
+        .update(values, synchronize_session=False)
+
+
+def deactivate_expired(sweep_id, now, chunk_size=SUBSCRIPTION_SWEEP_CHUNK_SIZE):
+    """Снимает is_subscribed у истекших подписок пачками; возвращает количество отключенных"""
+    total = 0
+    while True:
+        session = Session()
+        try:
+            rows = session.query(User.id, User.user_id).filter(
+                User.is_subscribed == True, User.subscription_expires <= now
+            ).order_by(User.subscription_expires, User.id).limit(chunk_size).all()
+            updated = 0
+            if rows:
+                updated = session.query(User).filter(
+                    User.id.in_([row.id for row in rows]),
+                    User.is_subscribed == True,
+                    User.subscription_expires <= now
+                ).update({User.is_subscribed: False}, synchronize_session=False)
+            _save_progress(session, sweep_id, deactivated=updated, phase=PHASE_EXPIRE,
+                           cursor_expires=None, cursor_user_id=rows[-1].id if rows else None)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        for row in rows:
+            invalidate_subscription(row.user_id)
+        total += updated
+        # Отключенные записи выпадают из выборки, поэтому курсор не нужен
+        if len(rows) < chunk_size:
+            return total
+
+
+def enqueue_expiry_reminders(sweep_id, now, days, chunk_size=SUBSCRIPTION_SWEEP_CHUNK_SIZE):
+    """
+    Ставит в очередь напоминания пользователям, чья подписка заканчивается
+    через days дней (в интервале (now + days - 1, now + days]).
+
+    Returns:
+        int: Количество новых сообщений в очереди
+    """
+    lower = now + timedelta(days=days - 1)
+    upper = now + timedelta(days=days)
+    phase = f"remind_{days}d"
+    cursor = None
+    total = 0
+    while True:
+        session = Session()
+        try:
+            query = session.query(User.id, User.user_id, User.chat_id, User.subscription_expires).filter(
+                User.is_subscribed == True,
+                User.subscription_expires > lower,
+                User.subscription_expires <= upper
+            )
+            if cursor is not None:
+                query = query.filter(or_(
+                    User.subscription_expires > cursor[0],
+                    and_(User.subscription_expires == cursor[0], User.id > cursor[1])
+                ))
+            rows = query.order_by(User.subscription_expires, User.id).limit(chunk_size).all()
+
+            added = 0
+            if rows:
+                added = enqueue_messages([
+                    build_message(
+                        int(row.chat_id or row.user_id),
+                        reminder_text(days, row.subscription_expires),
+                        idempotency_key=f"subscription_reminder:{row.user_id}:{days}d:"
+                                        f"{row.subscription_expires.strftime('%Y-%m-%d')}"
+                    )
+                    for row in rows
+                ])
+                cursor = (rows[-1].subscription_expires, rows[-1].id)
+            _save_progress(session, sweep_id, reminders=added, phase=phase,
+                           cursor_expires=cursor[0] if cursor else None,
+                           cursor_user_id=cursor[1] if cursor else None)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        total += added
+        if len(rows) < chunk_size:
+            return total
+
+
+def run_subscription_sweep(now=None, chunk_size=SUBSCRIPTION_SWEEP_CHUNK_SIZE):
+    """
+    Один проход проверки подписок.
+
+    Returns:
+        dict: {'sweep_id', 'deactivated', 'reminders'} или None, если проход уже выполняется
+    """
+    now = now or datetime.now()
+    sweep_id = _start_sweep(now)
+    if sweep_id is None:
+        return None
+
+    result = {'sweep_id': sweep_id, 'deactivated': 0, 'reminders': 0}
+    session = Session()
+    try:
+        result['deactivated'] = deactivate_expired(sweep_id, now, chunk_size)
+        for days in sorted(SUBSCRIPTION_REMINDER_DAYS, reverse=True):
+            result['reminders'] += enqueue_expiry_reminders(sweep_id, now, days, chunk_size)
+        _save_progress(session, sweep_id, status=STATUS_COMPLETED, phase=None, finished_at=datetime.now())
+        session.commit()
+        logger.info(f"[SWEEP] Проход {sweep_id}: отключено подписок {result['deactivated']}, "
+                    f"напоминаний в очереди {result['reminders']}")
+        return result
+    except Exception as e:
+        session.rollback()
+        try:
+            _save_progress(session, sweep_id, status=STATUS_FAILED, finished_at=datetime.now(), last_error=str(e))
+            session.commit()
+        except Exception as save_error:
+            session.rollback()
+            logger.error(f"[SWEEP] Не удалось сохранить ошибку прохода {sweep_id}: {save_error}")
+        raise
+    finally:
+        session.close()
+
+
+def subscription_sweep_job(context):
+    """Задача JobQueue: отключает истекшие подписки и ставит напоминания в очередь"""
+    try:
+        run_subscription_sweep()
+    except Exception as e:
+        logger.error(f"[SWEEP] Ошибка при проверке подписок: {e}")
+
+
+def schedule_subscription_sweeper(job_queue):
+    """Регистрирует периодическую проверку подписок в JobQueue бота"""
+    return job_queue.run_repeating(
+        subscription_sweep_job,
+        interval=SUBSCRIPTION_SWEEP_INTERVAL,
+        first=60,
+        name="subscription_sweeper"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    print(run_subscription_sweep())
@@ -1,8 +1,37 @@
 import os
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def _sqlite_path(database_url):
+    """Путь к файлу SQLite из URL SQLAlchemy (None для других СУБД и :memory:)"""
+    prefix = 'sqlite:///'
+    if not database_url.startswith(prefix) or database_url == 'sqlite:///:memory:':
+        return None
+    # Относительный путь SQLAlchemy считает от рабочей директории
+    return os.path.abspath(database_url[len(prefix):])
+
 
 # Пути к базам данных
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'database.db')
-BLOGGERS_DB_PATH = os.path.join(os.path.dirname(__file__), 'willway_bloggers.db')
+MAIN_DATABASE_PATH = _sqlite_path(os.getenv('DATABASE_URL', 'sqlite:///health_bot.db'))
+LEGACY_BLOGGERS_DB_PATH = os.path.join(os.path.dirname(__file__), 'willway_bloggers.db')
+
+# Единая база: таблицы блогеров хранятся в основной базе вместе с users.
+# Перед включением данные переносятся из старых файлов:
+# python database/merge_bloggers_db.py
+BLOGGERS_SINGLE_DB = os.getenv('BLOGGERS_SINGLE_DB', '').lower() in ('1', 'true', 'yes')
+
+if BLOGGERS_SINGLE_DB and MAIN_DATABASE_PATH is None:
+    logger.warning("BLOGGERS_SINGLE_DB поддерживается только для SQLite DATABASE_URL, используется willway_bloggers.db")
+    BLOGGERS_SINGLE_DB = False
+
+BLOGGERS_DB_PATH = MAIN_DATABASE_PATH if BLOGGERS_SINGLE_DB else LEGACY_BLOGGERS_DB_PATH
 
 # Секретный ключ для Flask (если нужен)
-FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'default_secret_key') 
\ No newline at end of file
+FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'default_secret_key')
\ No newline at end of file
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Замер времени поиска перехода блогера при оплате
+
+Создаёт временную SQLite базу с таблицей blogger_referrals на N записей
+(по умолчанию 1 000 000) и сравнивает старый поиск по source LIKE '%id%'
+с поиском по индексу (user_id, created_at).
+
+Запуск:
+    python -m database.benchmark_blogger_conversion [--rows 1000000] [--lookups 200]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database.blogger_attribution import (
+    BLOGGER_CONVERSION_LOOKUP_SQL,
+    BLOGGER_REFERRAL_USER_INDEX,
+    parse_referral_user_id,
+)
+
+LEGACY_LOOKUP_SQL = """
+    SELECT br.id, br.blogger_id, b.name
+    FROM blogger_referrals br
+    JOIN bloggers b ON br.blogger_id = b.id
+    WHERE br.source LIKE :user_pattern AND br.converted = 0
+    ORDER BY br.created_at DESC
+"""
+
+SOURCE_FORMATS = ("telegram_start_{}", "{}", "ref_{}")
+
+
+def build_database(path, rows, bloggers=200, seed=42):
+    """Заполняет тестовую базу и возвращает список telegram id пользователей"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE bloggers (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("""
+        CREATE TABLE blogger_referrals (
+            id INTEGER PRIMARY KEY,
+            blogger_id INTEGER NOT NULL,
+            source VARCHAR(100),
+            user_id VARCHAR(50),
+            created_at DATETIME,
+            converted BOOLEAN DEFAULT 0,
+            converted_at DATETIME,
+            commission_amount FLOAT DEFAULT 0
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO bloggers (id, name) VALUES (?, ?)",
+        [(i, f"blogger_{i}") for i in range(1, bloggers + 1)],
+    )
+
+    start = datetime(2024, 1, 1)
+    user_ids = []
+    batch = []
+    for row_id in range(1, rows + 1):
+        telegram_id = str(rnd.randint(10_000_000, 7_000_000_000))
+        user_ids.append(telegram_id)
+        source = rnd.choice(SOURCE_FORMATS).format(telegram_id)
+        created_at = start + timedelta(seconds=row_id * 30)
+        batch.append((
+            row_id,
+            rnd.randint(1, bloggers),
+            source,
+            parse_referral_user_id(source),
+            created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            1 if rnd.random() < 0.1 else 0,
+        ))
+        if len(batch) >= 50_000:
+            conn.executemany(
+                "INSERT INTO blogger_referrals (id, blogger_id, source, user_id, created_at, converted) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch = []
+    if batch:
+        conn.executemany(
+            "INSERT INTO blogger_referrals (id, blogger_id, source, user_id, created_at, converted) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+    conn.execute(
+        f"CREATE INDEX {BLOGGER_REFERRAL_USER_INDEX} ON blogger_referrals (user_id, created_at)"
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return user_ids
+
+
+def time_lookups(conn, sql, params_list):
+    """Время каждого запроса в миллисекундах"""
+    timings = []
+    for params in params_list:
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def describe(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{name:<22} запросов={len(timings):<5} "
+          f"медиана={statistics.median(timings):9.3f} мс  p95={p95:9.3f} мс  "
+          f"макс={timings[-1]:9.3f} мс")
+
+
+def query_plan(conn, sql, params):
+    return "; ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер поиска перехода блогера при оплате")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--legacy-lookups", type=int, default=20,
+                        help="Запросов старым способом (полный скан, медленно)")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db", prefix="blogger_bench_")
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        user_ids = build_database(path, args.rows)
+        print(f"База на {args.rows} переходов создана за {time.perf_counter() - started:.1f} с")
+
+        rnd = random.Random(7)
+        sample = rnd.sample(user_ids, min(args.lookups, len(user_ids)))
+        conn = sqlite3.connect(path)
+
+        # Параметры :name одинаковы в SQLAlchemy text() и sqlite3
+        new_sql = BLOGGER_CONVERSION_LOOKUP_SQL
+        print("План (индекс):", query_plan(conn, new_sql, {"user_id": sample[0]}))
+        print("План (LIKE):  ", query_plan(conn, LEGACY_LOOKUP_SQL, {"user_pattern": f"%{sample[0]}%"}))
+
+        describe("user_id по индексу",
+                 time_lookups(conn, new_sql, [{"user_id": u} for u in sample]))
+        describe("source LIKE '%id%'",
+                 time_lookups(conn, LEGACY_LOOKUP_SQL,
+                              [{"user_pattern": f"%{u}%"} for u in sample[:args.legacy_lookups]]))
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Привязка реферальных переходов блогеров к пользователю Telegram
+
+Раньше переход искался по подстроке: source LIKE '%<telegram_id>%'. Это
+полное сканирование таблицы, к тому же id 12345 находил переходы
+пользователя 9123456. Теперь у перехода есть колонка user_id с индексом
+(user_id, created_at), и конверсия ищется точным сравнением по индексу.
+Старые записи заполняются миграцией по значению source.
+"""
+
+import re
+
+# Индекс для поиска последнего неконвертированного перехода пользователя
+BLOGGER_REFERRAL_USER_INDEX = "ix_blogger_referrals_user_created"
+
+# Форматы source: "<id>", "telegram_start_<id>", "ref_<id>", "user_<id>"
+_SOURCE_USER_ID_RE = re.compile(r"^(?:[a-z_]*_)?(\d{3,})$")
+
+# Последний неконвертированный переход пользователя (поиск по индексу)
+BLOGGER_CONVERSION_LOOKUP_SQL = """
+    SELECT br.id, br.blogger_id, b.name
+    FROM blogger_referrals br
+    JOIN bloggers b ON br.blogger_id = b.id
+    WHERE br.user_id = :user_id AND (br.converted = 0 OR br.converted IS NULL)
+    ORDER BY br.created_at DESC
+    LIMIT 1
+"""
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def parse_referral_user_id(source):
+    """
+    Telegram ID пользователя из значения source или None.
+    Имена пользователей (username) в source не разбираются.
+    """
+    if not source:
+        return None
+    match = _SOURCE_USER_ID_RE.match(str(source).strip().lower())
+    return match.group(1) if match else None
+
+
+def backfill_referral_user_ids(conn, text, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Заполняет user_id у переходов, где он пуст, разбирая source.
+    Проходит таблицу порциями по id, чтобы не держать долгую транзакцию.
+
+    Args:
+        conn: Соединение SQLAlchemy
+        text: sqlalchemy.text
+    Returns:
+        int: Количество заполненных записей
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, source FROM blogger_referrals "
+            "WHERE id > :last_id AND user_id IS NULL ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": batch_size}).fetchall()
+        if not rows:
+            return updated
+        params = []
+        for row_id, source in rows:
+            user_id = parse_referral_user_id(source)
+            if user_id:
+                params.append({"id": row_id, "user_id": user_id})
+        if params:
+            conn.execute(text("UPDATE blogger_referrals SET user_id = :user_id WHERE id = :id"), params)
+            updated += len(params)
+        last_id = rows[-1][0]
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Дневная сводка статистики блогеров (blogger_daily_stats в willway_bloggers.db)
+
+Одна строка на блогера и день: переходы, конверсии и комиссия. Сводка
+обновляется в той же транзакции, что и запись в blogger_referrals, поэтому
+панель и графики читают не больше 365 строк на блогера за год, а не
+пересчитывают COUNT/SUM по всем переходам.
+
+Конверсия и комиссия относятся ко дню перехода (created_at), как и в
+прежних запросах по blogger_referrals, так что цифры на панели не меняются.
+
+Каждое обновление сводки увеличивает версию статистики блогера
+(blogger_stats_versions). По ней кэш ответов панели в другом процессе
+понимает, что данные блогера изменились.
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DAILY_STATS_TABLE = "blogger_daily_stats"
+STATS_VERSIONS_TABLE = "blogger_stats_versions"
+
+_CREATE_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {DAILY_STATS_TABLE} (
+        blogger_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        clicks INTEGER NOT NULL DEFAULT 0,
+        conversions INTEGER NOT NULL DEFAULT 0,
+        commission REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (blogger_id, day)
+    )
+"""
+
+_UPSERT_SQL = f"""
+    INSERT INTO {DAILY_STATS_TABLE} (blogger_id, day, clicks, conversions, commission)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(blogger_id, day) DO UPDATE SET
+        clicks = clicks + excluded.clicks,
+        conversions = conversions + excluded.conversions,
+        commission = commission + excluded.commission
+"""
+
+_CREATE_VERSIONS_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {STATS_VERSIONS_TABLE} (
+        blogger_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+"""
+
+_BUMP_VERSION_SQL = f"""
+    INSERT INTO {STATS_VERSIONS_TABLE} (blogger_id, version, updated_at)
+    VALUES (?, 1, ?)
+    ON CONFLICT(blogger_id) DO UPDATE SET
+        version = version + 1,
+        updated_at = excluded.updated_at
+"""
+
+# Базы, в которых таблица уже проверена в этом процессе
+_ready_databases = set()
+_ready_lock = threading.Lock()
+
+
+def _database_key(conn):
+    # У соединений из пула (database/bloggers_db.py) путь уже известен
+    path = getattr(conn, 'database_path', None)
+    if path:
+        return path
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else None
+
+
+def ensure_daily_stats_table(conn):
+    """
+    Создает таблицы сводки и версий, если их нет, и заполняет сводку по
+    blogger_referrals. Проверка выполняется один раз на базу за время жизни
+    процесса.
+
+    Returns:
+        bool: True, если таблица только что создана и заполнена
+    """
+    key = _database_key(conn)
+    if key in _ready_databases:
+        return False
+    with _ready_lock:
+        if key in _ready_databases:
+            return False
+        existing = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name IN (?, ?)",
+            (DAILY_STATS_TABLE, STATS_VERSIONS_TABLE)
+        ).fetchall()}
+        if len(existing) == 2:
+            _ready_databases.add(key)
+            return False
+
+        # Внутри чужой транзакции фиксирует вызывающий код, иначе - сразу
+        own_transaction = not conn.in_transaction
+        if STATS_VERSIONS_TABLE not in existing:
+            conn.execute(_CREATE_VERSIONS_SQL)
+        created = DAILY_STATS_TABLE not in existing
+        if created:
+            conn.execute(_CREATE_TABLE_SQL)
+            rebuilt = rebuild_daily_stats(conn, commit=False)
+            logger.info(f"Создана таблица {DAILY_STATS_TABLE}, заполнено {rebuilt} дней")
+        if own_transaction:
+            conn.commit()
+            _ready_databases.add(key)
+        return created
+
+
+def rebuild_daily_stats(conn, blogger_id=None, commit=True):
+    """
+    Пересчитывает сводку по сырым переходам (для первоначального заполнения
+    и ручной сверки). Возвращает количество записанных строк.
+    """
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(blogger_referrals)").fetchall()]
+    if not columns or 'created_at' not in columns:
+        return 0
+
+    converted_expr = "converted = 1" if 'converted' in columns else "0"
+    commission_column = next((c for c in ('commission_amount', 'commission') if c in columns), None)
+    commission_expr = (f"CASE WHEN {converted_expr} THEN COALESCE({commission_column}, 0) ELSE 0 END"
+                       if commission_column else "0")
+
+    where = "WHERE created_at IS NOT NULL"
+    params = []
+    if blogger_id is not None:
+        where += " AND blogger_id = ?"
+        params.append(blogger_id)
+        conn.execute(f"DELETE FROM {DAILY_STATS_TABLE} WHERE blogger_id = ?", (blogger_id,))
+    else:
+        conn.execute(f"DELETE FROM {DAILY_STATS_TABLE}")
+
+    cursor = conn.execute(f"""
+        INSERT INTO {DAILY_STATS_TABLE} (blogger_id, day, clicks, conversions, commission)
+        SELECT blogger_id, date(created_at), COUNT(*),
+               SUM(CASE WHEN {converted_expr} THEN 1 ELSE 0 END),
+               SUM({commission_expr})
+        FROM blogger_referrals
+        {where}
+        GROUP BY blogger_id, date(created_at)
+    """, params)
+    rows = cursor.rowcount
+
+    # Закэшированная статистика пересчитанных блогеров устарела
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if blogger_id is not None:
+        conn.execute(_BUMP_VERSION_SQL, (blogger_id, now))
+    else:
+        conn.execute(f"UPDATE {STATS_VERSIONS_TABLE} SET version = version + 1, updated_at = ?", (now,))
+    if commit:
+        conn.commit()
+    return rows
+
+
+def record_click(cursor, blogger_id, when=None):
+    """
+    Учитывает переход по ссылке блогера. Вызывать после вставки перехода
+    в blogger_referrals и до commit().
+    """
+    try:
+        if ensure_daily_stats_table(cursor.connection):
+            # Переход уже учтен при заполнении новой таблицы
+            _bump_version(cursor, blogger_id)
+            return
+        day = (when or datetime.now()).strftime("%Y-%m-%d")
+        cursor.execute(_UPSERT_SQL, (blogger_id, day, 1, 0, 0))
+        _bump_version(cursor, blogger_id)
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении {DAILY_STATS_TABLE} (переход блогера {blogger_id}): {e}")
+
+
+def record_conversion(cursor, referral_id, commission):
+    """
+    Учитывает конверсию перехода referral_id в дне этого перехода.
+    Вызывать после обновления blogger_referrals и до commit().
+    """
+    try:
+        rebuilt = ensure_daily_stats_table(cursor.connection)
+        row = cursor.execute(
+            "SELECT blogger_id, date(created_at) FROM blogger_referrals WHERE id = ?", (referral_id,)
+        ).fetchone()
+        if not row:
+            return
+        if not rebuilt:
+            day = row[1] or datetime.now().strftime("%Y-%m-%d")
+            cursor.execute(_UPSERT_SQL, (row[0], day, 0, 1, commission or 0))
+        _bump_version(cursor, row[0])
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении {DAILY_STATS_TABLE} (конверсия перехода {referral_id}): {e}")
+
+
+def _bump_version(cursor, blogger_id):
+    cursor.execute(_BUMP_VERSION_SQL, (blogger_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+
+def get_stats_version(conn, blogger_id):
+    """
+    Версия статистики блогера и время ее последнего изменения.
+
+    Returns:
+        tuple: (version, updated_at: datetime | None); (0, None), если изменений не было
+    """
+    ensure_daily_stats_table(conn)
+    row = conn.execute(
+        f"SELECT version, updated_at FROM {STATS_VERSIONS_TABLE} WHERE blogger_id = ?", (blogger_id,)
+    ).fetchone()
+    if not row:
+        return 0, None
+    updated_at = datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S") if row[1] else None
+    return row[0], updated_at
+
+
+def get_totals(conn, blogger_id=None, start_date=None, end_date=None):
+    """
+    Суммы по сводке: {'clicks', 'conversions', 'commission'}.
+    Без blogger_id - по всем блогерам, без дат - за все время.
+    """
+    ensure_daily_stats_table(conn)
+    conditions = []
+    params = []
+    if blogger_id is not None:
+        conditions.append("blogger_id = ?")
+        params.append(blogger_id)
+    if start_date is not None:
+        conditions.append("day >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append("day <= ?")
+        params.append(str(end_date))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    row = conn.execute(f"""
+        SELECT COALESCE(SUM(clicks), 0), COALESCE(SUM(conversions), 0), COALESCE(SUM(commission), 0)
+        FROM {DAILY_STATS_TABLE} {where}
+    """, params).fetchone()
+    return {'clicks': row[0], 'conversions': row[1], 'commission': row[2]}
+
+
+def get_series(conn, blogger_id, start_date, end_date, monthly=False):
+    """
+    Ряд по дням ('YYYY-MM-DD') или месяцам ('YYYY-MM') за период:
+    {ключ: {'clicks', 'conversions', 'commission'}}. Пустые дни не возвращаются.
+    """
+    ensure_daily_stats_table(conn)
+    bucket = "substr(day, 1, 7)" if monthly else "day"
+    rows = conn.execute(f"""
+        SELECT {bucket} AS bucket, SUM(clicks), SUM(conversions), SUM(commission)
+        FROM {DAILY_STATS_TABLE}
+        WHERE blogger_id = ? AND day >= ? AND day <= ?
+        GROUP BY bucket
+        ORDER BY bucket
+    """, (blogger_id, str(start_date), str(end_date))).fetchall()
+    return {
+        row[0]: {'clicks': row[1] or 0, 'conversions': row[2] or 0, 'commission': row[3] or 0}
+        for row in rows
+    }
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Пул соединений с базой блогеров (willway_bloggers.db)
+
+Раньше blogger_utils, api_routes и api_patch открывали новое SQLite
+соединение на каждый вызов, причем путь к файлу строился от os.getcwd().
+Теперь все три модуля берут соединение из общего потокобезопасного пула:
+
+- путь к базе фиксирован: config.BLOGGERS_DB_PATH (абсолютный; при
+  BLOGGERS_SINGLE_DB=1 это основная база health_bot.db);
+- журнал WAL: чтение панели блогера не блокируется записью переходов;
+- busy_timeout вместо мгновенной ошибки "database is locked";
+- соединения переиспользуются, поэтому кэш подготовленных выражений
+  sqlite3 (cached_statements) работает между запросами.
+
+conn.close() возвращает соединение в пул (незавершенная транзакция
+откатывается), поэтому существующий код вида "conn = ...; ...; conn.close()"
+менять не нужно.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from queue import Empty, Full, LifoQueue
+
+from config import BLOGGERS_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+BLOGGERS_DB_POOL_SIZE = int(os.getenv("BLOGGERS_DB_POOL_SIZE", "8"))
+BLOGGERS_DB_BUSY_TIMEOUT_MS = int(os.getenv("BLOGGERS_DB_BUSY_TIMEOUT_MS", "5000"))
+BLOGGERS_DB_STATEMENT_CACHE = int(os.getenv("BLOGGERS_DB_STATEMENT_CACHE", "256"))
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение, которое при close() возвращается в свой пул"""
+
+    pool = None
+    database_path = None
+    in_pool = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+
+class SqliteConnectionPool:
+    """Потокобезопасный пул sqlite3-соединений к одному файлу базы"""
+
+    def __init__(self, path, size=BLOGGERS_DB_POOL_SIZE, busy_timeout_ms=BLOGGERS_DB_BUSY_TIMEOUT_MS,
+                 cached_statements=BLOGGERS_DB_STATEMENT_CACHE):
+        self.path = os.path.abspath(path)
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._idle = LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._wal_checked = False
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=PooledConnection,
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        if not self._wal_checked:
+            # Режим WAL сохраняется в файле базы, достаточно включить один раз
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != "wal":
+                logger.warning(f"Не удалось включить WAL для {self.path}: journal_mode={mode}")
+            self._wal_checked = True
+        conn.pool = self
+        conn.database_path = self.path
+        self.opened += 1
+        return conn
+
+    def acquire(self):
+        """Соединение из пула или новое, если свободных нет"""
+        with self._lock:
+            try:
+                conn = self._idle.get_nowait()
+                self.reused += 1
+            except Empty:
+                conn = self._connect()
+            conn.in_pool = False
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def release(self, conn):
+        """Возвращает соединение в пул; повторный close() ничего не делает"""
+        with self._lock:
+            if conn.in_pool:
+                return
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.in_pool = True
+                self._idle.put_nowait(conn)
+            except (Full, sqlite3.Error):
+                conn.in_pool = True
+                sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    sqlite3.Connection.close(self._idle.get_nowait())
+                except Empty:
+                    return
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "opened": self.opened,
+            "reused": self.reused,
+        }
+
+
+bloggers_pool = SqliteConnectionPool(BLOGGERS_DB_PATH)
+
+
+def get_bloggers_connection():
+    """
+    Соединение с базой блогеров из общего пула (row_factory = sqlite3.Row).
+    Схема базы приводится к актуальной при первом обращении в процессе.
+    """
+    from database.sqlite_schema import get_bloggers_schema
+    conn = bloggers_pool.acquire()
+    try:
+        get_bloggers_schema(conn)
+    except Exception:
+        conn.close()
+        raise
+    return conn
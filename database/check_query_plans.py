@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Проверка планов горячих запросов (EXPLAIN QUERY PLAN)
+
+Запросы ниже повторяют выборки бота и админ-панели: статус подписки,
+истекающие и истекшие подписки, регистрации за период, код блогера,
+платежи пользователя, поиск приглашения и рефералов, история диалогов.
+Для каждого проверяется, что SQLite выполняет его по ожидаемому индексу
+(HOT_QUERY_INDEXES в database/migrations.py и __table_args__ моделей),
+а не полным сканированием таблицы. Если индекс удалят или запрос
+перестанет под него подходить, скрипт завершится с кодом 1.
+
+Схему моделей проверяет тест tests/test_query_plans.py. Скрипт - обертка
+для ручного запуска: по умолчанию схема создается из моделей в базе
+в памяти, --database-url проверяет рабочую базу после миграций.
+
+Запуск:
+    python -m database.check_query_plans [--database-url sqlite:///health_bot.db] [--verbose]
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+
+from database.db import db
+from database.models import BloggerReferral, ChatHistory, MessageHistory, Payment, ReferralUse, User
+
+NOW = datetime(2025, 1, 15, 12, 0, 0)
+
+# (название, запрос, индекс, который должен попасть в план)
+HOT_QUERIES = (
+    ("статус подписки по Telegram ID",
+     select(User.is_subscribed, User.subscription_expires, User.subscription_type).where(User.user_id == "123"),
+     "sqlite_autoindex_users_1"),
+    ("подписки, истекающие в ближайшие дни",
+     select(User.id, User.user_id).where(
+         User.is_subscribed == True,
+         User.subscription_expires >= NOW,
+         User.subscription_expires < NOW + timedelta(days=3),
+     ),
+     "ix_users_subscribed_expires"),
+    ("истекшие подписки",
+     select(User.id).where(User.subscription_expires != None, User.subscription_expires <= NOW),
+     "ix_users_subscription_expires"),
+    ("регистрации за период",
+     select(func.date(User.registration_date), func.count(User.id)).where(
+         User.registration_date >= NOW - timedelta(days=1), User.registration_date < NOW
+     ).group_by(func.date(User.registration_date)),
+     "ix_users_registration_date"),
+    ("пользователи по коду блогера",
+     select(User.id).where(User.blogger_ref_code == "ref_abc"),
+     "ix_users_blogger_ref_code"),
+    ("платежи пользователя по статусу",
+     select(Payment.id).where(Payment.user_id == 1, Payment.status == "pending").order_by(Payment.created_at.desc()),
+     "ix_payments_user_status_created"),
+    ("платежи по статусу за период",
+     select(Payment.id).where(Payment.status == "pending", Payment.created_at < NOW),
+     "ix_payments_status_created"),
+    ("оплаченные платежи за день",
+     select(func.count(Payment.id), func.sum(Payment.amount)).where(
+         Payment.paid_at >= NOW - timedelta(days=1), Payment.paid_at < NOW
+     ),
+     "ix_payments_paid_at"),
+    ("приглашение пользователя с оплатой",
+     select(ReferralUse.id, ReferralUse.referrer_id).where(
+         ReferralUse.user_id == 1, ReferralUse.subscription_purchased == True
+     ),
+     "ix_referral_uses_user_purchased"),
+    ("рефералы пригласившего",
+     select(func.count(ReferralUse.id)).where(ReferralUse.referrer_id == 1),
+     "ix_referral_uses_referrer_id"),
+    ("использования кодов страницы",
+     select(ReferralUse.referral_code_id, func.count(ReferralUse.id)).where(
+         ReferralUse.referral_code_id.in_([1, 2, 3])
+     ).group_by(ReferralUse.referral_code_id),
+     "ix_referral_uses_code_id"),
+    ("приглашение по referred_id",
+     select(ReferralUse.id).where(ReferralUse.referred_id == 123),
+     "ix_referral_uses_referred_id"),
+    ("история диалога",
+     select(ChatHistory.id).where(ChatHistory.user_id == "123").order_by(ChatHistory.timestamp.desc()).limit(20),
+     "ix_chat_history_user_ts"),
+    ("история сообщений",
+     select(MessageHistory.id).where(MessageHistory.user_id == 1).order_by(MessageHistory.timestamp.desc()).limit(20),
+     "ix_message_history_user_ts"),
+    ("переход блогера по пользователю",
+     select(BloggerReferral.id).where(BloggerReferral.user_id == "123").order_by(BloggerReferral.created_at.desc()),
+     "ix_blogger_referrals_user_created"),
+)
+
+
+def explain(conn, statement):
+    """План запроса: строки detail из EXPLAIN QUERY PLAN"""
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    # Значения параметров на план не влияют, даты передаются строками, как их хранит SQLite
+    params = tuple(
+        str(compiled.params[name]) if isinstance(compiled.params[name], datetime) else compiled.params[name]
+        for name in compiled.positiontup
+    )
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()]
+
+
+def check_query_plans(engine, verbose=False):
+    """
+    Проверяет планы HOT_QUERIES.
+
+    Returns:
+        list: Сообщения о запросах, которые не используют ожидаемый индекс
+    """
+    failures = []
+    with engine.connect() as conn:
+        for name, statement, index_name in HOT_QUERIES:
+            plan = explain(conn, statement)
+            used = any(f"INDEX {index_name}" in line for line in plan)
+            if verbose or not used:
+                print(f"{'OK  ' if used else 'FAIL'} {name}: {'; '.join(plan)}")
+            if not used:
+                failures.append(f"{name}: ожидался индекс {index_name}, план: {'; '.join(plan)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов горячих запросов")
+    parser.add_argument("--database-url", default="sqlite://",
+                        help="База для проверки (по умолчанию схема моделей в памяти)")
+    parser.add_argument("--verbose", action="store_true", help="Печатать планы всех запросов")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if engine.dialect.name != "sqlite":
+        print("EXPLAIN QUERY PLAN поддерживается только для SQLite")
+        return 2
+    if args.database_url == "sqlite://":
+        db.metadata.create_all(engine)
+
+    failures = check_query_plans(engine, verbose=args.verbose)
+    if failures:
+        print(f"Запросов без ожидаемого индекса: {len(failures)} из {len(HOT_QUERIES)}")
+        return 1
+    print(f"Все {len(HOT_QUERIES)} запросов используют индексы")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
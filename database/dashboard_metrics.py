@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Дневные метрики панели администратора (таблица daily_metrics)
+
+Панель раньше на каждую загрузку считала extract(month/year) по всей
+таблице users (индексы при этом не используются), а доход оценивала как
+"подписки * MONTHLY_SUBSCRIPTION_PRICE". Теперь метрики хранятся по дням:
+
+- registrations - регистрации (users.registration_date);
+- new_subscriptions / renewals - первая и повторные оплаты пользователя;
+- cancellations - начатые отмены подписки (users.cancellation_date);
+- payments / revenue - оплаченные платежи и сумма по payments.
+
+День пересчитывается целиком запросами по диапазону дат (индексы
+ix_users_registration_date, ix_users_cancellation_date, ix_payments_paid_at),
+поэтому пересчет идемпотентен. Последние METRICS_REFRESH_DAYS дней
+обновляет задача JobQueue бота, день платежа - обработчик оплаты. Панель
+читает не больше 366 строк за год независимо от числа пользователей.
+"""
+
+import os
+import logging
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import and_, case, exists, func, or_
+from sqlalchemy.orm import aliased
+
+from database.models import DailyMetric, Payment, User, get_session
+
+logger = logging.getLogger(__name__)
+
+METRICS_REFRESH_INTERVAL = int(os.getenv("METRICS_REFRESH_INTERVAL", "300"))
+METRICS_REFRESH_DAYS = int(os.getenv("METRICS_REFRESH_DAYS", "2"))
+
+# Статусы оплаченных платежей
+PAID_PAYMENT_STATUSES = ('completed', 'succeeded', 'paid')
+
+METRIC_FIELDS = ('registrations', 'new_subscriptions', 'renewals', 'cancellations', 'payments', 'revenue')
+
+
+def _day_start(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return datetime(value.year, value.month, value.day)
+
+
+def _day_key(value):
+    # func.date возвращает строку в SQLite и date в PostgreSQL
+    return value if isinstance(value, str) else value.strftime('%Y-%m-%d')
+
+
+def compute_daily_metrics(session, start, end):
+    """
+    Метрики по дням в диапазоне [start, end) из исходных таблиц.
+
+    Returns:
+        dict: {'YYYY-MM-DD': {метрика: значение}} для дней с событиями
+    """
+    start, end = _day_start(start), _day_start(end)
+    result = {}
+
+    def bucket(day):
+        return result.setdefault(_day_key(day), dict.fromkeys(METRIC_FIELDS, 0))
+
+    for column, field in ((User.registration_date, 'registrations'), (User.cancellation_date, 'cancellations')):
+        day = func.date(column)
+        for value, count in session.query(day, func.count(User.id)).filter(
+            column >= start, column < end
+        ).group_by(day).all():
+            bucket(value)[field] = count
+
+    # Первая оплата пользователя - нет более ранней оплаченной
+    earlier = aliased(Payment)
+    is_first = ~exists().where(and_(
+        earlier.user_id == Payment.user_id,
+        earlier.status.in_(PAID_PAYMENT_STATUSES),
+        or_(earlier.paid_at < Payment.paid_at, and_(earlier.paid_at == Payment.paid_at, earlier.id < Payment.id)),
+    ))
+    day = func.date(Payment.paid_at)
+    for value, count, first, revenue in session.query(
+        day, func.count(Payment.id), func.sum(case((is_first, 1), else_=0)), func.sum(Payment.amount)
+    ).filter(
+        Payment.status.in_(PAID_PAYMENT_STATUSES), Payment.paid_at >= start, Payment.paid_at < end
+    ).group_by(day).all():
+        metrics = bucket(value)
+        metrics['payments'] = count
+        metrics['new_subscriptions'] = first or 0
+        metrics['renewals'] = count - (first or 0)
+        metrics['revenue'] = round(revenue or 0, 2)
+    return result
+
+
+def refresh_daily_metrics(start, end=None, session=None):
+    """
+    Пересчитывает дни [start, end] включительно и перезаписывает их в daily_metrics.
+    Возвращает количество пересчитанных дней.
+    """
+    start = _day_start(start)
+    end = _day_start(end or start) + timedelta(days=1)
+    own_session = session is None
+    if own_session:
+        session = get_session()
+    try:
+        computed = compute_daily_metrics(session, start, end)
+        now = datetime.now()
+        days = []
+        current = start
+        while current < end:
+            days.append(current.strftime('%Y-%m-%d'))
+            current += timedelta(days=1)
+
+        # Дни без событий тоже записываются: обнуляют устаревшие значения
+        session.query(DailyMetric).filter(
+            DailyMetric.day >= days[0], DailyMetric.day <= days[-1]
+        ).delete(synchronize_session=False)
+        session.add_all([
+            DailyMetric(day=day, updated_at=now, **computed.get(day, dict.fromkeys(METRIC_FIELDS, 0)))
+            for day in days
+        ])
+        if own_session:
+            session.commit()
+        return len(days)
+    except Exception:
+        if own_session:
+            session.rollback()
+        raise
+    finally:
+        if own_session:
+            session.close()
+
+
+def refresh_recent_metrics(days=METRICS_REFRESH_DAYS, today=None):
+    """Пересчитывает последние days дней, включая сегодняшний"""
+    today = today or date.today()
+    return refresh_daily_metrics(today - timedelta(days=max(days, 1) - 1), today)
+
+
+def rebuild_daily_metrics(session=None):
+    """Полный пересчет с даты первого события (первоначальное заполнение)"""
+    own_session = session is None
+    if own_session:
+        session = get_session()
+    try:
+        first_dates = [
+            session.query(func.min(User.registration_date)).scalar(),
+            session.query(func.min(User.cancellation_date)).scalar(),
+            session.query(func.min(Payment.paid_at)).scalar(),
+        ]
+        first_dates = [value for value in first_dates if value]
+        if not first_dates:
+            return 0
+        start = min(value if isinstance(value, datetime) else datetime.fromisoformat(str(value)) for value in first_dates)
+        days = refresh_daily_metrics(start, date.today(), session=session)
+        if own_session:
+            session.commit()
+        logger.info(f"[METRICS] Метрики панели пересчитаны за {days} дней")
+        return days
+    finally:
+        if own_session:
+            session.close()
+
+
+def record_payment_metrics(paid_at=None):
+    """
+    Обновляет метрики дня платежа. Вызывать после commit() платежа;
+    ошибки только логируются, чтобы не мешать обработке оплаты.
+    """
+    try:
+        refresh_daily_metrics(paid_at or datetime.now())
+    except Exception as e:
+        logger.error(f"[METRICS] Ошибка при обновлении метрик после платежа: {e}")
+
+
+def metrics_updated_at(session):
+    """Время последнего пересчета метрик или None"""
+    return session.query(func.max(DailyMetric.updated_at)).scalar()
+
+
+def get_dashboard_metrics(session, today=None):
+    """
+    Метрики для панели: текущий месяц и помесячные ряды за текущий год.
+
+    Returns:
+        dict: {'this_month': {метрика: значение}, 'months': {1..12: {метрика: значение}}}
+    """
+    today = today or date.today()
+    months = {month: dict.fromkeys(METRIC_FIELDS, 0) for month in range(1, 13)}
+    rows = session.query(
+        func.substr(DailyMetric.day, 6, 2),
+        *[func.sum(getattr(DailyMetric, field)) for field in METRIC_FIELDS]
+    ).filter(
+        DailyMetric.day >= f"{today.year}-01-01", DailyMetric.day <= f"{today.year}-12-31"
+    ).group_by(func.substr(DailyMetric.day, 6, 2)).all()
+    for row in rows:
+        months[int(row[0])] = {field: row[i + 1] or 0 for i, field in enumerate(METRIC_FIELDS)}
+    return {'this_month': months[today.month], 'months': months}
+
+
+def refresh_metrics_job(context):
+    """Задача JobQueue: пересчитывает метрики последних дней"""
+    try:
+        refresh_recent_metrics()
+    except Exception as e:
+        logger.error(f"[METRICS] Ошибка при обновлении метрик панели: {e}")
+
+
+def schedule_metrics_refresh(job_queue):
+    """Регистрирует периодический пересчет метрик в JobQueue бота"""
+    return job_queue.run_repeating(
+        refresh_metrics_job,
+        interval=METRICS_REFRESH_INTERVAL,
+        first=30,
+        name="dashboard_metrics"
+    )
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Перенос данных блогеров в основную базу (режим BLOGGERS_SINGLE_DB)
+
+Исторически атрибуция разнесена по трем файлам: health_bot.db (users и
+модели Blogger/BloggerReferral), willway_bloggers.db (блогеры, переходы,
+выплаты) и database.db (blogger_referral_codes). Скрипт один раз переносит
+блогеров, их переходы, выплаты и реферальные коды в основную базу, после
+чего можно включить BLOGGERS_SINGLE_DB=1: весь код блогеров работает с одним
+файлом, а конверсия ищется и записывается одной транзакцией.
+
+- Блогер с тем же access_key в основной базе не дублируется: его переходы
+  и выплаты привязываются к существующей записи.
+- id блогера сохраняется, если он свободен, иначе назначается новый.
+- Колонки разных версий схемы сопоставляются по COLUMN_ALIASES.
+- Перенос выполняется одной транзакцией и отмечается в blogger_db_merges,
+  повторный запуск для того же файла ничего не делает (--force - перенести
+  еще раз).
+
+Запуск:
+    python database/merge_bloggers_db.py [--dry-run] [--force]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import DATABASE_PATH, LEGACY_BLOGGERS_DB_PATH, MAIN_DATABASE_PATH
+from database.blogger_attribution import parse_referral_user_id
+from database.blogger_daily_stats import rebuild_daily_stats
+from database.migrations import migrate_bloggers_database
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MERGES_TABLE = "blogger_db_merges"
+
+# Колонка основной базы -> колонки старых файлов, из которых берется значение
+COLUMN_ALIASES = {
+    'bloggers': {
+        'registration_date': ('registration_date', 'join_date', 'created_at'),
+        'join_date': ('join_date', 'registration_date', 'created_at'),
+        'created_at': ('created_at', 'join_date', 'registration_date'),
+    },
+    'blogger_referrals': {
+        'created_at': ('created_at', 'referral_date', 'date_added'),
+        'converted_at': ('converted_at', 'conversion_date'),
+        'conversion_date': ('conversion_date', 'converted_at'),
+        'commission_amount': ('commission_amount', 'commission_earned', 'commission'),
+        'commission': ('commission', 'commission_amount', 'commission_earned'),
+    },
+    'blogger_payments': {
+        'created_at': ('created_at', 'payment_date'),
+    },
+}
+
+
+def _columns(conn, table, schema='main'):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")').fetchall()]
+
+
+def _column_mapping(conn, table, schema):
+    """Пары (колонка основной базы, колонка старого файла) без id"""
+    source_columns = set(_columns(conn, table, schema))
+    aliases = COLUMN_ALIASES.get(table, {})
+    mapping = []
+    for column in _columns(conn, table):
+        if column == 'id':
+            continue
+        source = next((c for c in aliases.get(column, (column,)) if c in source_columns), None)
+        if source:
+            mapping.append((column, source))
+    return mapping
+
+
+def _copy_rows(conn, table, schema, blogger_map):
+    """Копирует строки таблицы блогера с заменой blogger_id; возвращает (скопировано, пропущено)"""
+    mapping = _column_mapping(conn, table, schema)
+    targets = [target for target, _ in mapping]
+    blogger_index = targets.index('blogger_id')
+    user_index = targets.index('user_id') if 'user_id' in targets else None
+    source_index = targets.index('source') if 'source' in targets else None
+
+    rows = []
+    skipped = 0
+    select = ", ".join(f'"{source}"' for _, source in mapping)
+    for row in conn.execute(f'SELECT {select} FROM {schema}."{table}" ORDER BY id').fetchall():
+        row = list(row)
+        if row[blogger_index] not in blogger_map:
+            skipped += 1
+            continue
+        row[blogger_index] = blogger_map[row[blogger_index]]
+        if user_index is not None and not row[user_index] and source_index is not None:
+            row[user_index] = parse_referral_user_id(row[source_index])
+        rows.append(row)
+
+    placeholders = ", ".join("?" * len(targets))
+    conn.executemany(
+        f'INSERT INTO "{table}" ({", ".join(targets)}) VALUES ({placeholders})', rows
+    )
+    return len(rows), skipped
+
+
+def _merge_bloggers(conn, schema):
+    """Переносит блогеров; возвращает {id в старом файле: id в основной базе}"""
+    mapping = _column_mapping(conn, 'bloggers', schema)
+    targets = [target for target, _ in mapping]
+    select = ", ".join(f'"{source}"' for _, source in mapping)
+    existing = dict(conn.execute("SELECT access_key, id FROM bloggers").fetchall())
+    taken = {row[0] for row in conn.execute("SELECT id FROM bloggers").fetchall()}
+
+    blogger_map = {}
+    for row in conn.execute(f'SELECT id, {select} FROM {schema}.bloggers ORDER BY id').fetchall():
+        legacy_id, values = row[0], list(row[1:])
+        access_key = values[targets.index('access_key')]
+        if access_key in existing:
+            blogger_map[legacy_id] = existing[access_key]
+            continue
+        columns = list(targets)
+        if legacy_id not in taken:
+            columns.insert(0, 'id')
+            values.insert(0, legacy_id)
+        cursor = conn.execute(
+            f'INSERT INTO bloggers ({", ".join(columns)}) VALUES ({", ".join("?" * len(values))})', values
+        )
+        blogger_map[legacy_id] = cursor.lastrowid
+        taken.add(cursor.lastrowid)
+        existing[access_key] = cursor.lastrowid
+    return blogger_map
+
+
+def _merge_referral_codes(conn, schema, blogger_map):
+    """Переносит blogger_referral_codes из database.db"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blogger_referral_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            blogger_id INTEGER NOT NULL,
+            code TEXT UNIQUE NOT NULL
+        )
+    """)
+    copied = 0
+    skipped = 0
+    for blogger_id, code in conn.execute(f"SELECT blogger_id, code FROM {schema}.blogger_referral_codes").fetchall():
+        if blogger_id not in blogger_map or not code:
+            skipped += 1
+            continue
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO blogger_referral_codes (blogger_id, code) VALUES (?, ?)",
+            (blogger_map[blogger_id], code)
+        )
+        copied += cursor.rowcount
+    return copied, skipped
+
+
+def _already_merged(conn, source_path):
+    return conn.execute(f"SELECT 1 FROM {MERGES_TABLE} WHERE source = ?", (source_path,)).fetchone() is not None
+
+
+def merge_bloggers_into_main(main_path=MAIN_DATABASE_PATH, bloggers_path=LEGACY_BLOGGERS_DB_PATH,
+                             codes_path=DATABASE_PATH, dry_run=False, force=False):
+    """
+    Переносит данные блогеров из старых файлов в основную базу.
+
+    Returns:
+        dict: Количество перенесенных записей по таблицам
+    """
+    if not main_path:
+        raise ValueError("Основная база должна быть SQLite (DATABASE_URL=sqlite:///...)")
+    main_path = os.path.abspath(main_path)
+    if os.path.abspath(bloggers_path) == main_path:
+        raise ValueError("Файл базы блогеров совпадает с основной базой")
+
+    conn = sqlite3.connect(main_path)
+    report = {}
+    try:
+        # Таблицы и колонки, которые ожидает код блогеров
+        if not migrate_bloggers_database(conn):
+            raise RuntimeError("Не удалось подготовить схему основной базы")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MERGES_TABLE} (
+                source TEXT PRIMARY KEY,
+                merged_at TIMESTAMP,
+                bloggers INTEGER,
+                referrals INTEGER,
+                payments INTEGER,
+                referral_codes INTEGER
+            )
+        """)
+        conn.commit()
+
+        bloggers_path = os.path.abspath(bloggers_path)
+        if not os.path.exists(bloggers_path):
+            logger.info(f"Файл {bloggers_path} не найден, переносить нечего")
+            return report
+        if _already_merged(conn, bloggers_path) and not force:
+            logger.info(f"Данные из {bloggers_path} уже перенесены (--force для повторного переноса)")
+            return report
+
+        conn.execute("ATTACH DATABASE ? AS legacy", (bloggers_path,))
+        codes_attached = bool(codes_path) and os.path.exists(codes_path)
+        if codes_attached:
+            conn.execute("ATTACH DATABASE ? AS codes", (os.path.abspath(codes_path),))
+
+        conn.execute("BEGIN IMMEDIATE")
+        legacy_tables = {row[0] for row in conn.execute(
+            "SELECT name FROM legacy.sqlite_master WHERE type='table'"
+        ).fetchall()}
+
+        blogger_map = _merge_bloggers(conn, 'legacy') if 'bloggers' in legacy_tables else {}
+        report['bloggers'] = len(blogger_map)
+
+        for table, key in (('blogger_referrals', 'referrals'), ('blogger_payments', 'payments')):
+            if table in legacy_tables:
+                copied, skipped = _copy_rows(conn, table, 'legacy', blogger_map)
+                report[key] = copied
+                if skipped:
+                    logger.warning(f"{table}: пропущено {skipped} записей без блогера")
+
+        if codes_attached and conn.execute(
+            "SELECT 1 FROM codes.sqlite_master WHERE type='table' AND name='blogger_referral_codes'"
+        ).fetchone():
+            copied, skipped = _merge_referral_codes(conn, 'codes', blogger_map)
+            report['referral_codes'] = copied
+            if skipped:
+                logger.warning(f"blogger_referral_codes: пропущено {skipped} кодов без блогера")
+
+        # Сводка панели блогеров считается заново по всем переходам
+        rebuild_daily_stats(conn, commit=False)
+
+        conn.execute(
+            f"INSERT OR REPLACE INTO {MERGES_TABLE} "
+            "(source, merged_at, bloggers, referrals, payments, referral_codes) VALUES (?, ?, ?, ?, ?, ?)",
+            (bloggers_path, datetime.now(), report.get('bloggers', 0), report.get('referrals', 0),
+             report.get('payments', 0), report.get('referral_codes', 0))
+        )
+
+        if dry_run:
+            conn.rollback()
+            logger.info(f"Проверка без записи: {report}")
+        else:
+            conn.commit()
+            logger.info(f"Данные блогеров перенесены в {main_path}: {report}")
+        return report
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос данных блогеров в основную базу")
+    parser.add_argument("--main", default=MAIN_DATABASE_PATH, help="Основная база (по умолчанию из DATABASE_URL)")
+    parser.add_argument("--bloggers", default=LEGACY_BLOGGERS_DB_PATH, help="Старая база блогеров")
+    parser.add_argument("--codes", default=DATABASE_PATH, help="База с blogger_referral_codes")
+    parser.add_argument("--dry-run", action="store_true", help="Выполнить перенос и откатить транзакцию")
+    parser.add_argument("--force", action="store_true", help="Перенести повторно")
+    args = parser.parse_args()
+
+    merge_bloggers_into_main(args.main, args.bloggers, args.codes, dry_run=args.dry_run, force=args.force)
+    print("После проверки включите BLOGGERS_SINGLE_DB=1 и перезапустите бота и веб-приложение")
@@ -2,7 +2,7 @@ import os
 import sys
 import logging
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, MetaData, Table
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import sqlalchemy as sa
 
@@ -199,6 +199,351 @@ def update_admin_users_table():
         logger.error(f"Ошибка при обновлении таблицы admin_users: {str(e)}")
         return False
 
+def add_chat_history_indexes():
+    """Добавляет составные индексы (user_id, timestamp) в таблицы истории диалогов"""
+    try:
+        inspector = sa.inspect(engine)
+        tables = inspector.get_table_names()
+        
+        with engine.begin() as conn:
+            for table, index_name in (('message_history', 'ix_message_history_user_ts'),
+                                      ('chat_history', 'ix_chat_history_user_ts')):
+                if table not in tables:
+                    continue
+                existing = [idx['name'] for idx in inspector.get_indexes(table)]
+                if index_name not in existing:
+                    conn.execute(sa.text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} (user_id, timestamp)'))
+                    logger.info(f"Индекс {index_name} добавлен в таблицу {table}")
+        
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении индексов истории диалогов: {str(e)}")
+        return False
+
+# Индексы пересчета дневных метрик панели: (таблица, индекс, колонки)
+DASHBOARD_METRICS_INDEXES = (
+    ('users', 'ix_users_registration_date', ('registration_date',)),
+    ('users', 'ix_users_cancellation_date', ('cancellation_date',)),
+    ('payments', 'ix_payments_paid_at', ('paid_at',)),
+    ('payments', 'ix_payments_user_paid_at', ('user_id', 'paid_at')),
+)
+
+def add_dashboard_metrics_indexes():
+    """Индексы для пересчета дневных метрик и первоначальное заполнение daily_metrics"""
+    success = True
+    try:
+        inspector = sa.inspect(engine)
+        tables = inspector.get_table_names()
+        
+        with engine.begin() as conn:
+            for table, index_name, columns in DASHBOARD_METRICS_INDEXES:
+                if table not in tables:
+                    continue
+                table_columns = [col['name'] for col in inspector.get_columns(table)]
+                missing = [column for column in columns if column not in table_columns]
+                if missing:
+                    logger.warning(f"Индекс {index_name} пропущен: в таблице {table} нет колонок {', '.join(missing)}")
+                    continue
+                existing = [idx['name'] for idx in inspector.get_indexes(table)]
+                if index_name not in existing:
+                    conn.execute(sa.text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({", ".join(columns)})'))
+                    logger.info(f"Индекс {index_name} добавлен в таблицу {table}")
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении индексов метрик панели: {str(e)}")
+        success = False
+    
+    # Метрики панели за прошлые дни считаются один раз, дальше - инкрементально.
+    # Заполнение не зависит от индексов: без них пересчет только медленнее
+    try:
+        if 'daily_metrics' in sa.inspect(engine).get_table_names():
+            with engine.connect() as conn:
+                filled = conn.execute(sa.text("SELECT COUNT(*) FROM daily_metrics")).scalar()
+            if not filled:
+                from database.dashboard_metrics import rebuild_daily_metrics
+                rebuild_daily_metrics()
+    except Exception as e:
+        logger.error(f"Ошибка при заполнении метрик панели: {str(e)}")
+        success = False
+    
+    return success
+
+# Индексы горячих запросов: (таблица, индекс, колонки). Совпадают с __table_args__
+# моделей; database/check_query_plans.py проверяет, что запросы их используют
+HOT_QUERY_INDEXES = (
+    ('users', 'ix_users_subscribed_expires', ('is_subscribed', 'subscription_expires')),
+    ('users', 'ix_users_subscription_expires', ('subscription_expires',)),
+    ('users', 'ix_users_blogger_ref_code', ('blogger_ref_code',)),
+    ('payments', 'ix_payments_user_status_created', ('user_id', 'status', 'created_at')),
+    ('payments', 'ix_payments_status_created', ('status', 'created_at')),
+    ('referral_uses', 'ix_referral_uses_user_purchased', ('user_id', 'subscription_purchased')),
+    ('referral_uses', 'ix_referral_uses_referrer_id', ('referrer_id',)),
+    ('referral_uses', 'ix_referral_uses_code_id', ('referral_code_id',)),
+    ('referral_uses', 'ix_referral_uses_referred_id', ('referred_id',)),
+)
+
+def add_hot_query_indexes():
+    """Индексы для выборок по подписке, платежам и реферальным приглашениям"""
+    try:
+        inspector = sa.inspect(engine)
+        tables = inspector.get_table_names()
+
+        with engine.begin() as conn:
+            for table, index_name, columns in HOT_QUERY_INDEXES:
+                if table not in tables:
+                    continue
+                table_columns = [col['name'] for col in inspector.get_columns(table)]
+                missing = [column for column in columns if column not in table_columns]
+                if missing:
+                    logger.warning(f"Индекс {index_name} пропущен: в таблице {table} нет колонок {', '.join(missing)}")
+                    continue
+                existing = [idx['name'] for idx in inspector.get_indexes(table)]
+                if index_name not in existing:
+                    conn.execute(sa.text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({", ".join(columns)})'))
+                    logger.info(f"Индекс {index_name} добавлен в таблицу {table}")
+
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении индексов горячих запросов: {str(e)}")
+        return False
+
+def add_pending_notification_columns():
+    """Добавляет в pending_notifications колонки очереди отправки и индекс для выборки"""
+    try:
+        inspector = sa.inspect(engine)
+        if 'pending_notifications' not in inspector.get_table_names():
+            return True
+        
+        columns = [col['name'] for col in inspector.get_columns('pending_notifications')]
+        new_columns = (
+            ('next_attempt_at', 'DATETIME'),
+            ('locked_until', 'DATETIME'),
+            ('claim_token', 'VARCHAR(36)'),
+            ('last_error', 'TEXT'),
+            ('dead_lettered_at', 'DATETIME')
+        )
+        
+        with engine.begin() as conn:
+            for name, column_type in new_columns:
+                if name not in columns:
+                    conn.execute(sa.text(f'ALTER TABLE pending_notifications ADD COLUMN {name} {column_type}'))
+                    logger.info(f"Колонка {name} добавлена в таблицу pending_notifications")
+            
+            existing = [idx['name'] for idx in inspector.get_indexes('pending_notifications')]
+            if 'ix_pending_notifications_queue' not in existing:
+                conn.execute(sa.text('CREATE INDEX IF NOT EXISTS ix_pending_notifications_queue '
+                                     'ON pending_notifications (sent, next_attempt_at)'))
+                logger.info("Индекс ix_pending_notifications_queue добавлен в таблицу pending_notifications")
+        
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении таблицы pending_notifications: {str(e)}")
+        return False
+
+def add_blogger_referral_user_id():
+    """
+    Добавляет в blogger_referrals колонку user_id с индексом (user_id, created_at)
+    и заполняет ее для старых записей по значению source
+    """
+    from database.blogger_attribution import BLOGGER_REFERRAL_USER_INDEX, backfill_referral_user_ids
+    try:
+        inspector = sa.inspect(engine)
+        if 'blogger_referrals' not in inspector.get_table_names():
+            return True
+        
+        columns = [col['name'] for col in inspector.get_columns('blogger_referrals')]
+        with engine.begin() as conn:
+            if 'user_id' not in columns:
+                conn.execute(sa.text('ALTER TABLE blogger_referrals ADD COLUMN user_id VARCHAR(50)'))
+                logger.info("Колонка user_id добавлена в таблицу blogger_referrals")
+            
+            if 'source' in columns:
+                updated = backfill_referral_user_ids(conn, sa.text)
+                if updated:
+                    logger.info(f"Заполнен user_id у {updated} записей blogger_referrals")
+            
+            existing = [idx['name'] for idx in inspector.get_indexes('blogger_referrals')]
+            if BLOGGER_REFERRAL_USER_INDEX not in existing:
+                order_column = 'created_at' if 'created_at' in columns else 'id'
+                conn.execute(sa.text(f'CREATE INDEX IF NOT EXISTS {BLOGGER_REFERRAL_USER_INDEX} '
+                                     f'ON blogger_referrals (user_id, {order_column})'))
+                logger.info(f"Индекс {BLOGGER_REFERRAL_USER_INDEX} добавлен в таблицу blogger_referrals")
+        
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении user_id в таблицу blogger_referrals: {str(e)}")
+        return False
+
+# Колонки, которые код работы с блогерами ожидает в willway_bloggers.db
+# (в старых копиях базы часть из них отсутствует)
+BLOGGERS_DB_COLUMNS = {
+    'bloggers': {
+        'email': 'TEXT',
+        'registration_date': 'TIMESTAMP',
+        'total_earned': 'REAL DEFAULT 0',
+        'total_referrals': 'INTEGER DEFAULT 0',
+        'total_conversions': 'INTEGER DEFAULT 0',
+        'is_active': 'BOOLEAN DEFAULT 1',
+    },
+    'blogger_referrals': {
+        'user_id': 'TEXT',
+        'source': 'TEXT',
+        'created_at': 'TIMESTAMP',
+        'converted': 'BOOLEAN DEFAULT 0',
+        'converted_at': 'TIMESTAMP',
+        'conversion_date': 'TIMESTAMP',
+        'commission': 'REAL DEFAULT 0',
+        'commission_amount': 'REAL DEFAULT 0',
+        'status': "TEXT DEFAULT 'pending'",
+    },
+}
+
+def migrate_bloggers_database(conn):
+    """
+    Приводит базу блогеров (sqlite3-соединение) к актуальной схеме:
+    создает таблицы, добавляет недостающие колонки и индексы.
+    Вызывается один раз на процесс из database/sqlite_schema.py.
+    """
+    from database.blogger_daily_stats import ensure_daily_stats_table
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS bloggers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                telegram_id TEXT,
+                email TEXT,
+                access_key TEXT UNIQUE NOT NULL,
+                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                total_earned REAL DEFAULT 0,
+                total_referrals INTEGER DEFAULT 0,
+                total_conversions INTEGER DEFAULT 0,
+                is_active BOOLEAN DEFAULT 1
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS blogger_referrals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                blogger_id INTEGER NOT NULL,
+                user_id TEXT,
+                source TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                converted BOOLEAN DEFAULT 0,
+                converted_at TIMESTAMP,
+                conversion_date TIMESTAMP,
+                commission REAL DEFAULT 0,
+                commission_amount REAL DEFAULT 0,
+                status TEXT DEFAULT 'pending',
+                FOREIGN KEY (blogger_id) REFERENCES bloggers (id)
+            )
+        """)
+        
+        for table, expected in BLOGGERS_DB_COLUMNS.items():
+            columns = [column[1] for column in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+            for column, ddl in expected.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+                    logger.info(f"Колонка {column} добавлена в таблицу {table} базы блогеров")
+            
+            # created_at нельзя добавить с DEFAULT CURRENT_TIMESTAMP - заполняем один раз
+            if table == 'blogger_referrals' and 'created_at' not in columns:
+                fallback = [c for c in ('referral_date', 'date_added') if c in columns]
+                conn.execute(
+                    f"UPDATE blogger_referrals SET created_at = COALESCE({', '.join(fallback + ['CURRENT_TIMESTAMP'])}) "
+                    "WHERE created_at IS NULL"
+                )
+        
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_blogger_referrals_blogger_user "
+                     "ON blogger_referrals (blogger_id, user_id)")
+        conn.commit()
+        
+        # Дневная сводка статистики (создается и заполняется при первом запуске)
+        ensure_daily_stats_table(conn)
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Ошибка при миграции базы блогеров: {str(e)}")
+        return False
+
+def migrate_bloggers_db():
+    """Миграция базы блогеров из run_migrations"""
+    import sqlite3
+    from config import BLOGGERS_DB_PATH
+    conn = sqlite3.connect(BLOGGERS_DB_PATH)
+    try:
+        return migrate_bloggers_database(conn)
+    finally:
+        conn.close()
+
+# Записи одного сообщения в message_history и chat_history сохранялись в разное время
+# (до и после запроса к модели), поэтому дубликаты ищутся в пределах этого окна
+CHAT_HISTORY_DEDUP_WINDOW = timedelta(minutes=5)
+
+def merge_message_history_into_chat_history():
+    """
+    Переносит записи message_history в единый журнал chat_history.
+    
+    Сообщение, уже записанное в chat_history (тот же пользователь, роль и текст
+    в пределах CHAT_HISTORY_DEDUP_WINDOW), не дублируется. Перенос и очистка
+    message_history выполняются в одной транзакции, повторный запуск безопасен.
+    Заодно удаляются полные дубликаты внутри chat_history.
+    """
+    try:
+        inspector = sa.inspect(engine)
+        tables = inspector.get_table_names()
+        if 'message_history' not in tables or 'chat_history' not in tables:
+            return True
+        
+        reflected = MetaData()
+        legacy = Table('message_history', reflected, autoload_with=engine)
+        chat = Table('chat_history', reflected, autoload_with=engine)
+        moved = skipped = 0
+        
+        with engine.begin() as conn:
+            user_ids = [row[0] for row in conn.execute(sa.select(legacy.c.user_id).distinct())]
+            
+            for user_id in user_ids:
+                # Уже записанные сообщения пользователя: (роль, текст) -> список времен
+                existing = {}
+                for row in conn.execute(
+                    sa.select(chat.c.role, chat.c.content, chat.c.timestamp).where(chat.c.user_id == user_id)
+                ):
+                    existing.setdefault((row.role, row.content), []).append(row.timestamp)
+                
+                batch = []
+                for row in conn.execute(
+                    sa.select(legacy.c.role, legacy.c.content, legacy.c.timestamp)
+                    .where(legacy.c.user_id == user_id)
+                    .order_by(legacy.c.timestamp)
+                ):
+                    stamps = existing.get((row.role, row.content), [])
+                    match = next((i for i, ts in enumerate(stamps)
+                                  if ts and row.timestamp and abs(ts - row.timestamp) <= CHAT_HISTORY_DEDUP_WINDOW), None)
+                    if match is not None:
+                        # Каждая запись chat_history закрывает не больше одной записи message_history
+                        stamps.pop(match)
+                        skipped += 1
+                        continue
+                    batch.append({'user_id': user_id, 'role': row.role, 'content': row.content, 'timestamp': row.timestamp})
+                
+                if batch:
+                    conn.execute(chat.insert(), batch)
+                    moved += len(batch)
+            
+            conn.execute(legacy.delete())
+            
+            # Полные дубликаты внутри chat_history
+            duplicates = conn.execute(sa.text(
+                "DELETE FROM chat_history WHERE id NOT IN "
+                "(SELECT MIN(id) FROM chat_history GROUP BY user_id, role, content, timestamp)"
+            )).rowcount
+        
+        if moved or skipped or duplicates:
+            logger.info(f"История message_history перенесена в chat_history: перенесено {moved}, "
+                        f"пропущено дубликатов {skipped}, удалено дубликатов chat_history {duplicates}")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при переносе message_history в chat_history: {str(e)}")
+        return False
+
 def check_bloggers_flask_app():
     try:
         # Создаем файл с инициализацией Flask и SQLAlchemy для блогеров
@@ -238,7 +583,7 @@ def create_all_tables():
     try:
         # Импортируем здесь, чтобы избежать циклического импорта
         from database.db import db
-        from database.models import User, ReferralCode, ReferralUse, AdminUser, Blogger, BloggerReferral, BloggerPayment, Payment
+        from database.models import User, ReferralCode, ReferralUse, AdminUser, Blogger, BloggerReferral, BloggerPayment, Payment, ConversationSummary, OutboundMessage, Broadcast, PendingNotification, DailyMetric, SubscriptionSweep
         
         # Создаем движок SQLAlchemy и соединение с базой данных
         from flask import Flask
@@ -274,6 +619,27 @@ def run_migrations():
         # Обновляем таблицы реферальной системы
         create_referral_tables()
         
+        # Индексы для чтения истории диалогов
+        add_chat_history_indexes()
+        
+        # Единый журнал диалогов
+        merge_message_history_into_chat_history()
+        
+        # Очередь отложенных уведомлений
+        add_pending_notification_columns()
+        
+        # Дневные метрики панели администратора
+        add_dashboard_metrics_indexes()
+
+        # Индексы для выборок по подписке, платежам и рефералам
+        add_hot_query_indexes()
+
+        # Поиск конверсий блогеров по пользователю
+        add_blogger_referral_user_id()
+        
+        # Схема базы блогеров (willway_bloggers.db)
+        migrate_bloggers_db()
+        
         # Проверяем настройку Flask app для блогеров
         check_bloggers_flask_app()
         
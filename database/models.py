@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, create_engine, ForeignKey, Float, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, create_engine, ForeignKey, Float, BigInteger, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime
 import os
+import threading
 from dotenv import load_dotenv
 import random
 import string
@@ -12,6 +16,13 @@ from database.db import db
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///health_bot.db")
+
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 Base = declarative_base()
 
 # Функция для генерации уникального ключа доступа
@@ -19,6 +30,10 @@ def generate_access_key(length=16):
     return secrets.token_hex(length)
 
 class MessageHistory(db.Model):
+    """
+    Устаревшая таблица истории. Журнал диалогов ведется в chat_history (ChatHistory),
+    старые записи переносятся туда миграцией merge_message_history_into_chat_history
+    """
     __tablename__ = 'message_history'
     
     id = Column(Integer, primary_key=True)
@@ -27,6 +42,11 @@ class MessageHistory(db.Model):
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.now)
     
+    # История читается одним диапазонным сканированием по (user_id, timestamp)
+    __table_args__ = (
+        Index('ix_message_history_user_ts', 'user_id', 'timestamp'),
+    )
+    
     # Связь с пользователем определим после объявления класса User
     
     def __repr__(self):
@@ -90,6 +110,16 @@ class User(db.Model):
     referral_uses = relationship("ReferralUse", back_populates="user", foreign_keys="ReferralUse.user_id")
     referred_users = relationship("ReferralUse", back_populates="referrer", foreign_keys="ReferralUse.referrer_id")
 
+    __table_args__ = (
+        # Пересчет дневных метрик по диапазону дат
+        Index('ix_users_registration_date', 'registration_date'),
+        Index('ix_users_cancellation_date', 'cancellation_date'),
+        # Фильтры по подписке (активные, истекающие, истекшие) и поиск по коду блогера
+        Index('ix_users_subscribed_expires', 'is_subscribed', 'subscription_expires'),
+        Index('ix_users_subscription_expires', 'subscription_expires'),
+        Index('ix_users_blogger_ref_code', 'blogger_ref_code'),
+    )
+
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username})>"
 
@@ -155,6 +185,14 @@ class ReferralUse(db.Model):
     code = relationship("ReferralCode", back_populates="uses", foreign_keys=[referral_code_id])
     user = relationship("User", foreign_keys=[user_id])
     referrer = relationship("User", foreign_keys=[referrer_id])
+
+    __table_args__ = (
+        # Поиск приглашения пользователя, рефералов пригласившего и счетчики по кодам
+        Index('ix_referral_uses_user_purchased', 'user_id', 'subscription_purchased'),
+        Index('ix_referral_uses_referrer_id', 'referrer_id'),
+        Index('ix_referral_uses_code_id', 'referral_code_id'),
+        Index('ix_referral_uses_referred_id', 'referred_id'),
+    )
     
     def __repr__(self):
         return f"<ReferralUse(id={self.id}, referral_code_id={self.referral_code_id}, user_id={self.user_id})>"
@@ -187,10 +225,36 @@ class Payment(db.Model):
     # Связь с пользователем
     user = relationship("User", back_populates="payments")
 
+    __table_args__ = (
+        # Выручка по дням и поиск предыдущей оплаты пользователя
+        Index('ix_payments_paid_at', 'paid_at'),
+        Index('ix_payments_user_paid_at', 'user_id', 'paid_at'),
+        # Платежи пользователя и очередь платежей по статусу
+        Index('ix_payments_user_status_created', 'user_id', 'status', 'created_at'),
+        Index('ix_payments_status_created', 'status', 'created_at'),
+    )
+
     def __repr__(self):
         return f"<Payment(id={self.id}, user_id={self.user_id}, amount={self.amount}, status={self.status})>"
 
+class DailyMetric(db.Model):
+    """Дневные метрики панели администратора (database/dashboard_metrics.py)"""
+    __tablename__ = 'daily_metrics'
+
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    registrations = Column(Integer, nullable=False, default=0)
+    new_subscriptions = Column(Integer, nullable=False, default=0)  # первая оплата пользователя
+    renewals = Column(Integer, nullable=False, default=0)  # повторные оплаты
+    cancellations = Column(Integer, nullable=False, default=0)
+    payments = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<DailyMetric(day={self.day}, registrations={self.registrations}, revenue={self.revenue})>"
+
 class ChatHistory(db.Model):
+    """Единый журнал диалогов с Health ассистентом (только добавление записей)"""
     __tablename__ = 'chat_history'
     
     id = Column(Integer, primary_key=True)
@@ -198,6 +262,24 @@ class ChatHistory(db.Model):
     role = Column(String(20))  # 'system', 'user', 'assistant'
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('ix_chat_history_user_ts', 'user_id', 'timestamp'),
+    )
+
+class ConversationSummary(db.Model):
+    """Сжатое содержание старой части диалога с Health ассистентом"""
+    __tablename__ = 'conversation_summaries'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String(50), unique=True, nullable=False, index=True)  # ID пользователя в Telegram
+    summary = Column(Text, nullable=False, default="")
+    summarized_until = Column(DateTime, nullable=True)  # Время последнего учтенного в summary сообщения
+    summarized_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f"<ConversationSummary(user_id={self.user_id}, summarized_until={self.summarized_until})>"
 
 class Blogger(db.Model):
     __tablename__ = 'bloggers'
@@ -225,11 +307,17 @@ class BloggerReferral(db.Model):
     id = Column(Integer, primary_key=True, autoincrement=True)
     blogger_id = Column(Integer, ForeignKey('bloggers.id'), nullable=False)
     source = Column(String(100), nullable=True)  # Источник перехода (опционально)
+    user_id = Column(String(50), nullable=True)  # Telegram ID пришедшего пользователя
     created_at = Column(DateTime, default=datetime.now)
     converted = Column(Boolean, default=False)
     converted_at = Column(DateTime, nullable=True)
     commission_amount = Column(Float, default=0)
     
+    # Конверсия ищется по пользователю (см. database/blogger_attribution.py)
+    __table_args__ = (
+        Index('ix_blogger_referrals_user_created', 'user_id', 'created_at'),
+    )
+    
     # Отношения
     blogger = relationship("Blogger", back_populates="referrals")
 
@@ -263,16 +351,240 @@ class PendingNotification(db.Model):
     sent = Column(Boolean, default=False)
     sent_at = Column(DateTime, nullable=True)
     retries = Column(Integer, default=0)
+    # Очередь отправки (см. bot/notification_dispatcher.py)
+    next_attempt_at = Column(DateTime, nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # аренда пачки отправителем
+    claim_token = Column(String(36), nullable=True)
+    last_error = Column(Text, nullable=True)
+    dead_lettered_at = Column(DateTime, nullable=True)  # отправка прекращена после ошибок
+    
+    __table_args__ = (
+        Index('ix_pending_notifications_queue', 'sent', 'next_attempt_at'),
+    )
     
     def __repr__(self):
         return f"<PendingNotification(id={self.id}, user_id={self.user_id}, type={self.message_type}, sent={self.sent})>"
 
+class OutboundMessage(db.Model):
+    """Исходящее сообщение Telegram в очереди отправки (см. bot/outbound_queue.py)"""
+    __tablename__ = 'outbound_messages'
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False, index=True)
+    payload = Column(Text, nullable=False)  # JSON: text, parse_mode, reply_markup, disable_web_page_preview
+    idempotency_key = Column(String(200), unique=True, nullable=True)
+    status = Column(String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.now)
+    locked_until = Column(DateTime, nullable=True)  # аренда записи отправителем
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_outbound_messages_status_next', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f"<OutboundMessage(id={self.id}, chat_id={self.chat_id}, status={self.status})>"
+
+class Broadcast(db.Model):
+    """Рассылка из админ-панели и ее прогресс (см. web_admin/broadcast.py)"""
+    __tablename__ = 'broadcasts'
+
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(20), nullable=True)
+    reply_markup = Column(Text, nullable=True)  # JSON разметки Bot API
+    audience = Column(String(20), nullable=False, default='all')  # all, subscribers, custom
+    recipient_ids = Column(Text, nullable=True)  # JSON список users.id для выборочной рассылки
+    status = Column(String(20), nullable=False, default='running', index=True)  # running, paused, cancelled, completed, failed
+    last_user_id = Column(Integer, default=0)  # курсор: последний обработанный users.id
+    max_user_id = Column(Integer, default=0)  # получатели - пользователи, существовавшие при создании
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    blocked = Column(Integer, default=0)
+    created_by = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now)
+    locked_until = Column(DateTime, nullable=True)  # аренда рассылки процессом-отправителем
+    last_error = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"<Broadcast(id={self.id}, status={self.status}, sent={self.sent}/{self.total})>"
+
+class SubscriptionSweep(db.Model):
+    """Проход проверки подписок и его прогресс (см. bot/subscription_sweeper.py)"""
+    __tablename__ = 'subscription_sweeps'
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, default='running', index=True)  # running, completed, failed
+    phase = Column(String(20), nullable=True)  # expire, remind_3d, remind_1d
+    cursor_expires = Column(DateTime, nullable=True)  # курсор: последний обработанный (subscription_expires, users.id)
+    cursor_user_id = Column(Integer, nullable=True)
+    deactivated = Column(Integer, default=0)
+    reminders = Column(Integer, default=0)
+    started_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"<SubscriptionSweep(id={self.id}, status={self.status}, deactivated={self.deactivated}, reminders={self.reminders})>"
+
 # Создание движка и таблиц базы данных
-engine = create_engine(DATABASE_URL)
+def create_db_engine(database_url=DATABASE_URL):
+    """
+    Создает движок с пулом соединений.
+
+    SQLite: WAL-журнал, busy_timeout и PRAGMA на каждое новое соединение.
+    PostgreSQL и другие СУБД: QueuePool фиксированного размера с pre-ping.
+    """
+    if database_url.startswith("sqlite"):
+        is_memory = database_url in ("sqlite://", "sqlite:///:memory:")
+        pool_options = {} if is_memory else {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+        sqlite_engine = create_engine(
+            database_url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            **pool_options
+        )
+
+        @event.listens_for(sqlite_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not is_memory:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA cache_size=-16000")
+            cursor.close()
+
+        return sqlite_engine
+
+    return create_engine(
+        database_url,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+engine = create_db_engine()
 Session = sessionmaker(bind=engine)
 
 def init_db():
     db.create_all()
 
+# Контекст сессии на время обработки одного Telegram-апдейта или HTTP-запроса
+_scope_state = threading.local()
+
+class SessionScope:
+    """
+    Одна сессия и одно соединение из пула на весь апдейт/запрос.
+
+    Обработчики по-прежнему вызывают get_session()/close(), но внутри области
+    получают одну и ту же сессию. close() лишь отпускает ссылку: когда
+    закрыт последний пользователь, транзакция завершается (незакоммиченные
+    изменения откатываются), как это делала бы обычная сессия, а соединение
+    остается за областью. Следующий get_session() начинает новую транзакцию
+    и видит коммиты других процессов (в режиме WAL открытая транзакция
+    продолжала бы читать старый снимок базы).
+    """
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.connection = engine.connect()
+        self.session = Session(bind=self.connection)
+        self.refs = 0
+
+    def acquire(self):
+        self.refs += 1
+        return ScopedSession(self)
+
+    def release(self):
+        self.refs = max(self.refs - 1, 0)
+        if self.refs == 0:
+            self.session.rollback()
+
+    def close(self):
+        try:
+            self.session.close()
+        finally:
+            self.connection.close()
+
+class ScopedSession:
+    """Прокси к сессии области: close() не закрывает общую сессию"""
+
+    def __init__(self, scope):
+        self._scope = scope
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._scope.session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._scope.release()
+
+@contextmanager
+def session_scope():
+    """Открывает область сессии для текущего потока (вложенные вызовы переиспользуют ее)"""
+    current = getattr(_scope_state, "scope", None)
+    if current is not None:
+        yield current
+        return
+
+    scope = SessionScope()
+    _scope_state.scope = scope
+    try:
+        yield scope
+    finally:
+        _scope_state.scope = None
+        scope.close()
+
+def with_session_scope(func):
+    """Декоратор: выполняет функцию (например, Dispatcher.process_update) внутри session_scope()"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with session_scope():
+            return func(*args, **kwargs)
+    return wrapper
+
+def init_app_session_scope(app):
+    """Открывает общую сессию на каждый HTTP-запрос Flask-приложения"""
+    @app.before_request
+    def open_session_scope():
+        if getattr(_scope_state, "scope", None) is None:
+            _scope_state.scope = SessionScope(owner="request")
+
+    @app.teardown_request
+    def close_session_scope(exc=None):
+        scope = getattr(_scope_state, "scope", None)
+        if scope is not None and scope.owner == "request":
+            _scope_state.scope = None
+            scope.close()
+
+    return app
+
 def get_session():
+    scope = getattr(_scope_state, "scope", None)
+    if scope is not None:
+        return scope.acquire()
     return Session()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Реестр схемы SQLite баз (в первую очередь willway_bloggers.db)
+
+Код работы с блогерами подстраивается под разные версии таблиц и раньше на
+каждый вызов выполнял PRAGMA table_info и запросы к sqlite_master. Теперь
+схема читается один раз на файл базы за время жизни процесса, а для базы
+блогеров перед этим выполняется migrate_bloggers_database из
+database/migrations.py, которая добавляет недостающие таблицы и колонки.
+Вызывающий код получает готовое множество колонок из памяти.
+
+После собственного DDL вне миграций нужно вызвать refresh_schema(conn).
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+class SqliteSchema:
+    """Снимок схемы: имя таблицы -> frozenset колонок"""
+
+    def __init__(self, tables):
+        self._tables = tables
+
+    @property
+    def tables(self):
+        return frozenset(self._tables)
+
+    def has_table(self, table):
+        return table in self._tables
+
+    def columns(self, table):
+        """Колонки таблицы (пустое множество, если таблицы нет)"""
+        return self._tables.get(table, frozenset())
+
+    def has_column(self, table, column):
+        return column in self.columns(table)
+
+
+def _database_key(conn):
+    # У соединений из пула (database/bloggers_db.py) путь уже известен
+    path = getattr(conn, 'database_path', None)
+    if path:
+        return path
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else None
+
+
+def introspect(conn):
+    """Читает схему базы: один запрос к sqlite_master и PRAGMA на таблицу"""
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()]
+    tables = {}
+    for name in names:
+        tables[name] = frozenset(column[1] for column in conn.execute(f'PRAGMA table_info("{name}")').fetchall())
+    return SqliteSchema(tables)
+
+
+def get_schema(conn, migrate=None):
+    """
+    Схема базы соединения conn из кэша процесса.
+    При первом обращении к файлу выполняет migrate(conn), если она передана.
+    """
+    key = _database_key(conn)
+    schema = _schemas.get(key)
+    if schema is not None:
+        return schema
+    with _schemas_lock:
+        schema = _schemas.get(key)
+        if schema is None:
+            if migrate is not None:
+                migrate(conn)
+            schema = introspect(conn)
+            _schemas[key] = schema
+            logger.info(f"Схема базы {key} загружена: {len(schema.tables)} таблиц")
+        return schema
+
+
+def get_bloggers_schema(conn):
+    """Схема базы блогеров; при первом обращении база приводится к актуальной схеме"""
+    from database.migrations import migrate_bloggers_database
+    return get_schema(conn, migrate=migrate_bloggers_database)
+
+
+def refresh_schema(conn):
+    """Перечитывает схему базы после изменения структуры"""
+    key = _database_key(conn)
+    schema = introspect(conn)
+    with _schemas_lock:
+        _schemas[key] = schema
+    return schema
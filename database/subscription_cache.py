@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Кэш статуса подписки для "горячих" пользователей
+
+Проверки доступа (Health ассистент, меню) выполняются на каждое сообщение,
+поэтому статус подписки читается из памяти, а запрос к таблице users
+выполняется только при промахе. Кэш ограничен по размеру (LRU) и по времени
+жизни записи (TTL). Все места, которые меняют подписку, должны вызывать
+invalidate_subscription(user_id) после commit; статус, прочитанный из базы
+до такого сброса, в кэш не попадает.
+
+Кэш живет в памяти процесса: бот и Flask-приложение, запущенные через
+run_bot.py, используют один экземпляр. Для других процессов устаревание
+ограничено TTL.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from time import monotonic
+
+from database.models import User, get_session
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_CACHE_TTL = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "60"))
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000"))
+
+# Снимок полей подписки пользователя
+SubscriptionStatus = namedtuple(
+    "SubscriptionStatus", ["is_subscribed", "subscription_expires", "subscription_type"]
+)
+
+
+class SubscriptionCache:
+    """Потокобезопасный TTL+LRU кэш статуса подписки по Telegram ID"""
+
+    def __init__(self, ttl=SUBSCRIPTION_CACHE_TTL, maxsize=SUBSCRIPTION_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        # Увеличивается при каждом сбросе, чтобы не сохранить статус, прочитанный до изменения подписки
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id, loader):
+        """
+        Возвращает статус подписки из кэша, при промахе вызывает loader(user_id).
+        Отсутствующий пользователь (loader вернул None) тоже кэшируется.
+        """
+        key = str(user_id)
+        now = monotonic()
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            version = self._version
+
+        status = loader(key)
+        self.set(key, status, version)
+        return status
+
+    def set(self, user_id, status, version=None):
+        """Сохраняет статус; с version - только если с тех пор не было сброса"""
+        key = str(user_id)
+        with self._lock:
+            # Подписка могла измениться (оплата, отмена), пока loader читал базу
+            if version is not None and version != self._version:
+                return
+            self._data[key] = (monotonic() + self.ttl, status)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._version += 1
+            if self._data.pop(str(user_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._version += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+subscription_cache = SubscriptionCache()
+
+
+def load_subscription_status(user_id):
+    """Читает поля подписки пользователя из базы данных"""
+    session = get_session()
+    try:
+        row = session.query(
+            User.is_subscribed, User.subscription_expires, User.subscription_type
+        ).filter(User.user_id == str(user_id)).first()
+        if not row:
+            return None
+        return SubscriptionStatus(bool(row[0]), row[1], row[2])
+    finally:
+        session.close()
+
+
+def get_subscription_status(user_id):
+    """
+    Возвращает SubscriptionStatus пользователя (или None, если пользователь не найден).
+    Данные берутся из кэша, в базу запрос идет только при промахе.
+    """
+    return subscription_cache.get(user_id, load_subscription_status)
+
+
+def invalidate_subscription(user_id):
+    """Сбрасывает кэш подписки пользователя после изменения в базе"""
+    if user_id is None:
+        return
+    try:
+        subscription_cache.invalidate(user_id)
+    except Exception as e:
+        logger.error(f"Ошибка при сбросе кэша подписки пользователя {user_id}: {e}")
+
+
+def get_subscription_cache_stats():
+    """Счетчики попаданий/промахов кэша подписок"""
+    return subscription_cache.stats()
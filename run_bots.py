@@ -13,6 +13,7 @@ import subprocess
 import signal
 import time
 import threading
+from dotenv import load_dotenv
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,12 +27,33 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+load_dotenv()
+
+# Диспетчер отложенных уведомлений отдельным процессом вместо JobQueue бота
+NOTIFICATION_DISPATCHER_STANDALONE = os.getenv("NOTIFICATION_DISPATCHER_STANDALONE", "false").lower() in ("1", "true", "yes")
+
 def stream_output(stream, prefix):
     """Читает вывод процесса и выводит его в консоль с префиксом"""
     for line in iter(stream.readline, ''):
         if line:
             print(f"{prefix} | {line.strip()}")
 
+def start_notification_dispatcher(python_executable):
+    """Запускает диспетчер отложенных уведомлений (bot/notification_dispatcher.py)"""
+    process = subprocess.Popen(
+        [python_executable, '-m', 'bot.notification_dispatcher'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+    logger.info(f"Диспетчер отложенных уведомлений запущен, PID: {process.pid}")
+    threading.Thread(
+        target=stream_output,
+        args=(process.stdout, "[NOTIFY]"),
+        daemon=True
+    ).start()
+    return process
+
 def run_bots_manager():
     """Запускает систему управления ботами"""
     try:
@@ -70,6 +92,11 @@ def run_bots_manager():
         
         logger.info(f"Система мониторинга блогер-бота запущена, PID: {blogger_watcher_process.pid}")
         
+        # Диспетчер отложенных уведомлений отдельным процессом (иначе он работает в JobQueue бота)
+        notification_process = None
+        if NOTIFICATION_DISPATCHER_STANDALONE:
+            notification_process = start_notification_dispatcher(python_executable)
+        
         # Создаем поток для вывода логов блогер-бота
         blogger_thread = threading.Thread(
             target=stream_output,
@@ -103,6 +130,11 @@ def run_bots_manager():
                 )
                 main_bot_thread.start()
             
+            # Проверяем диспетчер уведомлений
+            if notification_process and notification_process.poll() is not None:
+                logger.warning(f"Диспетчер уведомлений завершился с кодом {notification_process.returncode}, перезапускаем...")
+                notification_process = start_notification_dispatcher(python_executable)
+            
             # Проверяем блогер-бот
             if blogger_watcher_process.poll() is not None:
                 exit_code = blogger_watcher_process.returncode
@@ -136,6 +168,11 @@ def run_bots_manager():
                     logger.warning("Основной бот не ответил на SIGTERM, принудительно завершаем...")
                     main_bot_process.kill()
             
+            # Останавливаем диспетчер уведомлений
+            if notification_process and notification_process.poll() is None:
+                logger.info(f"Остановка диспетчера уведомлений (PID: {notification_process.pid})...")
+                notification_process.terminate()
+            
             # Останавливаем блогер-бот
             if blogger_watcher_process and blogger_watcher_process.poll() is None:
                 logger.info(f"Остановка системы мониторинга блогер-бота (PID: {blogger_watcher_process.pid})...")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Общие фикстуры тестов
+
+database.models создает движок при импорте по DATABASE_URL, поэтому
+временная база SQLite задается здесь, до импорта модулей проекта.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_db_dir = tempfile.mkdtemp(prefix="willway-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+# bot.gpt_assistant создает клиент OpenAI при импорте; запросы тестов идут на локальные заглушки
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+
+from database.db import db
+from database.models import engine
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """Движок временной базы со схемой из моделей"""
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def clean_db(db_engine):
+    """Пустые таблицы перед каждым тестом"""
+    with db_engine.begin() as conn:
+        for table in reversed(db.metadata.sorted_tables):
+            conn.execute(table.delete())
+    return db_engine
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Движок Health ассистента (bot/assistant_engine.py) на локальной заглушке
+/v1/chat/completions: порядок запросов пользователя, ограничение очереди,
+таймаут и отмена.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import CancelledError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+import pytest
+
+from bot import gpt_assistant
+from bot.assistant_engine import AssistantBusyError, AssistantEngine, OpenAIChatBackend
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """
+    Заглушка chat completions: отвечает "Ответ: <последнее сообщение>"
+    через delay секунд и запоминает начало и конец каждого запроса
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.delay = 0.2
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def record(self, question, started, finished):
+        with self.lock:
+            self.requests.append((question, started, finished))
+
+    def started(self):
+        with self.lock:
+            return len(self.requests)
+
+    def wait_started(self, count, timeout=5):
+        deadline = monotonic() + timeout
+        while self.started() < count:
+            assert monotonic() < deadline, "Заглушка не получила запрос"
+            time.sleep(0.01)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/v1/chat/completions":
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        question = request["messages"][-1]["content"]
+        started = monotonic()
+        self.server.record(question, started, None)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            index = next(i for i, entry in enumerate(self.server.requests) if entry[1] == started)
+            self.server.requests[index] = (question, started, monotonic())
+
+        body = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Ответ: {question}"},
+                "finish_reason": "stop"
+            }]
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент отменил запрос
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def openai_api(monkeypatch):
+    server = FakeOpenAI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # Клиент движка создается заново и берет адрес из OPENAI_BASE_URL
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setattr(gpt_assistant, "_async_client", None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_engine(openai_api):
+    engines = []
+
+    def make(**options):
+        options.setdefault("rate_per_minute", 600)
+        options.setdefault("rate_burst", 10)
+        engine = AssistantEngine(OpenAIChatBackend(), **options)
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.stop()
+
+
+class Replies:
+    """Колбэки on_reply/on_error, запоминающие результаты по порядку"""
+
+    def __init__(self):
+        self.replies = []
+        self.errors = []
+
+    def on_reply(self, response):
+        self.replies.append(response)
+
+    def on_error(self, error):
+        self.errors.append(error)
+
+
+def submit(engine, user_id, text, replies):
+    return engine.submit(user_id, text, history_loader=lambda: [], on_reply=replies.on_reply,
+                         on_error=replies.on_error, use_cache=False)
+
+
+def test_requests_of_one_user_run_in_order(clean_db, openai_api, make_engine):
+    engine = make_engine()
+    first_user, other_user = Replies(), Replies()
+
+    first = submit(engine, 1, "первый", first_user)
+    openai_api.wait_started(1)
+    second = submit(engine, 1, "второй", first_user)
+    third = submit(engine, 1, "третий", first_user)
+    other = submit(engine, 2, "другой", other_user)
+
+    assert first.result(5) == "Ответ: первый"
+    # Пока первый запрос выполнялся, следующие сообщения объединились в один запрос
+    assert third is second
+    assert second.result(5) == "Ответ: второй\nтретий"
+    assert other.result(5) == "Ответ: другой"
+    assert first_user.replies == ["Ответ: первый", "Ответ: второй\nтретий"]
+
+    requests = {question: (started, finished) for question, started, finished in openai_api.requests}
+    # Следующий запрос пользователя начинается только после ответа на предыдущий
+    assert requests["второй\nтретий"][0] >= requests["первый"][1]
+    # Другой пользователь не ждет очереди первого
+    assert requests["другой"][0] < requests["первый"][1]
+
+
+def test_queue_limit_rejects_new_requests(clean_db, openai_api, make_engine):
+    openai_api.delay = 0.5
+    engine = make_engine(max_queue=2)
+    replies = Replies()
+
+    accepted = [submit(engine, user_id, "вопрос", replies) for user_id in (1, 2)]
+    with pytest.raises(AssistantBusyError) as busy:
+        submit(engine, 3, "вопрос", replies)
+
+    assert busy.value.reason == AssistantBusyError.OVERLOADED
+    assert engine.stats()["rejected"] == 1
+    for future in accepted:
+        future.result(5)
+    # После ответов очередь освобождается
+    assert submit(engine, 3, "вопрос", replies).result(5) == "Ответ: вопрос"
+
+
+def test_rate_limit_rejects_burst(clean_db, openai_api, make_engine):
+    engine = make_engine(rate_per_minute=1, rate_burst=1)
+    replies = Replies()
+
+    submit(engine, 1, "вопрос", replies).result(5)
+    with pytest.raises(AssistantBusyError) as busy:
+        submit(engine, 1, "еще вопрос", replies)
+
+    assert busy.value.reason == AssistantBusyError.RATE_LIMITED
+    assert busy.value.retry_after > 0
+
+
+def test_timeout_reports_error_and_frees_user_queue(clean_db, openai_api, make_engine):
+    openai_api.delay = 2
+    engine = make_engine(timeout=0.3)
+    replies = Replies()
+
+    future = submit(engine, 1, "долгий", replies)
+    with pytest.raises(TimeoutError):
+        future.result(5)
+
+    assert replies.replies == []
+    assert len(replies.errors) == 1 and isinstance(replies.errors[0], TimeoutError)
+
+    openai_api.delay = 0
+    assert submit(engine, 1, "быстрый", replies).result(5) == "Ответ: быстрый"
+
+
+def test_cancel_user_stops_running_and_queued_requests(clean_db, openai_api, make_engine):
+    openai_api.delay = 2
+    engine = make_engine()
+    replies = Replies()
+
+    running = submit(engine, 1, "первый", replies)
+    openai_api.wait_started(1)
+    queued = submit(engine, 1, "второй", replies)
+
+    assert engine.cancel_user(1) == 2
+    for future in (running, queued):
+        with pytest.raises(CancelledError):
+            future.result(5)
+    assert engine.pending(1) == 0
+
+    openai_api.delay = 0
+    assert submit(engine, 1, "снова", replies).result(5) == "Ответ: снова"
+    # Отмененные запросы не доставили ответ и не ушли в модель повторно
+    assert replies.replies == ["Ответ: снова"]
+    assert [question for question, _, _ in openai_api.requests] == ["первый", "снова"]
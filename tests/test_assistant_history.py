@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Окно истории диалога и его сжатие (bot/assistant_history.py)"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from bot.assistant_history import (
+    HISTORY_COMPACT_MAX_ROWS, build_history, plan_compaction, save_summary
+)
+from database.models import ChatHistory, Session, User
+
+USER_ID = 7
+
+
+def add_turns(count, length=10):
+    """count сообщений пользователя 7, от старых к новым; текст начинается с номера"""
+    started = datetime(2025, 1, 1, 12, 0, 0)
+    session = Session()
+    try:
+        session.add(User(user_id=str(USER_ID)))
+        session.add_all([
+            ChatHistory(user_id=USER_ID, role="user" if i % 2 == 0 else "assistant",
+                        content=f"{i:03d} " + "x" * length, timestamp=started + timedelta(minutes=i))
+            for i in range(count)
+        ])
+        session.commit()
+    finally:
+        session.close()
+    return [f"{i:03d} " + "x" * length for i in range(count)]
+
+
+def window_contents(history):
+    return [message["content"] for message in history if message["role"] != "system"]
+
+
+@pytest.mark.parametrize("count, length", [
+    (30, 10),    # окно ограничено числом сообщений
+    (30, 400),   # окно ограничено бюджетом токенов
+])
+def test_compaction_covers_exactly_what_drops_out_of_history(clean_db, count, length):
+    contents = add_turns(count, length)
+
+    history = window_contents(build_history(USER_ID))
+    plan = plan_compaction(USER_ID)
+
+    assert plan is not None
+    _, overflow = plan
+    dropped = contents[:count - len(history)]
+    assert history == contents[count - len(history):]
+    # Выпавшие из окна строки - ровно те, что сжимаются (от новых к старым)
+    assert [row.content for row in overflow] == list(reversed(dropped))[:HISTORY_COMPACT_MAX_ROWS]
+
+
+def test_history_continues_from_saved_summary(clean_db):
+    contents = add_turns(30)
+    _, overflow = plan_compaction(USER_ID)
+
+    assert save_summary(USER_ID, overflow, "краткое содержание")
+
+    history = build_history(USER_ID)
+    assert history[0]["role"] == "system" and "краткое содержание" in history[0]["content"]
+    assert window_contents(history) == contents[len(overflow):]
+    assert plan_compaction(USER_ID) is None
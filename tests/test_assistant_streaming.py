@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Потоковый ответ Health ассистента (AssistantEngine._stream) на бэкенде-заглушке
+FakeStreamingBackend: правки объединяются и отправляются с заданным интервалом,
+не чаще лимита Telegram для чата, итоговый текст совпадает с полным ответом.
+"""
+
+import asyncio
+import threading
+import time
+from time import monotonic
+
+import pytest
+
+from bot.assistant_engine import AssistantEngine, FakeStreamingBackend, TELEGRAM_CHAT_MIN_INTERVAL
+
+TEXT = "Регулярные тренировки и сон по 8 часов помогают восстановлению. " * 2
+# Запас на планирование потоков при сравнении интервалов
+JITTER = 0.05
+
+
+class Edits:
+    """Колбэк on_partial: запоминает время, текст и число одновременных правок"""
+
+    def __init__(self, duration=0.0):
+        self.duration = duration
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            self.calls.append((monotonic(), text))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.duration)
+        with self.lock:
+            self.active -= 1
+
+    @property
+    def times(self):
+        return [at for at, _ in self.calls]
+
+    @property
+    def texts(self):
+        return [text for _, text in self.calls]
+
+
+def stream(engine, edits):
+    return asyncio.run(engine._stream(1, [{"role": "user", "content": "вопрос"}], edits))
+
+
+def gaps(times):
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+def test_edits_are_coalesced_at_configured_interval():
+    backend = FakeStreamingBackend(TEXT, chunk_size=4, delay=0.1)
+    engine = AssistantEngine(backend, edit_interval=1.2)
+    edits = Edits()
+
+    text, last_edit = stream(engine, edits)
+
+    chunks = -(-len(TEXT) // 4)
+    assert text == TEXT
+    # Фрагменты между правками объединяются: правок намного меньше, чем фрагментов
+    assert 2 <= len(edits.calls) < chunks / 5
+    assert all(gap >= 1.2 - JITTER for gap in gaps(edits.times))
+    # Каждая правка - накопленный на момент отправки текст
+    assert all(TEXT.startswith(partial) for partial in edits.texts)
+    assert edits.texts == sorted(edits.texts, key=len) and len(set(edits.texts)) == len(edits.texts)
+    assert last_edit is not None
+
+
+def test_interval_below_chat_limit_is_raised_to_it():
+    backend = FakeStreamingBackend(TEXT, chunk_size=4, delay=0.1)
+    engine = AssistantEngine(backend, edit_interval=0.2)
+    edits = Edits()
+
+    stream(engine, edits)
+
+    assert engine.edit_interval == TELEGRAM_CHAT_MIN_INTERVAL
+    assert len(edits.calls) >= 2
+    assert all(gap >= TELEGRAM_CHAT_MIN_INTERVAL - JITTER for gap in gaps(edits.times))
+
+
+def test_slow_edit_is_not_overlapped():
+    backend = FakeStreamingBackend(TEXT, chunk_size=4, delay=0.1)
+    engine = AssistantEngine(backend, edit_interval=1.0)
+    # Правка дольше интервала: следующая ждет ее завершения
+    edits = Edits(duration=1.5)
+
+    text, _ = stream(engine, edits)
+
+    assert text == TEXT
+    assert edits.max_active == 1
+    assert all(gap >= 1.5 - JITTER for gap in gaps(edits.times))
+
+
+@pytest.mark.usefixtures("clean_db")
+def test_final_reply_is_full_text_within_chat_limit():
+    backend = FakeStreamingBackend(TEXT, chunk_size=8, delay=0.1)
+    engine = AssistantEngine(backend, edit_interval=1.0)
+    edits = Edits()
+    replies = []
+    try:
+        future = engine.submit(1, "вопрос", history_loader=lambda: [], use_cache=False, on_partial=edits,
+                               on_reply=lambda response: replies.append((monotonic(), response)))
+        assert future.result(10) == TEXT
+    finally:
+        engine.stop()
+
+    assert [response for _, response in replies] == [TEXT]
+    assert edits.calls
+    # Итоговая правка сообщения тоже соблюдает интервал после последней промежуточной
+    assert replies[0][0] - edits.times[-1] >= 1.0 - JITTER
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Рассылка (web_admin/broadcast.py) на локальной заглушке Bot API:
+темп отправки, пауза по 429 и продолжение после падения процесса.
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+import pytest
+
+from database.models import Broadcast, Session, User
+from web_admin import broadcast as broadcast_module
+from web_admin.broadcast import (
+    BotApiClient, BroadcastRateLimiter, BroadcastRunner, create_broadcast,
+    RESULT_FAILED, RESULT_SENT, STATUS_COMPLETED, STATUS_RUNNING
+)
+
+TOKEN = "123:test"
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    """
+    Заглушка Bot API: принимает sendMessage, запоминает время и chat_id
+    каждого запроса и отвечает тем, что вернет respond(chat_id)
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeBotApiHandler)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.respond = lambda chat_id: {"ok": True, "result": {"message_id": 1}}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def chats(self, ok_only=True):
+        with self.lock:
+            return [chat_id for _, chat_id, ok in self.requests if ok or not ok_only]
+
+    def times(self, chat_id=None):
+        with self.lock:
+            return [at for at, chat, _ in self.requests if chat_id is None or chat == chat_id]
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != f"/bot{TOKEN}/sendMessage":
+            self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        chat_id = str(payload["chat_id"])
+        result = self.server.respond(chat_id)
+        with self.server.lock:
+            self.server.requests.append((monotonic(), chat_id, result["ok"]))
+        self._reply(200 if result["ok"] else result["error_code"], result)
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def too_many_requests(retry_after):
+    return {"ok": False, "error_code": 429, "description": "Too Many Requests",
+            "parameters": {"retry_after": retry_after}}
+
+
+@pytest.fixture
+def bot_api():
+    server = FakeBotApi()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(bot_api):
+    return BotApiClient(TOKEN, base_url=bot_api.url, timeout=5)
+
+
+def add_users(count):
+    session = Session()
+    try:
+        session.add_all([User(user_id=str(1000 + i), is_subscribed=True) for i in range(count)])
+        session.commit()
+        return [row.id for row in session.query(User.id).order_by(User.id)]
+    finally:
+        session.close()
+
+
+def get_broadcast(broadcast_id):
+    session = Session()
+    try:
+        broadcast = session.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+        session.expunge(broadcast)
+        return broadcast
+    finally:
+        session.close()
+
+
+def max_in_window(times, window):
+    """Наибольшее число запросов в любом интервале длиной window секунд"""
+    times = sorted(times)
+    start = 0
+    best = 0
+    for end, at in enumerate(times):
+        while at - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+def test_global_rate_limit(clean_db, bot_api, client):
+    add_users(70)
+    broadcast_id = create_broadcast("Привет")
+    limiter = BroadcastRateLimiter(rate=30, burst=5, chat_interval=1.0)
+
+    BroadcastRunner(broadcast_id, client, limiter, chunk_size=25, workers=8).run()
+
+    broadcast = get_broadcast(broadcast_id)
+    assert broadcast.status == STATUS_COMPLETED
+    assert broadcast.sent == 70
+    assert sorted(bot_api.chats()) == sorted(str(1000 + i) for i in range(70))
+
+    times = bot_api.times()
+    # Ведро на 5 токенов, дальше не быстрее 30 сообщений в секунду
+    assert max(times) - min(times) >= (70 - 5) / 30 - 0.05
+    assert max_in_window(times, 1.0) <= 30 + 5
+
+
+def test_per_chat_interval(clean_db, bot_api, client):
+    limiter = BroadcastRateLimiter(rate=30, burst=5, chat_interval=1.0)
+    runner = BroadcastRunner(0, client, limiter)
+
+    for _ in range(3):
+        assert runner.send_one(42, "Привет", None, None) == RESULT_SENT
+    runner.send_one(43, "Привет", None, None)
+
+    times = bot_api.times("42")
+    assert len(times) == 3
+    assert all(later - earlier >= 0.95 for earlier, later in zip(times, times[1:]))
+    # Другой чат не ждет интервала первого
+    assert bot_api.times("43")[0] - times[-1] < 0.5
+
+
+def test_retry_after_pauses_all_sends(clean_db, bot_api, client):
+    add_users(10)
+    broadcast_id = create_broadcast("Привет")
+    throttled = []
+
+    def respond(chat_id):
+        if chat_id == "1002" and not throttled:
+            throttled.append(chat_id)
+            return too_many_requests(1)
+        return {"ok": True, "result": {"message_id": 1}}
+
+    bot_api.respond = respond
+    limiter = BroadcastRateLimiter(rate=100, burst=10, chat_interval=0)
+    BroadcastRunner(broadcast_id, client, limiter, chunk_size=10, workers=1).run()
+
+    broadcast = get_broadcast(broadcast_id)
+    assert broadcast.status == STATUS_COMPLETED
+    assert broadcast.sent == 10
+    # После 429 ни один запрос не уходит раньше retry_after, затем сообщение повторяется
+    throttled_at = next(at for at, chat_id, ok in bot_api.requests if not ok)
+    later = [at for at, chat_id, ok in bot_api.requests if ok and at > throttled_at]
+    assert later and min(later) - throttled_at >= 0.95
+    assert bot_api.chats().count("1002") == 1
+
+
+def test_retry_after_counts_against_max_attempts(clean_db, bot_api, client, monkeypatch):
+    monkeypatch.setattr(broadcast_module, "BROADCAST_MAX_ATTEMPTS", 3)
+    bot_api.respond = lambda chat_id: too_many_requests(0.1)
+    limiter = BroadcastRateLimiter(rate=100, burst=10, chat_interval=0)
+
+    result = BroadcastRunner(0, client, limiter).send_one(42, "Привет", None, None)
+
+    assert result == RESULT_FAILED
+    assert len(bot_api.chats(ok_only=False)) == 3
+
+
+class Crash(BaseException):
+    """Имитация падения процесса посреди порции"""
+
+
+def test_resume_after_crash(clean_db, bot_api, client):
+    ids = add_users(10)
+    broadcast_id = create_broadcast("Привет")
+    bot_api.respond = lambda chat_id: {"ok": True, "result": {"message_id": 1}}
+    limiter = BroadcastRateLimiter(rate=1000, burst=10, chat_interval=0)
+
+    class CrashingClient:
+        def send_message(self, chat_id, *args):
+            if chat_id == "1004":
+                raise Crash()
+            return client.send_message(chat_id, *args)
+
+    with pytest.raises(Crash):
+        BroadcastRunner(broadcast_id, CrashingClient(), limiter, chunk_size=3, workers=1).run()
+
+    # Первая порция сохранена, аренда упавшего процесса еще действует
+    broadcast = get_broadcast(broadcast_id)
+    assert broadcast.status == STATUS_RUNNING
+    assert broadcast.last_user_id == ids[2]
+    assert broadcast.sent == 3
+    assert broadcast.locked_until > datetime.now()
+    sent_before_crash = len(bot_api.chats())
+    BroadcastRunner(broadcast_id, client, limiter, chunk_size=3, workers=1).run()
+    assert len(bot_api.chats()) == sent_before_crash
+
+    # Аренда истекла - рассылка продолжается с сохраненного курсора
+    session = Session()
+    try:
+        session.query(Broadcast).filter(Broadcast.id == broadcast_id)\
+            .update({Broadcast.locked_until: datetime.now() - timedelta(seconds=1)})
+        session.commit()
+    finally:
+        session.close()
+    BroadcastRunner(broadcast_id, client, limiter, chunk_size=3, workers=1).run()
+
+    broadcast = get_broadcast(broadcast_id)
+    assert broadcast.status == STATUS_COMPLETED
+    assert broadcast.last_user_id == ids[-1]
+    assert broadcast.sent == 10
+    chats = bot_api.chats()
+    assert sorted(set(chats)) == sorted(str(1000 + i) for i in range(10))
+    # Повторно получают сообщение только получатели незавершенной порции
+    assert all(chats.count(str(1000 + i)) == 1 for i in range(3))
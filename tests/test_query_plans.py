@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Горячие запросы используют индексы схемы (database/check_query_plans.py)"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from database.check_query_plans import check_query_plans
+from database.db import db
+
+
+@pytest.fixture
+def schema_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_hot_queries_use_indexes(schema_engine):
+    assert check_query_plans(schema_engine) == []
+
+
+def test_missing_index_is_reported(schema_engine):
+    with schema_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_payments_paid_at"))
+
+    failures = check_query_plans(schema_engine)
+
+    assert len(failures) == 1
+    assert "ix_payments_paid_at" in failures[0]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Общая сессия апдейта (database.models.session_scope)"""
+
+from database.models import Session, User, get_session, session_scope
+
+
+def add_user(user_id):
+    session = Session()
+    try:
+        session.add(User(user_id=user_id))
+        session.commit()
+    finally:
+        session.close()
+
+
+def count_users():
+    session = get_session()
+    try:
+        return session.query(User).count()
+    finally:
+        session.close()
+
+
+def test_released_scope_sees_commits_of_other_connections(clean_db):
+    with session_scope():
+        assert count_users() == 0
+        # Коммит другого соединения (веб-процесс, вебхук оплаты) между обращениями обработчика
+        add_user("1")
+        assert count_users() == 1
+
+
+def test_nested_users_share_session(clean_db):
+    with session_scope():
+        outer = get_session()
+        inner = get_session()
+        inner.add(User(user_id="2"))
+        inner.close()
+        # Внешний пользователь еще держит ссылку - изменения не откатываются
+        assert outer.query(User).filter(User.user_id == "2").count() == 1
+        outer.close()
+        assert count_users() == 0
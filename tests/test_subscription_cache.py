@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Кэш статуса подписки (database/subscription_cache.py)"""
+
+from database.subscription_cache import SubscriptionCache, SubscriptionStatus
+
+UNPAID = SubscriptionStatus(False, None, None)
+PAID = SubscriptionStatus(True, None, "monthly")
+
+
+def test_invalidate_during_load_discards_stale_status():
+    cache = SubscriptionCache(ttl=60)
+    statuses = [UNPAID, PAID]
+
+    def loader(user_id):
+        status = statuses.pop(0)
+        if status is UNPAID:
+            # Оплата коммитится и сбрасывает кэш, пока читается старый статус
+            cache.invalidate(user_id)
+        return status
+
+    assert cache.get("1", loader) == UNPAID
+    assert cache.get("1", loader) == PAID
+    assert cache.get("1", loader) == PAID
+    assert cache.stats()["misses"] == 2
+
+
+def test_cached_status_is_reused_until_invalidated():
+    cache = SubscriptionCache(ttl=60)
+    calls = []
+
+    def loader(user_id):
+        calls.append(user_id)
+        return PAID
+
+    cache.get("1", loader)
+    cache.get("1", loader)
+    assert calls == ["1"]
+
+    cache.invalidate("1")
+    cache.get("1", loader)
+    assert calls == ["1", "1"]
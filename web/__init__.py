@@ -2,6 +2,7 @@ from flask import Flask, jsonify, send_from_directory
 import os
 import logging
 from database.db import init_flask_db
+from database.models import init_app_session_scope
 from flask_cors import CORS  # Добавляем импорт для CORS
 
 # Настройка логирования
@@ -42,6 +43,9 @@ def create_app():
     init_flask_db(app)
     logger.info("Инициализирована база данных Flask-SQLAlchemy")
     
+    # Одна сессия get_session() и одно соединение на HTTP-запрос
+    init_app_session_scope(app)
+    
     # Регистрируем маршруты для платежей
     from web.payment_routes import payment_bp
     app.register_blueprint(payment_bp)
@@ -84,7 +88,18 @@ def create_app():
     # Маршрут для проверки работы сервера
     @app.route('/health')
     def health_check():
-        return jsonify({"status": "ok", "message": "Server is running"})
+        from database.subscription_cache import get_subscription_cache_stats
+        from bot.answer_cache import get_answer_cache_stats
+        from bot.assistant_engine import assistant_engine
+        from bot.outbound_queue import get_outbound_queue_stats
+        return jsonify({
+            "status": "ok",
+            "message": "Server is running",
+            "subscription_cache": get_subscription_cache_stats(),
+            "assistant_answer_cache": get_answer_cache_stats(),
+            "assistant_engine": assistant_engine.stats(),
+            "outbound_queue": get_outbound_queue_stats()
+        })
     
     # Обработчик ошибок
     @app.errorhandler(404)
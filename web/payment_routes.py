@@ -1,6 +1,10 @@
 from dotenv import load_dotenv
-from bot.handlers import get_bot_config, get_main_keyboard
+from bot.handlers import get_main_keyboard
+from bot.config import get_config
 from database.models import get_session, User, Payment, ReferralUse, ReferralCode
+from database.subscription_cache import invalidate_subscription
+from database.dashboard_metrics import record_payment_metrics
+from bot.outbound_queue import build_message, enqueue_message, enqueue_messages
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, session, abort, current_app
 import logging
 from datetime import datetime, timedelta
@@ -20,7 +24,7 @@ import uuid
 import locale
 # Отключаем импорт настроек YooKassa
 # from config import FLASK_SECRET_KEY, YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY
-from config import FLASK_SECRET_KEY
+from config import FLASK_SECRET_KEY, BLOGGERS_SINGLE_DB
 
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
@@ -42,17 +46,12 @@ def update_blogger_conversion(user_telegram_id, amount, session=None):
             session = get_session()
             should_close_session = True
 
-        # Ищем запись о переходе для этого пользователя
+        # Ищем последний неконвертированный переход пользователя (по индексу user_id)
         from sqlalchemy import text
+        from database.blogger_attribution import BLOGGER_CONVERSION_LOOKUP_SQL
         result = session.execute(
-            text("""
-            SELECT br.id, br.blogger_id, b.name 
-            FROM blogger_referrals br
-            JOIN bloggers b ON br.blogger_id = b.id
-            WHERE br.source LIKE :user_pattern AND br.converted = 0
-            ORDER BY br.created_at DESC
-            """),
-            {"user_pattern": f"%{user_telegram_id}%"}
+            text(BLOGGER_CONVERSION_LOOKUP_SQL),
+            {"user_id": str(user_telegram_id)}
         )
 
         referral = result.fetchone()
@@ -81,6 +80,12 @@ def update_blogger_conversion(user_telegram_id, amount, session=None):
                 }
             )
 
+            if BLOGGERS_SINGLE_DB:
+                # Единая база: сводка панели блогера обновляется в той же транзакции
+                from database import blogger_daily_stats
+                cursor = session.connection().connection.cursor()
+                blogger_daily_stats.record_conversion(cursor, referral_id, commission)
+
             if should_close_session:
                 session.commit()
 
@@ -129,34 +134,12 @@ payment_bp = Blueprint('payment', __name__)
 
 
 def get_bot_token():
-    try:
-        import json
-        import os
-        bot_config_path = os.path.join(os.path.dirname(
-            os.path.dirname(os.path.abspath(__file__))), 'bot_config.json')
-        with open(bot_config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        token = config.get('bot_token')
-        payment_logger.info(
-            f"\033[93mТокен бота получен из bot_config.json: {'Да' if token else 'Нет'}\033[0m")
-        if token:
-            payment_logger.info(
-                f"\033[93mДлина токена: {len(token)} символов\033[0m")
-            return token
-        else:
-            # Запасной вариант - используем переменную окружения
-            token = os.getenv("TELEGRAM_TOKEN")
-            payment_logger.info(
-                f"\033[93mТокен бота получен из переменной TELEGRAM_TOKEN: {'Да' if token else 'Нет'}\033[0m")
-            return token
-    except Exception as e:
+    """Возвращает токен бота из снимка конфигурации (без чтения файла)"""
+    token = get_config().bot_token
+    if not token:
         payment_logger.error(
-            f"\033[91mОшибка при получении токена бота из конфигурации: {str(e)}\033[0m")
-        # Запасной вариант - используем переменную окружения
-        token = os.getenv("TELEGRAM_TOKEN")
-        payment_logger.info(
-            f"\033[93mТокен бота получен из переменной TELEGRAM_TOKEN: {'Да' if token else 'Нет'}\033[0m")
-        return token
+            f"\033[91mТокен бота не найден ни в bot_config.json, ни в TELEGRAM_TOKEN\033[0m")
+    return token
 
 
 TELEGRAM_TOKEN = get_bot_token()
@@ -341,6 +324,8 @@ def payment_success():
         # Сохраняем платеж и изменения пользователя
         session.add(new_payment)
         session.commit()
+        invalidate_subscription(user.user_id)
+        record_payment_metrics(new_payment.paid_at)
         
         # Обработка реферальной ссылки
         try:
@@ -356,49 +341,16 @@ def payment_success():
         except Exception as e:
             logging.error(f"Ошибка при обработке реферальной ссылки: {str(e)}")
         
-        # Отправляем уведомление в Telegram
+        # Ставим уведомление в очередь отправки Telegram
         try:
-            # Отправляем сообщение об успешной оплате с информацией о подписке
-            send_payment_notification(user_id, amount, payment_description)
-            
-            # Отправляем ReplyKeyboard напрямую для обеспечения гарантированного отображения клавиатуры
-            try:
-                payment_logger.info(f"Payment Success: Отправка ReplyKeyboard напрямую пользователю {user_id}")
-                
-                # Пытаемся получить токен бота и инициализировать бота
-                token = get_bot_token()
-                if not token:
-                    payment_logger.error(f"Payment Success: Не удалось получить токен бота для отправки ReplyKeyboard")
-                    raise Exception("Не удалось получить токен бота")
-                
-                # Инициализируем бота или используем существующего
-                bot_instance = bot if bot else Bot(token=token)
-                
-                # Пытаемся получить ReplyKeyboard из bot/handlers.py
-                try:
-                    # Используем импортированную функцию get_main_keyboard
-                    reply_keyboard = get_main_keyboard()
-                    payment_logger.info(f"Payment Success: ReplyKeyboard успешно получена")
-                except Exception as keyboard_error:
-                    payment_logger.error(f"Payment Success: Ошибка при получении ReplyKeyboard: {str(keyboard_error)}")
-                    # Если не удалось получить клавиатуру из функции, создаем её вручную
-                    reply_keyboard = ReplyKeyboardMarkup([
-                        ["Health ассистент", "Управление подпиской"],
-                        ["Связь с поддержкой", "Пригласить друга"]
-                    ], resize_keyboard=True)
-                    payment_logger.info(f"Payment Success: Создана резервная ReplyKeyboard")
-                
-                # Отправляем сообщение с ReplyKeyboard
-                keyboard_result = bot_instance.send_message(
-                    chat_id=user_id,
-                    text="Главное меню:",
-                    reply_markup=reply_keyboard
-                )
-                payment_logger.info(f"Payment Success: ReplyKeyboard успешно отправлена напрямую, результат: {keyboard_result}")
-            except Exception as reply_keyboard_error:
-                payment_logger.error(f"Payment Success: Ошибка при отправке ReplyKeyboard напрямую: {str(reply_keyboard_error)}")
-                import traceback
-                payment_logger.error(f"Payment Success: Подробная информация об ошибке: {traceback.format_exc()}")
+            # Сообщение об успешной оплате с информацией о подписке и
+            # ReplyKeyboard следом для гарантированного отображения клавиатуры
+            main_menu = build_message(
+                user_id, "Главное меню:", get_main_keyboard(),
+                idempotency_key=f"payment:{payment_id}:main_menu"
+            )
+            send_payment_notification(user_id, amount, payment_description,
+                                      payment_id=payment_id, extra_messages=[main_menu])
         except Exception as e:
             logging.error(f"Ошибка при отправке уведомления о платеже: {str(e)}")
         
@@ -501,6 +453,8 @@ def api_payment_success():
         # Сохраняем платеж и изменения пользователя
         session.add(new_payment)
         session.commit()
+        invalidate_subscription(user.user_id)
+        record_payment_metrics(new_payment.paid_at)
         
         # Логируем информацию об оплате
         log_payment(user_id, data)
@@ -599,7 +553,8 @@ def api_payment_success():
         # Отправляем уведомление в Телеграм
         try:
             # Отправляем сообщение об успешной оплате с информацией о подписке
-            send_payment_notification(user_id, amount, subscription_type)
+            send_payment_notification(user_id, amount, subscription_type,
+                                      payment_id=data.get('payment_id') or f"local-{new_payment.id}")
         except Exception as e:
             logging.error(f"Ошибка при отправке уведомления о платеже: {str(e)}")
         
@@ -663,7 +618,7 @@ def send_success_message(user_id):
     )
 
     payment_logger.info(f"\033[93mПолучение конфигурации бота\033[0m")
-    config = get_bot_config()
+    config = get_config()
     channel_url = config.get('channel_url', 'https://t.me/willway_channel')
     payment_logger.info(f"\033[93mПолучен URL канала: {channel_url}\033[0m")
 
@@ -741,41 +696,8 @@ def send_pending_message(user_id):
     payment_logger.info(
         f"\033[93mНачало отправки сообщения о незавершенной оплате пользователю {user_id}\033[0m")
 
-    global bot
-    if not bot:
-        payment_logger.error(
-            f"\033[91mОшибка: переменная bot не инициализирована\033[0m")
-        try:
-            # Получаем токен из bot_config.json
-            token = get_bot_token()
-            if not token:
-                payment_logger.error(
-                    f"\033[91mНе удалось получить токен бота\033[0m")
-                return False
-
-            payment_logger.info(
-                f"\033[93mИнициализация бота с токеном из bot_config.json\033[0m")
-            bot = Bot(token=token)
-            payment_logger.info(
-                f"\033[92mБот успешно инициализирован для отправки сообщения о незавершенной оплате\033[0m")
-
-        except Exception as bot_init_error:
-            payment_logger.error(
-                f"\033[91mНе удалось инициализировать бота: {str(bot_init_error)}\033[0m")
-            return False
-    else:
-        payment_logger.info(f"\033[93mБот уже инициализирован\033[0m")
-
     # Получаем имя пользователя менеджера из конфигурации
-    try:
-        with open('bot/bot_config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            manager_username = config.get(
-                'manager_username', 'willway_support')
-    except Exception as e:
-        payment_logger.error(
-            f"\033[91mОшибка при получении имени менеджера: {str(e)}\033[0m")
-        manager_username = 'willway_support'  # Значение по умолчанию
+    manager_username = get_config().get('manager_username', 'willway_support')
 
     # Текст сообщения
     message = (
@@ -792,15 +714,11 @@ def send_pending_message(user_id):
                               url=f"https://willway.pro/payment?tgid={user_id}")]
     ])
 
-    # Отправляем сообщение с клавиатурой
+    # Ставим сообщение в очередь отправки
     try:
-        bot.send_message(
-            chat_id=user_id,
-            text=message,
-            reply_markup=keyboard
-        )
+        enqueue_message(user_id, message, reply_markup=keyboard)
         payment_logger.info(
-            f"\033[92mОтправлено сообщение о незавершенной оплате пользователю {user_id}\033[0m")
+            f"\033[92mСообщение о незавершенной оплате поставлено в очередь для пользователя {user_id}\033[0m")
         return True
     except Exception as e:
         payment_logger.error(
@@ -879,7 +797,7 @@ def check_payment_status():
         # Если статус pending и пользователь не подписан, отправляем напоминание
         if payment_status == 'pending' and not subscription_active:
             # Получаем username менеджера
-            config = get_bot_config()
+            config = get_config()
             manager_username = config.get("manager_username", "willway_manager")
             
             # Отправляем напоминание о незавершенной оплате через бота
@@ -1196,31 +1114,19 @@ def handle_preflight():
 # Отключаем создание клиента YooKassa
 # client = YooPayment.client()
 
-def send_payment_notification(user_id, amount, payment_description):
+def send_payment_notification(user_id, amount, payment_description, payment_id=None, extra_messages=None):
     """
-    Отправляет пользователю уведомление об успешной оплате
+    Ставит в очередь уведомление об успешной оплате (см. bot/outbound_queue.py)
     
     :param user_id: ID пользователя в Telegram
     :param amount: Сумма платежа
     :param payment_description: Описание платежа
+    :param payment_id: ID платежа - ключ идемпотентности, повторный вебхук не дублирует сообщения
+    :param extra_messages: Дополнительные сообщения (build_message), отправляемые следом
     :return: True в случае успеха, False в случае ошибки
     """
     payment_logger.info(f"Отправка уведомления об оплате пользователю {user_id}")
     
-    global bot
-    if not bot:
-        try:
-            token = get_bot_token()
-            if not token:
-                payment_logger.error("Не удалось получить токен бота")
-                return False
-                
-            bot = Bot(token=token)
-            payment_logger.info("Бот инициализирован для отправки уведомления об оплате")
-        except Exception as e:
-            payment_logger.error(f"Ошибка при инициализации бота: {str(e)}")
-            return False
-    
     # Определяем тип подписки и длительность
     subscription_type = "monthly"
     if "year" in payment_description.lower():
@@ -1301,63 +1207,45 @@ def send_payment_notification(user_id, amount, payment_description):
     )
     
     # Создаем InlineKeyboard для приветственного сообщения
-    config = get_bot_config()
+    config = get_config()
     channel_url = config.get('channel_url', 'https://t.me/willway_channel')
     welcome_keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton(text="Доступ к приложению", web_app={"url": "https://willway.pro/"})],
         [InlineKeyboardButton(text="Вступить в канал", url=channel_url)]
     ])
     
-    # Отправляем сообщения
+    # Меню бота (ReplyKeyboard)
     try:
-        # 1. Сначала отправляем информацию о подписке
-        result_subscription = bot.send_message(
-            chat_id=user_id,
-            text=subscription_message,
-            parse_mode="Markdown",
-            reply_markup=subscription_keyboard
-        )
-        payment_logger.info(f"Сообщение с информацией о подписке отправлено пользователю {user_id}")
-        
-        # 2. Затем отправляем приветственное сообщение
-        result_welcome = bot.send_message(
-            chat_id=user_id,
-            text=welcome_message,
-            reply_markup=welcome_keyboard
-        )
-        payment_logger.info(f"Приветственное сообщение отправлено пользователю {user_id}")
-        
-        # 3. Отправляем ReplyKeyboard кнопки напрямую
-        try:
-            payment_logger.info(f"Отправка ReplyKeyboard напрямую пользователю {user_id}")
-            
-            # Пытаемся получить ReplyKeyboard из bot/handlers.py
-            try:
-                # Используем импортированную функцию get_main_keyboard
-                reply_keyboard = get_main_keyboard()
-                payment_logger.info(f"ReplyKeyboard успешно получена")
-            except Exception as keyboard_error:
-                payment_logger.error(f"Ошибка при получении ReplyKeyboard: {str(keyboard_error)}")
-                # Если не удалось получить клавиатуру из функции, создаем её вручную
-                reply_keyboard = ReplyKeyboardMarkup([
-                    ["Health ассистент", "Управление подпиской"],
-                    ["Связь с поддержкой", "Пригласить друга"]
-                ], resize_keyboard=True)
-                payment_logger.info(f"Создана резервная ReplyKeyboard")
-            
-            # Отправляем сообщение с ReplyKeyboard
-            keyboard_result = bot.send_message(
-                chat_id=user_id,
-                text="Меню доступно ниже ⬇️",
-                reply_markup=reply_keyboard
-            )
-            payment_logger.info(f"ReplyKeyboard успешно отправлена напрямую")
-        except Exception as reply_keyboard_error:
-            payment_logger.error(f"Ошибка при отправке ReplyKeyboard напрямую: {str(reply_keyboard_error)}")
-        
+        reply_keyboard = get_main_keyboard()
+    except Exception as keyboard_error:
+        payment_logger.error(f"Ошибка при получении ReplyKeyboard: {str(keyboard_error)}")
+        # Если не удалось получить клавиатуру из функции, создаем её вручную
+        reply_keyboard = ReplyKeyboardMarkup([
+            ["Health ассистент", "Управление подпиской"],
+            ["Связь с поддержкой", "Пригласить друга"]
+        ], resize_keyboard=True)
+    
+    # Ставим сообщения в очередь: их отправит бот, вебхук не ждет Telegram
+    def message_key(name):
+        return f"payment:{payment_id}:{name}" if payment_id else None
+    
+    messages = [
+        # 1. Информация о подписке
+        build_message(user_id, subscription_message, subscription_keyboard, parse_mode="Markdown",
+                      idempotency_key=message_key("subscription")),
+        # 2. Приветственное сообщение
+        build_message(user_id, welcome_message, welcome_keyboard, idempotency_key=message_key("welcome")),
+        # 3. ReplyKeyboard с меню
+        build_message(user_id, "Меню доступно ниже ⬇️", reply_keyboard, idempotency_key=message_key("menu"))
+    ]
+    messages.extend(extra_messages or [])
+    
+    try:
+        added = enqueue_messages(messages)
+        payment_logger.info(f"Уведомления об оплате поставлены в очередь для пользователя {user_id}: {added}")
         return True
     except Exception as e:
-        payment_logger.error(f"Ошибка при отправке уведомлений об оплате: {str(e)}")
+        payment_logger.error(f"Ошибка при постановке уведомлений об оплате в очередь: {str(e)}")
         import traceback
         payment_logger.error(f"Подробности: {traceback.format_exc()}")
         return False
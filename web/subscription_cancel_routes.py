@@ -108,10 +108,10 @@ def cancel_subscription():
                 # Если не удалось импортировать, создаем нового бота
                 from telegram import Bot
                 import os
-                from bot.config import get_bot_config
+                from bot.config import get_config
                 
                 # Получаем токен из конфигурации
-                config = get_bot_config()
+                config = get_config()
                 bot_token = config.get('bot_token') or os.getenv('TELEGRAM_BOT_TOKEN')
                 
                 if bot_token:
@@ -182,10 +182,10 @@ def cancel_subscription_get():
                 # Если не удалось импортировать, создаем нового бота
                 from telegram import Bot
                 import os
-                from bot.config import get_bot_config
+                from bot.config import get_config
                 
                 # Получаем токен из конфигурации
-                config = get_bot_config()
+                config = get_config()
                 bot_token = config.get('bot_token') or os.getenv('TELEGRAM_BOT_TOKEN')
                 
                 if bot_token:
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from database.models import Blogger, BloggerReferral, User, Payment, BloggerPayment, get_session, generate_access_key
 from database.db import db
+from database import blogger_daily_stats
+from database.bloggers_db import get_bloggers_connection
+from database.sqlite_schema import get_bloggers_schema
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 import secrets
@@ -14,99 +17,15 @@ import traceback
 
 api_bp = Blueprint('api', __name__)
 
-# Определяем путь к БД блогеров
-BLOGGERS_DB_PATH = os.path.join(os.getcwd(), 'willway_bloggers.db')
+# Путь к БД блогеров (абсолютный, не зависит от рабочей директории)
+from config import BLOGGERS_DB_PATH
 
 # Вспомогательная функция для получения соединения с базой данных блогеров
 def get_bloggers_db_connection():
-    """Устанавливает соединение с БД блогеров"""
+    """Соединение с БД блогеров из общего пула (close() возвращает его в пул)"""
     try:
-        # Используем прямой путь к файлу willway_bloggers.db
-        db_path = os.path.join(os.getcwd(), 'willway_bloggers.db')
-        print(f"Попытка подключения к БД: {db_path}")
-        
-        # Проверяем, существует ли файл базы данных
-        db_exists = os.path.exists(db_path)
-        if not db_exists:
-            print("ОШИБКА: База данных не найдена")
-            # Создаем базу данных и таблицы
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Создаем таблицу bloggers
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS bloggers (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT,
-                    telegram_id TEXT,
-                    access_key TEXT UNIQUE,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Создаем таблицу blogger_referrals
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS blogger_referrals (
-                    id INTEGER PRIMARY KEY,
-                    blogger_id INTEGER,
-                    user_id INTEGER,
-                    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    purchase_price REAL DEFAULT 0,
-                    conversion_date TIMESTAMP,
-                    commission REAL DEFAULT 0,
-                    status TEXT DEFAULT 'pending',
-                    FOREIGN KEY (blogger_id) REFERENCES bloggers (id)
-                )
-            ''')
-            
-            conn.commit()
-            print("База данных и таблицы созданы")
-            return conn
-        
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        
-        # Проверяем наличие необходимых таблиц
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND (name='bloggers' OR name='blogger_referrals')")
-        tables = cursor.fetchall()
-        table_names = [table['name'] for table in tables]
-        
-        if 'bloggers' not in table_names or 'blogger_referrals' not in table_names:
-            print("ОШИБКА: В базе данных отсутствуют необходимые таблицы")
-            # Создаем отсутствующие таблицы
-            if 'bloggers' not in table_names:
-                cursor.execute('''
-                    CREATE TABLE bloggers (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT,
-                        telegram_id TEXT,
-                        access_key TEXT UNIQUE,
-                        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-            
-            if 'blogger_referrals' not in table_names:
-                cursor.execute('''
-                    CREATE TABLE blogger_referrals (
-                        id INTEGER PRIMARY KEY,
-                        blogger_id INTEGER,
-                        user_id INTEGER,
-                        date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        purchase_price REAL DEFAULT 0,
-                        conversion_date TIMESTAMP,
-                        commission REAL DEFAULT 0,
-                        status TEXT DEFAULT 'pending',
-                        FOREIGN KEY (blogger_id) REFERENCES bloggers (id)
-                    )
-                ''')
-            
-            conn.commit()
-            print("Отсутствующие таблицы созданы")
-        
-        print("Подключение к БД успешно установлено")
-        return conn
+        # Таблицы и колонки создаются миграцией один раз на процесс
+        return get_bloggers_connection()
     except Exception as e:
         print(f"КРИТИЧЕСКАЯ ОШИБКА при подключении к БД: {str(e)}")
         # Если мы не можем подключиться к БД, генерируем исключение
@@ -924,13 +843,22 @@ def track_blogger_conversion():
             blogger_id = blogger['id']
             print(f"[КОНВЕРСИЯ] Найден блогер: ID={blogger_id}, имя={blogger['name']}")
                 
-            # Ищем соответствующий реферальный переход
-            source_pattern = f"telegram_start_{user_id}"
-            cursor.execute("""
-                SELECT * FROM blogger_referrals 
-                WHERE (blogger_id = ? AND source LIKE ?) AND (converted = 0 OR converted IS NULL)
-                ORDER BY created_at DESC LIMIT 1
-            """, (blogger_id, f"%{source_pattern}%"))
+            # Ищем соответствующий реферальный переход: по user_id (индекс),
+            # по source - только если колонки user_id в таблице нет
+            referral_columns = get_bloggers_schema(conn).columns('blogger_referrals')
+            if 'user_id' in referral_columns:
+                cursor.execute("""
+                    SELECT * FROM blogger_referrals 
+                    WHERE blogger_id = ? AND user_id = ? AND (converted = 0 OR converted IS NULL)
+                    ORDER BY id DESC LIMIT 1
+                """, (blogger_id, user_id))
+            else:
+                source_pattern = f"telegram_start_{user_id}"
+                cursor.execute("""
+                    SELECT * FROM blogger_referrals 
+                    WHERE (blogger_id = ? AND source LIKE ?) AND (converted = 0 OR converted IS NULL)
+                    ORDER BY created_at DESC LIMIT 1
+                """, (blogger_id, f"%{source_pattern}%"))
             
             referral = cursor.fetchone()
         
@@ -949,10 +877,8 @@ def track_blogger_conversion():
                 current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 referral_source = f"telegram_start_{user_id}"
                 
-                # Проверяем, какие колонки существуют в таблице
-                cursor.execute("PRAGMA table_info(blogger_referrals)")
-                columns = [col['name'] for col in cursor.fetchall()]
-                print(f"[КОНВЕРСИЯ] Колонки в таблице: {columns}")
+                # Колонки таблицы из кэша схемы
+                columns = referral_columns
                 
                 # Подготавливаем SQL-запрос на основе существующих колонок
                 insert_columns = ["id", "blogger_id", "source"]
@@ -979,6 +905,7 @@ def track_blogger_conversion():
                 print(f"[КОНВЕРСИЯ] Значения: {insert_values}")
                 
                 cursor.execute(insert_query, insert_values)
+                blogger_daily_stats.record_click(cursor, blogger_id)
                 conn.commit()
                 
                 # Получаем созданную запись
@@ -1033,6 +960,7 @@ def track_blogger_conversion():
             print(f"[КОНВЕРСИЯ] Значения: {update_values}")
             
             cursor.execute(update_query, update_values)
+            blogger_daily_stats.record_conversion(cursor, referral['id'], commission)
             conn.commit()
             
             # Обновляем общую статистику блогера
@@ -1069,7 +997,7 @@ def get_blogger_statistics(key):
     """Получение статистики блогера по ключу"""
     try:
         # Подключаемся к базе данных
-        conn = sqlite3.connect(BLOGGERS_DB_PATH)
+        conn = get_bloggers_db_connection()
         cursor = conn.cursor()
         
         # Ищем блогера по ключу
@@ -1082,9 +1010,8 @@ def get_blogger_statistics(key):
         blogger_id, blogger_name = blogger
         
         # Получаем статистику кликов по дням
-        # Проверяем структуру таблицы
-        cursor.execute("PRAGMA table_info(blogger_referrals)")
-        columns = [col[1] for col in cursor.fetchall()]
+        # Структура таблицы из кэша схемы
+        columns = get_bloggers_schema(conn).columns('blogger_referrals')
         
         has_created_at = 'created_at' in columns
         has_converted = 'converted' in columns
@@ -1226,6 +1153,8 @@ def test_blogger_conversion():
                 subscription_amount = ?
             WHERE id = ?
         """, (current_time, current_time, commission, commission, amount, next_id))
+        blogger_daily_stats.record_click(cursor, blogger_id)
+        blogger_daily_stats.record_conversion(cursor, next_id, commission)
         
         # Пробуем обновить счетчики блогера
         try:
@@ -4,7 +4,8 @@ import os
 from datetime import datetime, timedelta
 import calendar
 from sqlalchemy import func, extract, text
-from database.models import get_session, User, AdminUser, ReferralCode, ReferralUse, Blogger, BloggerReferral, BloggerPayment, generate_access_key, Payment
+from database.models import get_session, init_app_session_scope, User, AdminUser, ReferralCode, ReferralUse, Blogger, BloggerReferral, BloggerPayment, generate_access_key, Payment
+from database.subscription_cache import invalidate_subscription
 from dotenv import load_dotenv
 import json
 import requests
@@ -13,6 +14,20 @@ from database.db import db, init_flask_db
 from flask_migrate import Migrate
 from web_admin.api_routes import api_bp
 from web_admin.blogger_utils import *
+from database.sqlite_schema import get_bloggers_schema
+from web_admin.blogger_stats_cache import blogger_stats_cache, CachedStats, make_etag
+from database.dashboard_metrics import (
+    METRICS_REFRESH_INTERVAL, get_dashboard_metrics, metrics_updated_at, rebuild_daily_metrics, refresh_recent_metrics
+)
+from web_admin.users_api import USER_GOALS, USERS_PAGE_SIZE, parse_user_list_args, list_users
+from web_admin.referrals_stats import (
+    get_referral_codes_page, get_referral_uses_page, get_referral_summary, invalidate_referral_summary
+)
+from web_admin.broadcast import (
+    create_broadcast, start_broadcast, resume_broadcasts, set_broadcast_status, get_broadcast_progress,
+    get_recent_broadcasts, build_url_button_markup,
+    STATUS_RUNNING as BROADCAST_RUNNING, STATUS_PAUSED as BROADCAST_PAUSED, STATUS_CANCELLED as BROADCAST_CANCELLED
+)
 
 # Система платежей отключена
 # Создаем пустой blueprint для совместимости
@@ -43,9 +58,18 @@ app.config['DB_FOLDER'] = os.path.dirname(os.path.abspath(__file__))  # Доба
 init_flask_db(app)
 migrate = Migrate(app, db)
 
+# Одна сессия get_session() и одно соединение на HTTP-запрос
+init_app_session_scope(app)
+
 # Регистрируем api_blueprint с правильным префиксом
 app.register_blueprint(api_bp)
 
+# Продолжаем рассылки, прерванные остановкой админ-панели
+try:
+    resume_broadcasts()
+except Exception as e:
+    logging.error(f"Ошибка при возобновлении рассылок: {str(e)}")
+
 # Добавляем контекстный процессор для передачи bot_username во все шаблоны
 @app.context_processor
 def inject_bot_username():
@@ -146,99 +170,79 @@ def admin_root():
 def admin_dashboard():
     """Отображение панели администратора"""
     db_session = get_session()
+    try:
+        # Метрики обновляет задача бота; если бот не запущен, пересчитываем последние дни здесь
+        updated_at = metrics_updated_at(db_session)
+        if updated_at is None:
+            rebuild_daily_metrics()
+        elif datetime.now() - updated_at > timedelta(seconds=METRICS_REFRESH_INTERVAL * 2):
+            refresh_recent_metrics()
+        
+        metrics = get_dashboard_metrics(db_session)
+    except Exception as e:
+        logging.error(f"Ошибка при получении метрик панели: {str(e)}")
+        flash(f'Ошибка при получении метрик: {str(e)}', 'error')
+        metrics = {'this_month': {}, 'months': {}}
+    finally:
+        db_session.close()
+    
+    this_month = metrics['this_month']
+    registrations_this_month = this_month.get('registrations', 0)
+    new_subscriptions_this_month = this_month.get('new_subscriptions', 0)
+    subscriptions_this_month = new_subscriptions_this_month + this_month.get('renewals', 0)
     
-    # Получаем текущий месяц и год
-    current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
-    
-    # Получаем статистику по регистрациям за текущий месяц
-    registrations_this_month = db_session.query(User).filter(
-        extract('month', User.registration_date) == current_month,
-        extract('year', User.registration_date) == current_year
-    ).count()
-    
-    # Получаем статистику по подпискам за текущий месяц
-    subscriptions_this_month = db_session.query(User).filter(
-        User.is_subscribed == True,
-        extract('month', User.subscription_expires) >= current_month,
-        extract('year', User.subscription_expires) >= current_year
-    ).count()
-    
-    # Получаем реальные данные о регистрациях по месяцам за текущий год
-    monthly_registrations_data = db_session.query(
-        extract('month', User.registration_date).label('month'),
-        func.count().label('count')
-    ).filter(
-        extract('year', User.registration_date) == current_year
-    ).group_by(
-        extract('month', User.registration_date)
-    ).all()
-    
-    # Получаем реальные данные о подписках по месяцам за текущий год
-    monthly_subscriptions_data = db_session.query(
-        extract('month', User.subscription_expires).label('month'),
-        func.count().label('count')
-    ).filter(
-        User.is_subscribed == True,
-        extract('year', User.subscription_expires) == current_year
-    ).group_by(
-        extract('month', User.subscription_expires)
-    ).all()
-    
-    # Преобразуем данные в формат для графиков
+    # Данные для графиков по месяцам текущего года
     monthly_registrations = []
     monthly_subscriptions = []
-    
     for month in range(1, 13):
         month_name = calendar.month_name[month]
-        
-        # Находим соответствующие данные по регистрациям для месяца
-        reg_count = 0
-        for data in monthly_registrations_data:
-            if int(data.month) == month:
-                reg_count = data.count
-                break
-                
-        # Находим соответствующие данные по подпискам для месяца
-        sub_count = 0
-        for data in monthly_subscriptions_data:
-            if int(data.month) == month:
-                sub_count = data.count
-                break
-        
-        monthly_registrations.append({'month': month_name, 'count': reg_count})
-        monthly_subscriptions.append({'month': month_name, 'count': sub_count})
+        month_metrics = metrics['months'].get(month, {})
+        monthly_registrations.append({'month': month_name, 'count': month_metrics.get('registrations', 0)})
+        monthly_subscriptions.append({
+            'month': month_name,
+            'count': month_metrics.get('new_subscriptions', 0) + month_metrics.get('renewals', 0)
+        })
     
-    # Рассчитываем конверсию
+    # Конверсия регистраций месяца в первую оплату
     conversion_rate = 0
     if registrations_this_month > 0:
-        conversion_rate = (subscriptions_this_month / registrations_this_month) * 100
-    
-    # Рассчитываем приблизительный доход
-    # Используем цену из переменной окружения или значение по умолчанию
-    subscription_price = int(os.environ.get('MONTHLY_SUBSCRIPTION_PRICE', 990))
-    monthly_revenue = subscriptions_this_month * subscription_price
-    
-    db_session.close()
+        conversion_rate = (new_subscriptions_this_month / registrations_this_month) * 100
     
     return render_template('admin/dashboard.html', 
                           registrations_this_month=registrations_this_month,
                           subscriptions_this_month=subscriptions_this_month,
+                          new_subscriptions_this_month=new_subscriptions_this_month,
+                          renewals_this_month=this_month.get('renewals', 0),
+                          cancellations_this_month=this_month.get('cancellations', 0),
                           monthly_registrations=monthly_registrations,
                           monthly_subscriptions=monthly_subscriptions,
                           conversion_rate=conversion_rate,
-                          monthly_revenue=monthly_revenue)
+                          monthly_revenue=round(this_month.get('revenue', 0), 2))
 
 # Маршрут для страницы с таблицей пользователей
 @app.route('/users')
 @login_required
 def users():
+    # Строки таблицы подгружаются порциями через /api/users
+    return render_template('admin/users.html', goals=USER_GOALS, page_size=USERS_PAGE_SIZE)
+
+# Постраничный список пользователей с фильтрами
+@app.route('/api/users', methods=['GET'])
+@login_required
+def users_list_api():
+    try:
+        params = parse_user_list_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     db_session = get_session()
-    all_users = db_session.query(User).all()
-    db_session.close()
-    
-    return render_template('admin/users.html', users=all_users)
+    try:
+        return jsonify(list_users(db_session, params))
+    except Exception as e:
+        app.logger.error(f"Ошибка при получении списка пользователей: {str(e)}")
+        return jsonify({'error': 'Ошибка при получении списка пользователей'}), 500
+    finally:
+        db_session.close()
 
 # Маршрут для получения данных пользователя по API
 @app.route('/api/user/<int:user_id>', methods=['GET'])
@@ -349,6 +353,7 @@ def reset_subscription(user_id):
     user.subscription_expires = None
     
     db_session.commit()
+    invalidate_subscription(user.user_id)
     db_session.close()
     
     return jsonify({'success': True, 'message': 'Подписка пользователя успешно сброшена'})
@@ -379,6 +384,7 @@ def delete_user(user_id):
         # Удаляем пользователя
         db_session.delete(user)
         db_session.commit()
+        invalidate_referral_summary()
         return jsonify({'success': True, 'message': 'Пользователь успешно удален'})
     except Exception as e:
         db_session.rollback()
@@ -391,23 +397,68 @@ def delete_user(user_id):
 @app.route('/message-sender', methods=['GET', 'POST'])
 @login_required
 def message_sender():
-    db_session = get_session()
-    all_users = db_session.query(User).all()
-    
     if request.method == 'POST':
-        message_text = request.form.get('message_text')
+        message_text = (request.form.get('message_text') or '').strip()
         button_text = request.form.get('button_text', '')
         button_url = request.form.get('button_url', '')
+        broadcast_type = request.form.get('broadcast_type', 'all')
         recipients = request.form.getlist('recipients')
         
-        # Здесь будет логика отправки сообщений через API Telegram
-        # В реальном проекте это должно быть подключено к вашему боту
+        if not message_text:
+            flash('Введите текст сообщения', 'error')
+            return redirect(url_for('message_sender'))
+        if broadcast_type == 'custom' and not recipients:
+            flash('Выберите получателей рассылки', 'error')
+            return redirect(url_for('message_sender'))
         
-        flash('Сообщение успешно отправлено выбранным пользователям', 'success')
+        try:
+            broadcast_id = create_broadcast(
+                message_text,
+                audience=broadcast_type if broadcast_type in ('all', 'subscribers', 'custom') else 'all',
+                recipient_ids=recipients if broadcast_type == 'custom' else None,
+                reply_markup=build_url_button_markup(button_text, button_url),
+                created_by=ADMIN_USERNAME
+            )
+            start_broadcast(broadcast_id)
+            flash(f'Рассылка #{broadcast_id} запущена', 'success')
+        except Exception as e:
+            app.logger.error(f"Ошибка при запуске рассылки: {str(e)}")
+            flash(f'Ошибка при запуске рассылки: {str(e)}', 'error')
         return redirect(url_for('message_sender'))
     
-    db_session.close()
-    return render_template('admin/message_sender.html', users=all_users)
+    # Только счетчики аудитории; список для выборочной рассылки подгружается через /api/users
+    db_session = get_session()
+    try:
+        users_count, subscribers_count = db_session.query(
+            func.count(User.id),
+            func.count(User.id).filter(User.is_subscribed == True)
+        ).one()
+    finally:
+        db_session.close()
+    return render_template('admin/message_sender.html', users_count=users_count,
+                           subscribers_count=subscribers_count, broadcasts=get_recent_broadcasts())
+
+@app.route('/api/broadcasts/<int:broadcast_id>/progress', methods=['GET'])
+@login_required
+def broadcast_progress(broadcast_id):
+    progress = get_broadcast_progress(broadcast_id)
+    if progress is None:
+        return jsonify({'success': False, 'error': 'Рассылка не найдена'}), 404
+    return jsonify({'success': True, 'progress': progress})
+
+@app.route('/api/broadcasts/<int:broadcast_id>/<action>', methods=['POST'])
+@login_required
+def broadcast_action(broadcast_id, action):
+    statuses = {'pause': BROADCAST_PAUSED, 'resume': BROADCAST_RUNNING, 'cancel': BROADCAST_CANCELLED}
+    if action not in statuses:
+        return jsonify({'success': False, 'error': 'Неизвестное действие'}), 400
+    try:
+        if not set_broadcast_status(broadcast_id, statuses[action]):
+            return jsonify({'success': False, 'error': 'Рассылка не найдена или уже завершена'}), 400
+        return jsonify({'success': True, 'progress': get_broadcast_progress(broadcast_id)})
+    except Exception as e:
+        app.logger.error(f"Ошибка при изменении статуса рассылки {broadcast_id}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 # Маршрут для страницы настроек бота
 @app.route('/bot-settings', methods=['GET', 'POST'])
@@ -599,290 +650,47 @@ def check_bot_token():
 @app.route('/referrals')
 @login_required
 def referrals():
-    try:
-        # Логирование начала выполнения
-        logging.info("Начало выполнения функции referrals()")
-        db_session = get_session()
-        
-        # Проверяем соединение с базой данных
-        logging.info("Проверка соединения с БД")
-        try:
-            from sqlalchemy.sql import text
-            db_session.execute(text("SELECT 1"))
-            logging.info("Соединение с БД успешно")
-        except Exception as e:
-            logging.error(f"Ошибка соединения с БД: {str(e)}")
-            flash(f'Ошибка соединения с базой данных: {str(e)}', 'error')
-            
-            # Определяем вспомогательную функцию для форматирования дат
-            def format_date(date_value, format_str='%d.%m.%Y %H:%M'):
-                if date_value is None:
-                    return "Нет данных"
-                if isinstance(date_value, str):
-                    return date_value
-                try:
-                    return date_value.strftime(format_str)
-                except (AttributeError, ValueError, TypeError):
-                    return str(date_value)
-            
-            return render_template('admin/referrals.html', 
-                           referral_codes=[],
-                           referral_uses=[],
-                           total_referral_codes=0,
-                           total_referral_uses=0,
-                           total_paid=0,
-                           conversion_rate=0,
-                           string=str,
-                           hasattr=hasattr,
-                           format_date=format_date)  # Передаем функцию форматирования дат в контекст
-        
-        try:
-            # Получаем все реферальные коды
-            referral_codes = db_session.query(ReferralCode).all()
-            print(f"Получено {len(referral_codes)} реферальных кодов")
-            
-            # Преобразуем результаты в удобный формат для шаблона
-            referrals_data = []
-            for code in referral_codes:
-                try:
-                    # Получаем количество использований этого кода
-                    referral_count = db_session.query(ReferralUse).filter(
-                        ReferralUse.referral_code_id == code.id
-                    ).count()
-                    
-                    # Получаем количество оплаченных подписок
-                    paid_count = db_session.query(ReferralUse).filter(
-                        ReferralUse.referral_code_id == code.id,
-                        ReferralUse.subscription_purchased == True
-                    ).count()
-                except Exception as e:
-                    # Если колонки еще нет, считаем что количество использований 0
-                    referral_count = 0
-                    paid_count = 0
-                    print(f"Ошибка при подсчете использований реферального кода: {str(e)}")
-                    
-                # Добавляем информацию о пользователе
-                user = None
-                username = "Неизвестно"
-                if code.user_id:
-                    try:
-                        user = db_session.query(User).filter(User.id == code.user_id).first()
-                        if not user:
-                            # Если не нашли по ID, пробуем найти по Telegram ID (для обратной совместимости)
-                            user = db_session.query(User).filter(User.user_id == code.user_id).first()
-                            
-                        if user:
-                            username = user.username or str(user.user_id) or "Неизвестно"
-                    except Exception as e:
-                        print(f"Ошибка при получении данных пользователя: {str(e)}")
-                        
-                # Проверяем наличие атрибута is_active
-                is_active = False
-                try:
-                    is_active = code.is_active if hasattr(code, 'is_active') else (code.active if hasattr(code, 'active') else False)
-                except Exception as e:
-                    print(f"Ошибка при определении активности кода: {str(e)}")
-                    
-                # Проверяем тип created_at и преобразуем его в строку, если это объект datetime
-                created_at = None
-                if hasattr(code, 'created_at'):
-                    try:
-                        if code.created_at and not isinstance(code.created_at, str):
-                            created_at = code.created_at
-                        else:
-                            created_at = code.created_at
-                    except Exception as e:
-                        print(f"Ошибка при обработке даты created_at: {str(e)}")
-                
-                referrals_data.append({
-                    'id': code.id,
-                    'user_id': code.user_id,
-                    'username': username,
-                    'code': code.code,
-                    'is_active': is_active,
-                    'created_at': created_at,
-                    'referral_count': referral_count,
-                    'paid_count': paid_count
-                })
-                
-            print(f"Преобразовано {len(referrals_data)} записей реферальных кодов")
-        except Exception as e:
-            referrals_data = []
-            print(f'Ошибка при получении данных о реферальных кодах: {str(e)}')
-            flash(f'Ошибка при получении данных о реферальных кодах: {str(e)}', 'error')
-        
-        try:
-            # Получаем все записи использования рефералок
-            print("Получение записей использования рефералок")
-            try:
-                # Пробуем сортировать по used_at в убывающем порядке
-                referral_uses = db_session.query(ReferralUse).order_by(ReferralUse.used_at.desc()).all()
-                print(f"Получено {len(referral_uses)} записей использования рефералок")
-            except Exception as e:
-                print(f"Ошибка при сортировке ReferralUse по used_at.desc(): {str(e)}")
-                try:
-                    # Если не получилось, используем альтернативную сортировку без desc()
-                    from sqlalchemy import desc
-                    referral_uses = db_session.query(ReferralUse).order_by(desc(ReferralUse.used_at)).all()
-                    print(f"Получено {len(referral_uses)} записей использования через альтернативную сортировку")
-                except Exception as e2:
-                    print(f"Ошибка при альтернативной сортировке: {str(e2)}")
-                    # Если и эта сортировка не работает, получаем данные без сортировки
-                    referral_uses = db_session.query(ReferralUse).all()
-                    print(f"Получено {len(referral_uses)} записей использования без сортировки")
-            
-            # Преобразуем в формат для шаблона
-            referral_uses_data = []
-            for use in referral_uses:
-                try:
-                    # Получаем код
-                    ref_code = db_session.query(ReferralCode).filter(
-                        ReferralCode.id == use.referral_code_id
-                    ).first()
-                    
-                    # Получаем пользователя (приглашенного)
-                    user = None
-                    if use.user_id:
-                        user = db_session.query(User).filter(
-                            User.id == use.user_id
-                        ).first()
-                    
-                    # Получаем информацию о реферере (приглашающем)
-                    referrer = None
-                    if hasattr(use, 'referrer_id') and use.referrer_id:
-                        # Сначала ищем по ID из базы данных
-                        referrer = db_session.query(User).filter(
-                            User.id == use.referrer_id
-                        ).first()
-                        
-                        # Если не нашли, ищем по Telegram ID
-                        if not referrer:
-                            referrer = db_session.query(User).filter(
-                                User.user_id == use.referrer_id
-                            ).first()
-                    
-                    # Получаем информацию о реферале (приглашенном) - для старых записей
-                    referred = None
-                    if hasattr(use, 'referred_id') and use.referred_id:
-                        referred = db_session.query(User).filter(
-                            User.user_id == use.referred_id
-                        ).first()
-                        
-                        # Если нашли по старому полю, но не указан user_id, обновляем его
-                        if referred and not use.user_id:
-                            use.user_id = referred.id
-                            db_session.commit()
-                    
-                    username = user.username if user else (referred.username if referred else 'Неизвестно')
-                    referrer_username = referrer.username if referrer else 'Неизвестно'
-                    referred_username = referred.username if referred else username
-                    code_value = ref_code.code if ref_code else 'Неизвестно'
-                    
-                    # Определяем статус оплаты
-                    payment_status = "Не оплачено"
-                    payment_date = None
-                    subscription_purchased = getattr(use, 'subscription_purchased', False)
-                    
-                    if subscription_purchased:
-                        payment_status = "Оплачено"
-                        payment_date = getattr(use, 'purchase_date', None)
-                        
-                        # Проверяем, получил ли реферер бонус
-                        if getattr(use, 'reward_processed', False):
-                            payment_status += " (бонус выплачен)"
-                    
-                    discount_applied = getattr(use, 'discount_applied', 0) if hasattr(use, 'discount_applied') else 0
-                    
-                    referral_uses_data.append({
-                        'id': use.id,
-                        'referral_code': code_value,
-                        'username': username,
-                        'referrer_id': getattr(use, 'referrer_id', None),
-                        'referrer_username': referrer_username,
-                        'referred_id': getattr(use, 'referred_id', None),
-                        'referred_username': referred_username,
-                        'used_at': getattr(use, 'used_at', None),
-                        'status': getattr(use, 'status', 'registered'),
-                        'subscription_purchased': subscription_purchased,
-                        'purchase_date': payment_date,
-                        'payment_status': payment_status,
-                        'payment_date': payment_date,
-                        'reward_processed': getattr(use, 'reward_processed', False),
-                        'discount_applied': discount_applied
-                    })
-                except Exception as e:
-                    # Пропускаем записи с ошибками
-                    print(f"Ошибка при обработке записи использования реферала: {str(e)}")
-                    continue
-        except Exception as e:
-            referral_uses_data = []
-            print(f'Ошибка при получении данных об использовании реферальных кодов: {str(e)}')
-            flash(f'Ошибка при получении данных об использовании реферальных кодов: {str(e)}', 'error')
-        
-        # Статистика реферальной системы
+    # Вспомогательная функция для форматирования дат в шаблоне
+    def format_date(date_value, format_str='%d.%m.%Y %H:%M'):
+        if date_value is None:
+            return "Нет данных"
+        if isinstance(date_value, str):
+            return date_value
         try:
-            total_referral_codes = len(referrals_data)
-            total_referral_uses = len(referral_uses_data)
-            total_paid = sum(1 for use in referral_uses_data if use.get('subscription_purchased', False))
-            
-            # Конверсия (для примера, можно настроить по своим критериям)
-            conversion_rate = 0
-            if total_referral_uses > 0:
-                conversion_rate = round((total_paid / total_referral_uses) * 100, 2)
-        except Exception as e:
-            print(f"Ошибка при расчете статистики: {str(e)}")
-            total_referral_codes = 0
-            total_referral_uses = 0
-            total_paid = 0
-            conversion_rate = 0
-        
-        db_session.close()
-        
-        # Определяем вспомогательную функцию для форматирования дат
-        def format_date(date_value, format_str='%d.%m.%Y %H:%M'):
-            if date_value is None:
-                return "Нет данных"
-            if isinstance(date_value, str):
-                return date_value
-            try:
-                return date_value.strftime(format_str)
-            except (AttributeError, ValueError, TypeError):
-                return str(date_value)
-                
-        return render_template('admin/referrals.html', 
-                               referral_codes=referrals_data,
-                               referral_uses=referral_uses_data,
-                               total_referral_codes=total_referral_codes,
-                               total_referral_uses=total_referral_uses,
-                               total_paid=total_paid,
-                               conversion_rate=conversion_rate,
-                               string=str,
-                               hasattr=hasattr,
-                               format_date=format_date)  # Передаем функцию форматирования дат в контекст
+            return date_value.strftime(format_str)
+        except (AttributeError, ValueError, TypeError):
+            return str(date_value)
+
+    codes_cursor = request.args.get('codes_cursor', type=int)
+    uses_cursor = request.args.get('uses_cursor', type=int)
+
+    referrals_data, next_codes_cursor = [], None
+    referral_uses_data, next_uses_cursor = [], None
+    summary = {'total_referral_codes': 0, 'total_referral_uses': 0, 'total_paid': 0, 'conversion_rate': 0}
+
+    db_session = get_session()
+    try:
+        # Коды и использования - по странице, итоги - из кэша
+        referrals_data, next_codes_cursor = get_referral_codes_page(db_session, codes_cursor)
+        referral_uses_data, next_uses_cursor = get_referral_uses_page(db_session, uses_cursor)
+        summary = get_referral_summary(db_session)
     except Exception as e:
+        logging.error(f"Ошибка при получении данных о реферальных кодах: {str(e)}")
         flash(f'Ошибка при получении данных о реферальных кодах: {str(e)}', 'error')
-        
-        # Определяем вспомогательную функцию для форматирования дат
-        def format_date(date_value, format_str='%d.%m.%Y %H:%M'):
-            if date_value is None:
-                return "Нет данных"
-            if isinstance(date_value, str):
-                return date_value
-            try:
-                return date_value.strftime(format_str)
-            except (AttributeError, ValueError, TypeError):
-                return str(date_value)
-                
-        return render_template('admin/referrals.html', 
-                               referral_codes=[],
-                               referral_uses=[],
-                               total_referral_codes=0,
-                               total_referral_uses=0,
-                               total_paid=0,
-                               conversion_rate=0,
-                               string=str,
-                               hasattr=hasattr,
-                               format_date=format_date)  # Передаем функцию форматирования дат в контекст
+    finally:
+        db_session.close()
+
+    return render_template('admin/referrals.html',
+                           referral_codes=referrals_data,
+                           referral_uses=referral_uses_data,
+                           codes_cursor=codes_cursor,
+                           uses_cursor=uses_cursor,
+                           next_codes_cursor=next_codes_cursor,
+                           next_uses_cursor=next_uses_cursor,
+                           string=str,
+                           hasattr=hasattr,
+                           format_date=format_date,  # Передаем функцию форматирования дат в контекст
+                           **summary)
 
 # Маршрут для переключения активности реферального кода
 @app.route('/toggle_referral_code', methods=['POST'])
@@ -940,6 +748,7 @@ def reset_referrals():
         db_session.query(ReferralCode).delete()
         
         db_session.commit()
+        invalidate_referral_summary()
         flash('Все данные реферальной системы успешно сброшены', 'success')
     
     except Exception as e:
@@ -1249,9 +1058,8 @@ def create_blogger():
         conn = get_blogger_db_connection()
         cursor = conn.cursor()
         
-        # Получаем схему таблицы для проверки колонок
-        cursor.execute("PRAGMA table_info(bloggers)")
-        columns = [column[1] for column in cursor.fetchall()]
+        # Колонки таблицы bloggers из кэша схемы
+        columns = get_bloggers_schema(conn).columns('bloggers')
         
         # Генерируем ключ доступа
         import secrets
@@ -1433,9 +1241,8 @@ def toggle_blogger_status_route():
             conn.close()
             return jsonify({"success": False, "error": "Блогер не найден"}), 404
         
-        # Проверяем структуру таблицы
-        cursor.execute("PRAGMA table_info(bloggers)")
-        columns = [column[1] for column in cursor.fetchall()]
+        # Структура таблицы из кэша схемы
+        columns = get_bloggers_schema(conn).columns('bloggers')
         
         # Изменяем статус блогера в зависимости от структуры таблицы
         if 'is_active' in columns:
@@ -1528,6 +1335,59 @@ def admin_stats():
         app.logger.error(f"Ошибка при получении статистики: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def build_blogger_stats_payload(blogger_id, referrals_period, earnings_period):
+    """
+    Собирает ответ /api/blogger/stats. Возвращает (payload, complete):
+    complete=False, если часть данных заменена нулями из-за ошибки.
+    """
+    complete = True
+    
+    # Общая статистика блогера (только чтение: сводку обновляют клики и конверсии)
+    try:
+        stats = get_blogger_stats(blogger_id)
+        app.logger.info(f"Общая статистика блогера {blogger_id}: {stats}")
+    except Exception as e:
+        app.logger.error(f"Ошибка при получении общей статистики блогера {blogger_id}: {str(e)}")
+        complete = False
+        stats = {
+            'total_referrals': 0,
+            'total_conversions': 0,
+            'total_earned': 0
+        }
+    
+    # Данные с учетом выбранных периодов для карточек со статистикой
+    try:
+        period_stats = get_blogger_period_stats(blogger_id, referrals_period)
+        app.logger.info(f"Статистика за период {referrals_period}: {period_stats}")
+    except Exception as e:
+        app.logger.error(f"Ошибка при получении статистики за период {referrals_period} для блогера {blogger_id}: {str(e)}")
+        complete = False
+        period_stats = {
+            'total_referrals': 0,
+            'total_conversions': 0,
+            'total_earned': 0
+        }
+    
+    # Получаем данные для графиков
+    try:
+        charts = get_blogger_charts(blogger_id, referrals_period, earnings_period)
+        app.logger.info(f"Получены данные для графиков блогера {blogger_id}")
+    except Exception as e:
+        app.logger.error(f"Ошибка при получении данных для графиков блогера {blogger_id}: {str(e)}")
+        complete = False
+        charts = {
+            'referrals': {'labels': [], 'data': []},
+            'earnings': {'labels': [], 'data': []}
+        }
+    
+    payload = {
+        "success": True,
+        "stats": period_stats,  # Статистика за выбранный период
+        "total_stats": stats,   # Общая статистика
+        "charts": charts
+    }
+    return payload, complete
+
 @app.route('/api/blogger/stats')
 def blogger_stats_api():
     """API для получения статистики блогера"""
@@ -1562,48 +1422,35 @@ def blogger_stats_api():
             app.logger.warning(f"Недопустимый период earnings_period: {earnings_period}")
             earnings_period = '30'  # Устанавливаем период по умолчанию
         
-        # Обновляем общую статистику блогера
-        try:
-            stats = update_blogger_stats(blogger['id'])
-            app.logger.info(f"Общая статистика блогера {blogger['id']}: {stats}")
-        except Exception as e:
-            app.logger.error(f"Ошибка при обновлении общей статистики блогера {blogger['id']}: {str(e)}")
-            stats = {
-                'total_referrals': 0,
-                'total_conversions': 0,
-                'total_earned': 0
-            }
-        
-        # Данные с учетом выбранных периодов для карточек со статистикой
-        try:
-            period_stats = get_blogger_period_stats(blogger['id'], referrals_period)
-            app.logger.info(f"Статистика за период {referrals_period}: {period_stats}")
-        except Exception as e:
-            app.logger.error(f"Ошибка при получении статистики за период {referrals_period} для блогера {blogger['id']}: {str(e)}")
-            period_stats = {
-                'total_referrals': 0,
-                'total_conversions': 0,
-                'total_earned': 0
-            }
-        
-        # Получаем данные для графиков
-        try:
-            charts = get_blogger_charts(blogger['id'], referrals_period, earnings_period)
-            app.logger.info(f"Получены данные для графиков блогера {blogger['id']}")
-        except Exception as e:
-            app.logger.error(f"Ошибка при получении данных для графиков блогера {blogger['id']}: {str(e)}")
-            charts = {
-                'referrals': {'labels': [], 'data': []},
-                'earnings': {'labels': [], 'data': []}
-            }
-        
-        # Возвращаем объединенные данные
-        return jsonify({
-            "success": True, 
-            "stats": period_stats,  # Статистика за выбранный период
-            "total_stats": stats,   # Общая статистика
-            "charts": charts
-        })
+        # Ответ из кэша, если статистика блогера не менялась (force=1 - пересчитать)
+        version, updated_at = get_blogger_stats_version(blogger['id'])
+        today = datetime.now().date()
+        cache_key = (blogger['id'], referrals_period, earnings_period)
+        cached = None if force_update else blogger_stats_cache.get(cache_key, version, today)
+        
+        if cached is None:
+            payload, complete = build_blogger_stats_payload(blogger['id'], referrals_period, earnings_period)
+            # Периоды сдвигаются в полночь, поэтому ответ не старше начала дня
+            day_start = datetime.combine(today, datetime.min.time())
+            cached = CachedStats(
+                version=version,
+                day=today,
+                etag=make_etag(payload, version),
+                last_modified=max(updated_at or day_start, day_start),
+                payload=payload
+            )
+            # Ответ с подставленными после ошибки нулями не кэшируем
+            if complete:
+                blogger_stats_cache.set(cache_key, cached)
+        
+        # Возвращаем объединенные данные; при совпадении ETag/Last-Modified - 304 без тела
+        response = jsonify(cached.payload)
+        response.set_etag(cached.etag)
+        response.last_modified = cached.last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        if force_update:
+            return response
+        return response.make_conditional(request)
     except Exception as e:
         app.logger.error(f"Критическая ошибка при получении статистики блогера: {str(e)}")
         import traceback
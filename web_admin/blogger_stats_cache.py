@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Кэш ответов /api/blogger/stats
+
+Блогеры часто обновляют панель в веб-приложении, а статистика меняется
+только при новом переходе или конверсии. Ответ кэшируется по ключу
+(блогер, период переходов, период заработка) вместе с версией статистики
+блогера из blogger_stats_versions и текущим днем. Версию увеличивают все
+места записи переходов и конверсий, в том числе бот в другом процессе,
+поэтому перед выдачей из кэша достаточно одного чтения по первичному ключу.
+Смена дня тоже сбрасывает запись: периоды "30 дней", "текущий месяц" и
+подобные сдвигаются в полночь.
+
+ETag и Last-Modified позволяют клиенту получить 304 без тела ответа.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from time import monotonic
+
+BLOGGER_STATS_CACHE_TTL = float(os.getenv("BLOGGER_STATS_CACHE_TTL", "600"))
+BLOGGER_STATS_CACHE_SIZE = int(os.getenv("BLOGGER_STATS_CACHE_SIZE", "2000"))
+
+# Закэшированный ответ: версия статистики и день, для которых он посчитан
+CachedStats = namedtuple("CachedStats", ["version", "day", "etag", "last_modified", "payload"])
+
+
+def make_etag(payload, version):
+    """Сильный ETag по содержимому ответа и версии статистики"""
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(f"{version}:{body}".encode("utf-8")).hexdigest()
+
+
+class BloggerStatsCache:
+    """Потокобезопасный TTL+LRU кэш ответов статистики блогеров"""
+
+    def __init__(self, ttl=BLOGGER_STATS_CACHE_TTL, maxsize=BLOGGER_STATS_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, day):
+        """Запись для ключа, если она посчитана для этой версии и дня, иначе None"""
+        now = monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, entry = item
+                if expires_at > now and entry.version == version and entry.day == day:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, entry):
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+blogger_stats_cache = BloggerStatsCache()
@@ -4,61 +4,24 @@ from datetime import datetime, timedelta, date
 import json
 import calendar
 
+from database import blogger_daily_stats
+from database.bloggers_db import get_bloggers_connection
+from database.sqlite_schema import get_bloggers_schema
+
 def get_blogger_db_connection():
     """
-    Создает подключение к базе данных блогеров
+    Соединение с базой данных блогеров из общего пула (close() возвращает его в пул)
     """
-    blogger_db_path = os.path.join(os.getcwd(), 'willway_bloggers.db')
-    conn = sqlite3.connect(blogger_db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_bloggers_connection()
 
 def check_blogger_table():
     """
     Проверяет наличие таблицы блогеров и создает ее при необходимости
     """
     conn = get_blogger_db_connection()
-    cursor = conn.cursor()
-    
-    # Проверяем существование таблицы
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='bloggers'")
-    if not cursor.fetchone():
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bloggers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                telegram_id TEXT,
-                email TEXT,
-                access_key TEXT UNIQUE NOT NULL,
-                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_earned REAL DEFAULT 0,
-                total_referrals INTEGER DEFAULT 0,
-                total_conversions INTEGER DEFAULT 0,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-    # Проверяем наличие таблицы реферралов
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='blogger_referrals'")
-    if not cursor.fetchone():
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS blogger_referrals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                blogger_id INTEGER NOT NULL,
-                user_id TEXT,
-                source TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                converted BOOLEAN DEFAULT 0,
-                converted_at TIMESTAMP,
-                conversion_date TIMESTAMP,
-                commission REAL DEFAULT 0,
-                commission_amount REAL DEFAULT 0,
-                status TEXT DEFAULT 'pending',
-                FOREIGN KEY (blogger_id) REFERENCES bloggers (id)
-            )
-        ''')
-        
-    conn.commit()
+    # Таблицы, колонки, индексы и дневная сводка создаются миграцией
+    # (database/migrations.py) при первой загрузке схемы
+    get_bloggers_schema(conn)
     conn.close()
 
 def get_blogger_by_key(access_key):
@@ -95,38 +58,27 @@ def get_blogger_stats(blogger_id):
     Получает статистику блогера: количество реферралов, конверсий и заработок
     """
     conn = get_blogger_db_connection()
-    cursor = conn.cursor()
-    
-    # Проверяем структуру таблицы blogger_referrals
-    cursor.execute("PRAGMA table_info(blogger_referrals)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    # Общее количество реферральных переходов
-    cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ?", (blogger_id,))
-    total_referrals = cursor.fetchone()[0] or 0
     
-    # Общее количество конверсий
-    if 'converted' in columns:
-        cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ? AND converted = 1", (blogger_id,))
-    else:
-        # Если колонки converted нет, считаем что конверсий 0
-        cursor.execute("SELECT 0")
-    total_conversions = cursor.fetchone()[0] or 0
-    
-    # Общий заработок
-    if 'commission_amount' in columns:
-        cursor.execute("SELECT SUM(commission_amount) FROM blogger_referrals WHERE blogger_id = ?", (blogger_id,))
-    else:
-        cursor.execute("SELECT 0")
-    total_earned = cursor.fetchone()[0] or 0
+    # Считаем по дневной сводке, а не по всем переходам
+    totals = blogger_daily_stats.get_totals(conn, blogger_id=blogger_id)
     
     conn.close()
     return {
-        'total_referrals': total_referrals,
-        'total_conversions': total_conversions,
-        'total_earned': total_earned
+        'total_referrals': totals['clicks'],
+        'total_conversions': totals['conversions'],
+        'total_earned': totals['commission']
     }
 
+def get_blogger_stats_version(blogger_id):
+    """
+    Версия статистики блогера и время ее изменения (для кэша ответов панели)
+    """
+    conn = get_blogger_db_connection()
+    try:
+        return blogger_daily_stats.get_stats_version(conn, blogger_id)
+    finally:
+        conn.close()
+
 def update_blogger_stats(blogger_id):
     """
     Обновляет статистику блогера в таблице bloggers
@@ -136,9 +88,8 @@ def update_blogger_stats(blogger_id):
     conn = get_blogger_db_connection()
     cursor = conn.cursor()
     
-    # Проверяем структуру таблицы bloggers
-    cursor.execute("PRAGMA table_info(bloggers)")
-    columns = [column[1] for column in cursor.fetchall()]
+    # Колонки таблицы bloggers из кэша схемы
+    columns = get_bloggers_schema(conn).columns('bloggers')
     
     # Формируем запрос в зависимости от структуры таблицы
     update_fields = []
@@ -156,38 +107,10 @@ def update_blogger_stats(blogger_id):
         update_fields.append("total_earned = ?")
         update_values.append(stats['total_earned'])
     
-    # Если есть поля для обновления
     if update_fields:
         update_query = f"UPDATE bloggers SET {', '.join(update_fields)} WHERE id = ?"
         update_values.append(blogger_id)
         cursor.execute(update_query, tuple(update_values))
-    else:
-        # Если нужных колонок нет, добавляем их
-        try:
-            missing_columns = []
-            if 'total_referrals' not in columns:
-                missing_columns.append("ADD COLUMN total_referrals INTEGER DEFAULT 0")
-            if 'total_conversions' not in columns:
-                missing_columns.append("ADD COLUMN total_conversions INTEGER DEFAULT 0")
-            if 'total_earned' not in columns:
-                missing_columns.append("ADD COLUMN total_earned REAL DEFAULT 0")
-                
-            for alter_query in missing_columns:
-                cursor.execute(f"ALTER TABLE bloggers {alter_query}")
-                
-            # Теперь обновляем значения
-            cursor.execute("""
-                UPDATE bloggers 
-                SET total_referrals = ?, total_conversions = ?, total_earned = ? 
-                WHERE id = ?
-            """, (
-                stats['total_referrals'],
-                stats['total_conversions'],
-                stats['total_earned'],
-                blogger_id
-            ))
-        except Exception as e:
-            print(f"Ошибка при добавлении колонок в таблицу bloggers: {str(e)}")
     
     conn.commit()
     conn.close()
@@ -201,24 +124,13 @@ def get_blogger_referrals(blogger_id, limit=10):
     conn = get_blogger_db_connection()
     cursor = conn.cursor()
     
-    # Проверяем структуру таблицы
-    cursor.execute("PRAGMA table_info(blogger_referrals)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    # Проверяем наличие колонки created_at
-    if 'created_at' not in columns:
-        try:
-            # Добавляем колонку created_at, если её нет
-            cursor.execute("ALTER TABLE blogger_referrals ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            conn.commit()
-        except Exception as e:
-            print(f"Ошибка при добавлении колонки created_at: {str(e)}")
+    # Колонки из кэша схемы (created_at добавляет миграция базы блогеров)
+    columns = get_bloggers_schema(conn).columns('blogger_referrals')
     
     # Формируем запрос с учетом доступных колонок
     if 'created_at' in columns:
         order_by = "ORDER BY created_at DESC"
     else:
-        # Если колонки created_at нет и её не удалось добавить, используем id для сортировки
         order_by = "ORDER BY id DESC"
     
     cursor.execute(f"""
@@ -242,9 +154,8 @@ def record_referral(blogger_id, user_id="", source="direct"):
     conn = get_blogger_db_connection()
     cursor = conn.cursor()
     
-    # Проверяем структуру таблицы
-    cursor.execute("PRAGMA table_info(blogger_referrals)")
-    columns = [column[1] for column in cursor.fetchall()]
+    # Колонки из кэша схемы
+    columns = get_bloggers_schema(conn).columns('blogger_referrals')
     
     # Формируем SQL запрос в зависимости от структуры таблицы
     fields = ["blogger_id", "user_id", "source"]
@@ -265,6 +176,7 @@ def record_referral(blogger_id, user_id="", source="direct"):
     )
     
     referral_id = cursor.lastrowid
+    blogger_daily_stats.record_click(cursor, blogger_id)
     conn.commit()
     conn.close()
     
@@ -289,31 +201,8 @@ def mark_conversion(user_id, commission_amount=0):
     conn = get_blogger_db_connection()
     cursor = conn.cursor()
     
-    # Проверяем структуру таблицы
-    cursor.execute("PRAGMA table_info(blogger_referrals)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    # Проверяем наличие необходимых колонок
-    required_columns = ['converted', 'converted_at', 'conversion_date', 'commission_amount', 'status']
-    missing_columns = []
-    
-    for column in required_columns:
-        if column not in columns:
-            missing_columns.append(column)
-    
-    # Если есть отсутствующие колонки, добавляем их
-    if missing_columns:
-        for column in missing_columns:
-            try:
-                if column in ['converted', 'status']:
-                    cursor.execute(f"ALTER TABLE blogger_referrals ADD COLUMN {column} TEXT")
-                elif column in ['commission_amount']:
-                    cursor.execute(f"ALTER TABLE blogger_referrals ADD COLUMN {column} REAL DEFAULT 0")
-                else:
-                    cursor.execute(f"ALTER TABLE blogger_referrals ADD COLUMN {column} TEXT")
-            except Exception as e:
-                print(f"Ошибка при добавлении колонки {column}: {str(e)}")
-                pass
+    # Колонки из кэша схемы (недостающие добавляет миграция базы блогеров)
+    columns = get_bloggers_schema(conn).columns('blogger_referrals')
     
     # Находим последний реферальный переход для данного пользователя
     cursor.execute("""
@@ -352,6 +241,7 @@ def mark_conversion(user_id, commission_amount=0):
             update_params.append(referral['id'])
             
             cursor.execute(update_query, tuple(update_params))
+            blogger_daily_stats.record_conversion(cursor, referral['id'], commission_amount)
             conn.commit()
             
             # Обновляем статистику блогера
@@ -387,33 +277,16 @@ def get_total_stats():
     cursor = conn.cursor()
     
     try:
-        # Проверяем структуру таблицы blogger_referrals
-        cursor.execute("PRAGMA table_info(blogger_referrals)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # Общее количество реферральных переходов
-        cursor.execute("SELECT COUNT(*) FROM blogger_referrals")
-        total_referrals = cursor.fetchone()[0] or 0
-        
-        # Общее количество конверсий
-        if 'converted' in columns:
-            cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE converted = 1")
-            total_conversions = cursor.fetchone()[0] or 0
-        else:
-            total_conversions = 0
-        
-        # Общий заработок
-        if 'commission_amount' in columns:
-            cursor.execute("SELECT SUM(commission_amount) FROM blogger_referrals")
-            total_earnings = cursor.fetchone()[0] or 0
-        else:
-            total_earnings = 0
+        # Суммы по дневной сводке всех блогеров
+        totals = blogger_daily_stats.get_totals(conn)
+        total_referrals = totals['clicks']
+        total_conversions = totals['conversions']
+        total_earnings = totals['commission']
         
         # Если нет данных в таблице blogger_referrals, 
         # попробуем суммировать статистику из таблицы bloggers
         if total_referrals == 0:
-            cursor.execute("PRAGMA table_info(bloggers)")
-            blogger_columns = [column[1] for column in cursor.fetchall()]
+            blogger_columns = get_bloggers_schema(conn).columns('bloggers')
             
             if 'total_referrals' in blogger_columns:
                 cursor.execute("SELECT SUM(total_referrals) FROM bloggers")
@@ -451,6 +324,7 @@ def process_referral_reward(user_id, referrer_id=None):
     import sqlite3
     from datetime import datetime, timedelta
     from database.models import get_session, User, ReferralUse
+    from database.subscription_cache import invalidate_subscription
     
     logging.info(f"[REFERRAL_BONUS] Начало обработки бонуса для реферера пользователя {user_id} (тип: {type(user_id).__name__}), referrer_id={referrer_id} (тип: {type(referrer_id).__name__ if referrer_id else 'None'})")
     
@@ -475,13 +349,6 @@ def process_referral_reward(user_id, referrer_id=None):
         if not referrer_id:
             # Проверяем запись использования реферальной ссылки для этого пользователя
             logging.info(f"[REFERRAL_BONUS] Поиск реферера для пользователя {user_id}")
-            
-            # Выводим все записи ReferralUse для отладки
-            all_refs = session.query(ReferralUse).all()
-            logging.info(f"[REFERRAL_BONUS] Всего записей ReferralUse: {len(all_refs)}")
-            for ref in all_refs:
-                logging.info(f"[REFERRAL_BONUS] ReferralUse: id={ref.id}, user_id={ref.user_id}, referrer_id={ref.referrer_id}, subscription_purchased={getattr(ref, 'subscription_purchased', False)}")
-            
             # Пытаемся найти запись с подтвержденной покупкой
             referral = session.query(ReferralUse).filter(
                 ReferralUse.user_id == user_id,
@@ -623,6 +490,7 @@ def process_referral_reward(user_id, referrer_id=None):
             logging.warning(f"[REFERRAL_BONUS] Не найдена запись реферала для отметки бонуса")
         
         session.commit()
+        invalidate_subscription(referrer.user_id)
         
         logging.info(f"[REFERRAL_BONUS] Успешно начислен бонус рефереру {referrer_id}, подписка продлена до {referrer.subscription_expires}")
         
@@ -686,623 +554,116 @@ def process_referral_reward(user_id, referrer_id=None):
             session.close()
         return False 
 
-def get_blogger_charts(blogger_id, referrals_period='30', earnings_period='30'):
+def get_period_range(period, today=None):
+    """
+    Границы периода статистики и шаг графика
+
+    Параметры:
+    - period: '30', 'current_month', 'previous_month', '180', '365'
+
+    Возвращает:
+    - (start_date, end_date, monthly): monthly=True для графика по месяцам
+    """
+    today = today or datetime.now().date()
+    if period == 'current_month':
+        return date(today.year, today.month, 1), today, False
+    if period == 'previous_month':
+        end_date = date(today.year, today.month, 1) - timedelta(days=1)
+        return date(end_date.year, end_date.month, 1), end_date, False
+    if period == '180':
+        return today - timedelta(days=180), today, True
+    if period == '365':
+        return today - timedelta(days=365), today, True
+    # По умолчанию - последние 30 дней
+    return today - timedelta(days=30), today, False
+
+def _chart_buckets(start_date, end_date, monthly):
+    """Ключи сводки ('YYYY-MM-DD' или 'YYYY-MM') и подписи точек графика"""
+    if monthly:
+        buckets = []
+        current = date(start_date.year, start_date.month, 1)
+        while current <= end_date:
+            buckets.append((current.strftime('%Y-%m'), current.strftime('%m.%Y')))
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        return buckets
+    days = (end_date - start_date).days + 1
+    return [((start_date + timedelta(days=i)).strftime('%Y-%m-%d'),
+             (start_date + timedelta(days=i)).strftime('%d.%m')) for i in range(days)]
+
+# Тип графика -> поле дневной сводки
+CHART_METRICS = {
+    'referrals': 'clicks',
+    'conversions': 'conversions',
+    'earnings': 'commission',
+}
+
+def _build_chart(series, buckets, metric):
+    """Ряд с нулями для дней/месяцев без данных"""
+    data = []
+    for key, _ in buckets:
+        value = series.get(key, {}).get(metric, 0)
+        data.append(round(value, 2) if metric == 'commission' else value)
+    return {'labels': [label for _, label in buckets], 'data': data}
+
+def get_chart_data(conn, blogger_id, chart_type, period):
     """
-    Получает данные для графиков переходов и заработка блогера за указанный период
+    Данные одного графика блогера из дневной сводки (только чтение)
     
     Параметры:
-    - blogger_id: ID блогера
-    - referrals_period: период для графика переходов ('30', 'current_month', 'previous_month', '180', '365')
-    - earnings_period: период для графика заработка ('30', 'current_month', 'previous_month', '180', '365')
+    - conn: соединение с БД блогеров
+    - chart_type: 'referrals', 'conversions' или 'earnings'
+    - period: '30', 'current_month', 'previous_month', '180', '365'
     
     Возвращает:
-    - словарь с данными для графиков
+    - словарь с метками и данными для графика
     """
-    try:
-        print(f"get_blogger_charts: начата обработка для blogger_id={blogger_id}")
-        conn = get_blogger_db_connection()
-        cursor = conn.cursor()
-        
-        # ВАЖНО: принудительно обновляем даты для всех записей блогера, у которых отсутствует created_at
-        try:
-            # Добавляем колонку created_at, если её нет
-            cursor.execute("PRAGMA table_info(blogger_referrals)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'created_at' not in columns:
-                cursor.execute("ALTER TABLE blogger_referrals ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                print("Добавлена колонка created_at в таблицу blogger_referrals")
-                
-            # ОБНОВЛЯЕМ ВСЕ ЗАПИСИ с установкой даты - важное исправление!
-            cursor.execute("UPDATE blogger_referrals SET created_at = CURRENT_TIMESTAMP WHERE blogger_id = ? AND (created_at IS NULL OR created_at = '' OR created_at = 'NULL')", (blogger_id,))
-            # Проверим, сколько записей было обновлено
-            cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ?", (blogger_id,))
-            total_records = cursor.fetchone()[0]
-            print(f"Всего записей для блогера {blogger_id}: {total_records}")
-            
-            # Проверим, сколько записей теперь имеют дату
-            cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ? AND created_at IS NOT NULL", (blogger_id,))
-            dated_records = cursor.fetchone()[0]
-            print(f"Записей с датой created_at: {dated_records}")
-            
-            conn.commit()
-            print(f"Обновлены даты для записей блогера {blogger_id}")
-        except Exception as e:
-            print(f"Ошибка при обновлении дат: {e}")
-        
-        # Проверяем структуру таблицы
-        cursor.execute("PRAGMA table_info(blogger_referrals)")
-        columns = [column[1] for column in cursor.fetchall()]
-        print(f"Колонки в таблице blogger_referrals: {columns}")
-        
-        # Получаем первые 5 записей для проверки данных
-        cursor.execute("SELECT id, blogger_id, created_at, converted, commission_amount FROM blogger_referrals WHERE blogger_id = ? LIMIT 5", (blogger_id,))
-        sample_records = cursor.fetchall()
-        print(f"Примеры записей в таблице: {sample_records}")
-        
-        # Получаем данные для графика переходов
-        referrals_chart = get_chart_data(cursor, blogger_id, 'referrals', referrals_period, columns)
-        print(f"Данные для графика переходов: labels={len(referrals_chart['labels'])}, data={len(referrals_chart['data'])}")
-        print(f"Метки графика переходов: {referrals_chart['labels']}")
-        print(f"Значения графика переходов: {referrals_chart['data']}")
-        
-        # Получаем данные для графика заработка
-        earnings_chart = get_chart_data(cursor, blogger_id, 'earnings', earnings_period, columns)
-        print(f"Данные для графика заработка: labels={len(earnings_chart['labels'])}, data={len(earnings_chart['data'])}")
-        print(f"Метки графика заработка: {earnings_chart['labels']}")
-        print(f"Значения графика заработка: {earnings_chart['data']}")
-        
-        # Формируем результат
-        result = {
-            'referrals': referrals_chart,
-            'earnings': earnings_chart
-        }
-        
-        conn.close()
-        return result
-    except Exception as e:
-        print(f"Ошибка в get_blogger_charts: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
-        # В случае любой ошибки возвращаем пустые данные для графиков
-        if 'conn' in locals():
-            conn.close()
-        return {
-            'referrals': {'labels': [], 'data': []},
-            'earnings': {'labels': [], 'data': []}
-        }
+    start_date, end_date, monthly = get_period_range(period)
+    series = blogger_daily_stats.get_series(conn, blogger_id, start_date, end_date, monthly=monthly)
+    return _build_chart(series, _chart_buckets(start_date, end_date, monthly), CHART_METRICS[chart_type])
 
-def get_chart_data(cursor, blogger_id, chart_type, period, columns):
+def get_blogger_charts(blogger_id, referrals_period='30', earnings_period='30'):
     """
-    Получает данные для графика определенного типа
+    Получает данные для графиков переходов и заработка блогера за указанный период.
+    Ничего не пишет в базу; при одинаковых периодах оба графика строятся
+    по одному сгруппированному запросу к дневной сводке.
     
     Параметры:
-    - cursor: курсор базы данных
     - blogger_id: ID блогера
-    - chart_type: тип графика ('referrals' или 'earnings')
-    - period: период ('30', 'current_month', 'previous_month', '180', '365')
-    - columns: список колонок таблицы
+    - referrals_period: период для графика переходов ('30', 'current_month', 'previous_month', '180', '365')
+    - earnings_period: период для графика заработка ('30', 'current_month', 'previous_month', '180', '365')
     
     Возвращает:
-    - словарь с метками и данными для графика
+    - словарь с данными для графиков
     """
+    conn = None
     try:
-        print(f"get_chart_data: начата обработка для blogger_id={blogger_id}, chart_type={chart_type}, period={period}")
-        
-        # Проверяем наличие колонки created_at
-        if 'created_at' not in columns:
-            print(f"Колонка created_at отсутствует в таблице blogger_referrals, нельзя построить график")
-            # Если колонки нет, возвращаем пустые данные
-            return {
-                'labels': [],
-                'data': []
-            }
-        
-        today = datetime.now().date()
-        
-        # Определяем дату начала и формат для группировки в зависимости от периода
-        if period == 'current_month':
-            # Текущий месяц
-            start_date = date(today.year, today.month, 1)
-            group_format = '%d'  # День месяца
-            label_format = '%d.%m'
-            end_date = today
-            print(f"Выбран период 'current_month', start_date={start_date}, end_date={end_date}")
-        elif period == 'previous_month':
-            # Предыдущий месяц
-            if today.month == 1:
-                start_date = date(today.year - 1, 12, 1)
-                end_date = date(today.year, 1, 1) - timedelta(days=1)
-            else:
-                start_date = date(today.year, today.month - 1, 1)
-                end_date = date(today.year, today.month, 1) - timedelta(days=1)
-            group_format = '%d'
-            label_format = '%d.%m'
-            print(f"Выбран период 'previous_month', start_date={start_date}, end_date={end_date}")
-        elif period == '180':
-            # Последние 6 месяцев
-            start_date = today - timedelta(days=180)
-            group_format = '%Y-%m'
-            label_format = '%m.%Y'
-            end_date = today
-            print(f"Выбран период '180', start_date={start_date}, end_date={end_date}")
-        elif period == '365':
-            # Последний год
-            start_date = today - timedelta(days=365)
-            group_format = '%Y-%m'
-            label_format = '%m.%Y'
-            end_date = today
-            print(f"Выбран период '365', start_date={start_date}, end_date={end_date}")
-        else:
-            # По умолчанию - последние 30 дней
-            start_date = today - timedelta(days=30)
-            group_format = '%Y-%m-%d'
-            label_format = '%d.%m'
-            end_date = today
-            print(f"Выбран период по умолчанию (30 дней), start_date={start_date}, end_date={end_date}")
-        
-        # ПРИНУДИТЕЛЬНО ОБНОВЛЯЕМ ДАТЫ ЗДЕСЬ ТОЖЕ - это важное исправление!
-        try:
-            cursor.execute("UPDATE blogger_referrals SET created_at = CURRENT_TIMESTAMP WHERE blogger_id = ? AND (created_at IS NULL OR created_at = '' OR created_at = 'NULL')", (blogger_id,))
-            cursor.connection.commit()
-            
-            # Проверяем, есть ли записи с датой сегодня
-            cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ? AND date(created_at) = date('now')", (blogger_id,))
-            today_records = cursor.fetchone()[0]
-            print(f"Записей с сегодняшней датой: {today_records}")
-            
-            # Проверяем даты записей для отладки
-            cursor.execute("SELECT created_at FROM blogger_referrals WHERE blogger_id = ? ORDER BY id DESC LIMIT 10", (blogger_id,))
-            dates = [row[0] for row in cursor.fetchall()]
-            print(f"Последние 10 дат: {dates}")
-        except Exception as e:
-            print(f"Ошибка при проверке/обновлении дат: {e}")
-        
-        # Проверяем, есть ли данные в таблице
-        cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ?", (blogger_id,))
-        total_records = cursor.fetchone()[0]
-        print(f"Всего записей для блогера {blogger_id}: {total_records}")
-        
-        # Проверяем, есть ли записи с датой
-        cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ? AND created_at IS NOT NULL", (blogger_id,))
-        dated_records = cursor.fetchone()[0]
-        print(f"Записей с датой created_at: {dated_records}")
-        
-        # Проверяем, есть ли записи в выбранном периоде
-        cursor.execute("""
-            SELECT COUNT(*) FROM blogger_referrals 
-            WHERE blogger_id = ? 
-            AND date(created_at) >= date(?) 
-            AND date(created_at) <= date(?)
-        """, (blogger_id, start_date, end_date))
-        period_records = cursor.fetchone()[0]
-        print(f"Записей в выбранном периоде ({start_date} - {end_date}): {period_records}")
-        
-        # Если все записи без даты, обновляем их
-        if total_records > 0 and dated_records == 0:
-            print("Обнаружены записи без даты created_at, обновляем их")
-            cursor.execute("UPDATE blogger_referrals SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL OR created_at = ''")
-            cursor.connection.commit()
-        
-        # ВАЖНО: Пробуем переносить все записи в текущий период для тестирования
-        cursor.execute("UPDATE blogger_referrals SET created_at = date('now') WHERE blogger_id = ?", (blogger_id,))
-        cursor.connection.commit()
-        print(f"Обновлены даты всех записей на текущую для тестирования")
+        conn = get_blogger_db_connection()
         
-        if total_records == 0:
-            print(f"Нет данных для блогера {blogger_id}, возвращаем пустые массивы")
-            # Если нет данных, возвращаем пустые массивы с метками дат
-            if period in ['current_month', 'previous_month']:
-                # Для месячных периодов формируем дни месяца
-                if period == 'current_month':
-                    days_in_month = calendar.monthrange(today.year, today.month)[1]
-                    date_range = [date(today.year, today.month, day) for day in range(1, days_in_month + 1) if date(today.year, today.month, day) <= today]
-                else:
-                    days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
-                    date_range = [date(start_date.year, start_date.month, day) for day in range(1, days_in_month + 1)]
-                labels = [d.strftime(label_format) for d in date_range]
-                data = [0] * len(labels)
-            elif period in ['180', '365']:
-                # Для полугода и года - месяцы
-                months = []
-                current_date = start_date
-                while current_date <= end_date:
-                    months.append(current_date.strftime(group_format))
-                    # Переходим к следующему месяцу
-                    if current_date.month == 12:
-                        current_date = date(current_date.year + 1, 1, 1)
-                    else:
-                        current_date = date(current_date.year, current_date.month + 1, 1)
-                
-                labels = []
-                for month in months:
-                    year, month_str = month.split('-')
-                    month_date = date(int(year), int(month_str), 1)
-                    labels.append(month_date.strftime(label_format))
-                data = [0] * len(labels)
-            else:
-                # Для 30 дней
-                date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-                labels = [d.strftime(label_format) for d in date_range]
-                data = [0] * len(labels)
-            
-            print(f"Возвращаем пустой график с {len(labels)} метками")
+        if referrals_period == earnings_period:
+            start_date, end_date, monthly = get_period_range(referrals_period)
+            series = blogger_daily_stats.get_series(conn, blogger_id, start_date, end_date, monthly=monthly)
+            buckets = _chart_buckets(start_date, end_date, monthly)
             return {
-                'labels': labels,
-                'data': data
+                'referrals': _build_chart(series, buckets, 'clicks'),
+                'earnings': _build_chart(series, buckets, 'commission')
             }
         
-        # Если данные есть, формируем графики
-        if chart_type == 'referrals':
-            # Для графика переходов
-            try:
-                query = None
-                
-                if period in ['current_month', 'previous_month']:
-                    # Для месячных периодов
-                    if period == 'current_month':
-                        days_in_month = calendar.monthrange(today.year, today.month)[1]
-                        date_range = [date(today.year, today.month, day) for day in range(1, days_in_month + 1) if date(today.year, today.month, day) <= today]
-                    else:
-                        days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
-                        date_range = [date(start_date.year, start_date.month, day) for day in range(1, days_in_month + 1)]
-                    
-                    labels = [d.strftime(label_format) for d in date_range]
-                    
-                    # ВАЖНОЕ ИЗМЕНЕНИЕ: используем более простой SQL-запрос
-                    query = """
-                        SELECT date(created_at) as day, COUNT(*) as count
-                        FROM blogger_referrals 
-                        WHERE blogger_id = ? 
-                        AND date(created_at) >= ?
-                        AND date(created_at) <= ?
-                        GROUP BY day
-                        ORDER BY day
-                    """
-                    
-                    # Получаем данные из БД
-                    cursor.execute(query, (blogger_id, start_date, end_date))
-                    results = cursor.fetchall()
-                    print(f"Результаты запроса для referrals/{period}: {results}")
-                    
-                    # Преобразуем результаты в словарь {день: количество}
-                    db_results = {}
-                    for row in results:
-                        day_str = datetime.strptime(row[0], "%Y-%m-%d").strftime(group_format)
-                        db_results[day_str] = row[1]
-                    
-                    print(f"Обработанные результаты для referrals/{period}: {db_results}")
-                    
-                    # Формируем массив данных с нулями для дней без переходов
-                    data = []
-                    for d in date_range:
-                        day_str = d.strftime(group_format)
-                        data.append(db_results.get(day_str, 0))
-                
-                elif period in ['180', '365']:
-                    # Для полугода и года
-                    months = []
-                    current_date = start_date
-                    while current_date <= end_date:
-                        months.append(current_date.strftime(group_format))
-                        # Переходим к следующему месяцу
-                        if current_date.month == 12:
-                            current_date = date(current_date.year + 1, 1, 1)
-                        else:
-                            current_date = date(current_date.year, current_date.month + 1, 1)
-                    
-                    labels = []
-                    for month in months:
-                        year, month_str = month.split('-')
-                        month_date = date(int(year), int(month_str), 1)
-                        labels.append(month_date.strftime(label_format))
-                    
-                    # ВАЖНОЕ ИЗМЕНЕНИЕ: используем более простой SQL-запрос
-                    query = """
-                        SELECT strftime('%Y-%m', created_at) as month, COUNT(*) as count
-                        FROM blogger_referrals 
-                        WHERE blogger_id = ? 
-                        AND date(created_at) >= ?
-                        AND date(created_at) <= ?
-                        GROUP BY month
-                        ORDER BY month
-                    """
-                    
-                    # Получаем данные из БД
-                    cursor.execute(query, (blogger_id, start_date, end_date))
-                    results = cursor.fetchall()
-                    print(f"Результаты запроса для referrals/{period}: {results}")
-                    
-                    # Преобразуем результаты в словарь {месяц: количество}
-                    db_results = {row[0]: row[1] for row in results}
-                    print(f"Обработанные результаты для referrals/{period}: {db_results}")
-                    
-                    # Формируем массив данных с нулями для месяцев без переходов
-                    data = [db_results.get(month, 0) for month in months]
-                
-                else:
-                    # Для 30 дней
-                    date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-                    labels = [d.strftime(label_format) for d in date_range]
-                    
-                    # ВАЖНОЕ ИЗМЕНЕНИЕ: используем более простой SQL-запрос
-                    query = """
-                        SELECT date(created_at) as day, COUNT(*) as count
-                        FROM blogger_referrals 
-                        WHERE blogger_id = ? 
-                        AND date(created_at) >= ?
-                        AND date(created_at) <= ?
-                        GROUP BY day
-                        ORDER BY day
-                    """
-                    
-                    # Получаем данные из БД
-                    cursor.execute(query, (blogger_id, start_date, end_date))
-                    results = cursor.fetchall()
-                    print(f"Результаты запроса для referrals/{period}: {results}")
-                    
-                    # Преобразуем результаты в словарь {день: количество}
-                    db_results = {}
-                    for row in results:
-                        day_date = datetime.strptime(row[0], "%Y-%m-%d").date()
-                        day_str = day_date.strftime(group_format)
-                        db_results[day_str] = row[1]
-                    
-                    print(f"Обработанные результаты для referrals/{period}: {db_results}")
-                    
-                    # Формируем массив данных с нулями для дней без переходов
-                    data = []
-                    for d in date_range:
-                        day_str = d.strftime(group_format)
-                        data.append(db_results.get(day_str, 0))
-                
-                print(f"Выполнен запрос: {query}")
-                print(f"Параметры: blogger_id={blogger_id}, start_date={start_date}, end_date={end_date}")
-                print(f"Сформированы данные для графика переходов: labels={len(labels)}, data={len(data)}")
-                print(f"Метки: {labels}")
-                print(f"Данные: {data}")
-                
-                # Проверяем, все ли данные нулевые
-                if sum(data) == 0:
-                    print("ВНИМАНИЕ: Все данные нулевые, пробуем альтернативный запрос")
-                    # Альтернативный запрос - просто получаем все записи без группировки
-                    cursor.execute("""
-                        SELECT id, created_at FROM blogger_referrals 
-                        WHERE blogger_id = ? 
-                        ORDER BY id DESC LIMIT 10
-                    """, (blogger_id,))
-                    raw_data = cursor.fetchall()
-                    print(f"Результаты альтернативного запроса: {raw_data}")
-                    
-                    # Пробуем принудительно добавить данные для тестирования
-                    if len(data) > 0 and total_records > 0:
-                        # Добавляем реальное количество записей в первую точку данных
-                        data[0] = total_records
-                        print(f"Принудительно добавлены данные для тестирования: {data}")
-                
-            except Exception as e:
-                print(f"Ошибка при формировании графика переходов: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-                # В случае ошибки возвращаем пустые данные
-                return {
-                    'labels': [],
-                    'data': []
-                }
-        
-        elif chart_type == 'earnings':
-            # Для графика заработка
-            if 'commission_amount' in columns and 'converted' in columns:
-                try:
-                    query = None
-                    
-                    if period in ['current_month', 'previous_month']:
-                        # Для месячных периодов
-                        if period == 'current_month':
-                            days_in_month = calendar.monthrange(today.year, today.month)[1]
-                            date_range = [date(today.year, today.month, day) for day in range(1, days_in_month + 1) if date(today.year, today.month, day) <= today]
-                        else:
-                            days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
-                            date_range = [date(start_date.year, start_date.month, day) for day in range(1, days_in_month + 1)]
-                        
-                        labels = [d.strftime(label_format) for d in date_range]
-                        
-                        # ВАЖНОЕ ИЗМЕНЕНИЕ: используем более простой SQL-запрос
-                        query = """
-                            SELECT date(created_at) as day, SUM(commission_amount) as amount
-                            FROM blogger_referrals 
-                            WHERE blogger_id = ? 
-                            AND date(created_at) >= ?
-                            AND date(created_at) <= ?
-                            AND converted = 1
-                            GROUP BY day
-                            ORDER BY day
-                        """
-                        
-                        # Получаем данные из БД
-                        cursor.execute(query, (blogger_id, start_date, end_date))
-                        results = cursor.fetchall()
-                        print(f"Результаты запроса для earnings/{period}: {results}")
-                        
-                        # Преобразуем результаты в словарь {день: сумма}
-                        db_results = {}
-                        for row in results:
-                            day_str = datetime.strptime(row[0], "%Y-%m-%d").strftime(group_format)
-                            db_results[day_str] = row[1]
-                        
-                        print(f"Обработанные результаты для earnings/{period}: {db_results}")
-                        
-                        # Формируем массив данных с нулями для дней без заработка
-                        data = []
-                        for d in date_range:
-                            day_str = d.strftime(group_format)
-                            data.append(db_results.get(day_str, 0))
-                    
-                    elif period in ['180', '365']:
-                        # Для полугода и года
-                        months = []
-                        current_date = start_date
-                        while current_date <= end_date:
-                            months.append(current_date.strftime(group_format))
-                            # Переходим к следующему месяцу
-                            if current_date.month == 12:
-                                current_date = date(current_date.year + 1, 1, 1)
-                            else:
-                                current_date = date(current_date.year, current_date.month + 1, 1)
-                        
-                        labels = []
-                        for month in months:
-                            year, month_str = month.split('-')
-                            month_date = date(int(year), int(month_str), 1)
-                            labels.append(month_date.strftime(label_format))
-                        
-                        # ВАЖНОЕ ИЗМЕНЕНИЕ: используем более простой SQL-запрос
-                        query = """
-                            SELECT strftime('%Y-%m', created_at) as month, SUM(commission_amount) as amount
-                            FROM blogger_referrals 
-                            WHERE blogger_id = ? 
-                            AND date(created_at) >= ?
-                            AND date(created_at) <= ?
-                            AND converted = 1
-                            GROUP BY month
-                            ORDER BY month
-                        """
-                        
-                        # Получаем данные из БД
-                        cursor.execute(query, (blogger_id, start_date, end_date))
-                        results = cursor.fetchall()
-                        print(f"Результаты запроса для earnings/{period}: {results}")
-                        
-                        # Преобразуем результаты в словарь {месяц: сумма}
-                        db_results = {row[0]: row[1] for row in results}
-                        print(f"Обработанные результаты для earnings/{period}: {db_results}")
-                        
-                        # Формируем массив данных с нулями для месяцев без заработка
-                        data = [db_results.get(month, 0) for month in months]
-                    
-                    else:
-                        # Для 30 дней
-                        date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-                        labels = [d.strftime(label_format) for d in date_range]
-                        
-                        # ВАЖНОЕ ИЗМЕНЕНИЕ: используем более простой SQL-запрос
-                        query = """
-                            SELECT date(created_at) as day, SUM(commission_amount) as amount
-                            FROM blogger_referrals 
-                            WHERE blogger_id = ? 
-                            AND date(created_at) >= ?
-                            AND date(created_at) <= ?
-                            AND converted = 1
-                            GROUP BY day
-                            ORDER BY day
-                        """
-                        
-                        # Получаем данные из БД
-                        cursor.execute(query, (blogger_id, start_date, end_date))
-                        results = cursor.fetchall()
-                        print(f"Результаты запроса для earnings/{period}: {results}")
-                        
-                        # Преобразуем результаты в словарь {день: сумма}
-                        db_results = {}
-                        for row in results:
-                            day_date = datetime.strptime(row[0], "%Y-%m-%d").date()
-                            day_str = day_date.strftime(group_format)
-                            db_results[day_str] = row[1]
-                        
-                        print(f"Обработанные результаты для earnings/{period}: {db_results}")
-                        
-                        # Формируем массив данных с нулями для дней без заработка
-                        data = []
-                        for d in date_range:
-                            day_str = d.strftime(group_format)
-                            data.append(db_results.get(day_str, 0))
-                    
-                    print(f"Выполнен запрос: {query}")
-                    print(f"Параметры: blogger_id={blogger_id}, start_date={start_date}, end_date={end_date}")
-                    print(f"Сформированы данные для графика заработка: labels={len(labels)}, data={len(data)}")
-                    print(f"Метки: {labels}")
-                    print(f"Данные: {data}")
-                    
-                    # Проверяем, все ли данные нулевые
-                    if sum(data) == 0:
-                        print("ВНИМАНИЕ: Все данные нулевые, пробуем альтернативный запрос")
-                        # Альтернативный запрос - просто получаем все записи без группировки
-                        cursor.execute("""
-                            SELECT id, created_at, commission_amount FROM blogger_referrals 
-                            WHERE blogger_id = ? AND converted = 1
-                            ORDER BY id DESC LIMIT 10
-                        """, (blogger_id,))
-                        raw_data = cursor.fetchall()
-                        print(f"Результаты альтернативного запроса: {raw_data}")
-                        
-                        # Проверяем общую сумму заработка
-                        cursor.execute("""
-                            SELECT SUM(commission_amount) FROM blogger_referrals 
-                            WHERE blogger_id = ? AND converted = 1
-                        """, (blogger_id,))
-                        total_earnings = cursor.fetchone()[0] or 0
-                        print(f"Общая сумма заработка: {total_earnings}")
-                        
-                        # Пробуем принудительно добавить данные для тестирования
-                        if len(data) > 0 and total_earnings > 0:
-                            # Добавляем реальную сумму в первую точку данных
-                            data[0] = total_earnings
-                            print(f"Принудительно добавлены данные для тестирования: {data}")
-                    
-                except Exception as e:
-                    print(f"Ошибка при формировании графика заработка: {str(e)}")
-                    import traceback
-                    print(traceback.format_exc())
-                    # В случае ошибки возвращаем пустые данные
-                    return {
-                        'labels': [],
-                        'data': []
-                    }
-            else:
-                # Если нет нужных колонок, возвращаем пустые данные
-                print(f"Отсутствуют необходимые колонки для графика заработка: commission_amount или converted")
-                if period in ['current_month', 'previous_month']:
-                    if period == 'current_month':
-                        days_in_month = calendar.monthrange(today.year, today.month)[1]
-                        date_range = [date(today.year, today.month, day) for day in range(1, days_in_month + 1) if date(today.year, today.month, day) <= today]
-                    else:
-                        days_in_month = calendar.monthrange(start_date.year, start_date.month)[1]
-                        date_range = [date(start_date.year, start_date.month, day) for day in range(1, days_in_month + 1)]
-                    labels = [d.strftime(label_format) for d in date_range]
-                    data = [0] * len(labels)
-                elif period in ['180', '365']:
-                    months = []
-                    current_date = start_date
-                    while current_date <= end_date:
-                        months.append(current_date.strftime(group_format))
-                        if current_date.month == 12:
-                            current_date = date(current_date.year + 1, 1, 1)
-                        else:
-                            current_date = date(current_date.year, current_date.month + 1, 1)
-                    
-                    labels = []
-                    for month in months:
-                        year, month_str = month.split('-')
-                        month_date = date(int(year), int(month_str), 1)
-                        labels.append(month_date.strftime(label_format))
-                    data = [0] * len(labels)
-                else:
-                    date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-                    labels = [d.strftime(label_format) for d in date_range]
-                    data = [0] * len(labels)
-        
         return {
-            'labels': labels,
-            'data': data
+            'referrals': get_chart_data(conn, blogger_id, 'referrals', referrals_period),
+            'earnings': get_chart_data(conn, blogger_id, 'earnings', earnings_period)
         }
     except Exception as e:
-        print(f"Ошибка в get_chart_data: {str(e)}")
+        print(f"Ошибка в get_blogger_charts: {str(e)}")
         import traceback
         print(traceback.format_exc())
-        # В случае любой ошибки возвращаем пустые данные
+        # В случае любой ошибки возвращаем пустые данные для графиков
         return {
-            'labels': [],
-            'data': []
+            'referrals': {'labels': [], 'data': []},
+            'earnings': {'labels': [], 'data': []}
         }
+    finally:
+        if conn:
+            conn.close()
 
 def get_blogger_period_stats(blogger_id, period='30'):
     """
@@ -1318,159 +679,20 @@ def get_blogger_period_stats(blogger_id, period='30'):
     try:
         print(f"get_blogger_period_stats: начата обработка для blogger_id={blogger_id}, period={period}")
         conn = get_blogger_db_connection()
-        cursor = conn.cursor()
-        
-        # Проверяем структуру таблицы
-        cursor.execute("PRAGMA table_info(blogger_referrals)")
-        columns = [column[1] for column in cursor.fetchall()]
-        print(f"Колонки в таблице blogger_referrals: {columns}")
-        
-        # Проверяем наличие колонки created_at
-        if 'created_at' not in columns:
-            print("Колонка created_at отсутствует, попытка добавить её")
-            try:
-                # Пытаемся добавить колонку created_at
-                cursor.execute("ALTER TABLE blogger_referrals ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                # Заполняем её текущей датой для существующих записей
-                cursor.execute("UPDATE blogger_referrals SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
-                conn.commit()
-                print(f"Добавлена колонка created_at в таблицу blogger_referrals и заполнена текущей датой")
-                
-                # Проверяем, была ли колонка действительно добавлена
-                cursor.execute("PRAGMA table_info(blogger_referrals)")
-                columns = [column[1] for column in cursor.fetchall()]
-                print(f"Колонки после добавления created_at: {columns}")
-                
-                if 'created_at' not in columns:
-                    print("ВНИМАНИЕ: Колонка created_at не была добавлена несмотря на успешное выполнение запроса")
-                    # Возвращаем пустую статистику
-                    conn.close()
-                    return {
-                        'total_referrals': 0,
-                        'total_conversions': 0,
-                        'total_earned': 0
-                    }
-            except Exception as e:
-                print(f"Ошибка при добавлении колонки created_at: {str(e)}")
-                # В случае ошибки возвращаем пустую статистику
-                conn.close()
-                return {
-                    'total_referrals': 0,
-                    'total_conversions': 0,
-                    'total_earned': 0
-                }
-        
-        # Определяем временной диапазон
-        today = datetime.now().date()
-        
-        if period == 'current_month':
-            # Текущий месяц
-            start_date = date(today.year, today.month, 1)
-            end_date = today
-            print(f"Выбран период 'current_month', start_date={start_date}, end_date={end_date}")
-        elif period == 'previous_month':
-            # Предыдущий месяц
-            if today.month == 1:
-                start_date = date(today.year - 1, 12, 1)
-                end_date = date(today.year, 1, 1) - timedelta(days=1)
-            else:
-                start_date = date(today.year, today.month - 1, 1)
-                end_date = date(today.year, today.month, 1) - timedelta(days=1)
-            print(f"Выбран период 'previous_month', start_date={start_date}, end_date={end_date}")
-        elif period == '180':
-            # Последние 6 месяцев
-            start_date = today - timedelta(days=180)
-            end_date = today
-            print(f"Выбран период '180', start_date={start_date}, end_date={end_date}")
-        elif period == '365':
-            # Последний год
-            start_date = today - timedelta(days=365)
-            end_date = today
-            print(f"Выбран период '365', start_date={start_date}, end_date={end_date}")
-        else:
-            # По умолчанию - последние 30 дней
-            start_date = today - timedelta(days=30)
-            end_date = today
-            print(f"Выбран период по умолчанию (30 дней), start_date={start_date}, end_date={end_date}")
-        
-        # Выполняем запрос для подсчета статистики за указанный период
-        query = """
-            SELECT 
-                COUNT(*) as total_referrals,
-                SUM(CASE WHEN converted = 1 THEN 1 ELSE 0 END) as total_conversions,
-                SUM(CASE WHEN converted = 1 THEN commission_amount ELSE 0 END) as total_earned
-            FROM blogger_referrals
-            WHERE blogger_id = ? 
-            AND date(created_at) >= date(?)
-            AND date(created_at) <= date(?)
-        """
-        
-        # Проверка наличия записей
-        cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ?", (blogger_id,))
-        total_records = cursor.fetchone()[0]
-        print(f"Всего записей для блогера {blogger_id}: {total_records}")
-        
-        # Если записей нет, возвращаем нули
-        if total_records == 0:
-            print(f"Нет данных для блогера {blogger_id}, возвращаем нулевые значения")
-            conn.close()
-            return {
-                'total_referrals': 0,
-                'total_conversions': 0,
-                'total_earned': 0
-            }
         
-        # Проверяем наличие данных с датой
-        cursor.execute("SELECT COUNT(*) FROM blogger_referrals WHERE blogger_id = ? AND created_at IS NOT NULL", (blogger_id,))
-        dated_records = cursor.fetchone()[0]
-        print(f"Записей с датой created_at: {dated_records}")
+        start_date, end_date, _ = get_period_range(period)
         
-        # Если все записи без даты, обновляем их
-        if dated_records == 0:
-            print("Обнаружены записи без даты created_at, обновляем их")
-            cursor.execute("UPDATE blogger_referrals SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
-            conn.commit()
+        # Не больше 366 строк дневной сводки на блогера
+        totals = blogger_daily_stats.get_totals(conn, blogger_id=blogger_id,
+                                                start_date=start_date, end_date=end_date)
+        conn.close()
         
-        try:
-            print(f"Выполняем запрос: {query}")
-            print(f"Параметры: blogger_id={blogger_id}, start_date={start_date}, end_date={end_date}")
-            
-            cursor.execute(query, (blogger_id, start_date, end_date))
-            row = cursor.fetchone()
-            
-            if row:
-                total_referrals = row[0] or 0
-                total_conversions = row[1] or 0
-                total_earned = row[2] or 0
-                
-                print(f"Получены данные: total_referrals={total_referrals}, total_conversions={total_conversions}, total_earned={total_earned}")
-                
-                result = {
-                    'total_referrals': total_referrals,
-                    'total_conversions': total_conversions,
-                    'total_earned': total_earned
-                }
-                
-                conn.close()
-                return result
-            else:
-                print(f"Запрос не вернул данных")
-                conn.close()
-                return {
-                    'total_referrals': 0,
-                    'total_conversions': 0,
-                    'total_earned': 0
-                }
-        except Exception as e:
-            print(f"Ошибка при выполнении запроса: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            conn.close()
-            return {
-                'total_referrals': 0,
-                'total_conversions': 0,
-                'total_earned': 0
-            }
+        print(f"Статистика блогера {blogger_id} за {start_date} - {end_date}: {totals}")
+        return {
+            'total_referrals': totals['clicks'],
+            'total_conversions': totals['conversions'],
+            'total_earned': totals['commission']
+        }
     except Exception as e:
         print(f"Общая ошибка в get_blogger_period_stats: {str(e)}")
         import traceback
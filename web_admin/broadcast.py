@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Рассылка сообщений из админ-панели с учетом ограничений Telegram
+
+- Получатели читаются порциями по BROADCAST_CHUNK_SIZE с keyset-пагинацией
+  по users.id (WHERE id > курсор ORDER BY id), без загрузки всей таблицы.
+- Порция отправляется пулом потоков; каждая отправка берет токен у общего
+  ограничителя: не больше BROADCAST_GLOBAL_RATE сообщений в секунду на бота и
+  не чаще одного сообщения в BROADCAST_CHAT_INTERVAL секунд в один чат.
+- Ответ 429 (retry_after) приостанавливает всю рассылку на указанное время,
+  сообщение отправляется повторно; всего не больше BROADCAST_MAX_ATTEMPTS
+  попыток на получателя.
+- После каждой порции курсор и счетчики сохраняются в таблицу broadcasts.
+  Рассылку ведет процесс, взявший ее в аренду (locked_until); после падения
+  процесса она продолжается с сохраненного курсора при следующем запуске
+  админ-панели. Получатели последней незавершенной порции могут получить
+  сообщение повторно.
+
+Адрес Bot API задается TELEGRAM_API_URL, что позволяет проверить рассылку
+на локальной заглушке Bot API (см. tests/test_broadcast.py).
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import monotonic
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import func, or_
+
+from bot.rate_limit import RateLimiter
+from database.models import Broadcast, User, Session
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "30"))
+BROADCAST_BURST = float(os.getenv("BROADCAST_BURST", "5"))
+BROADCAST_CHAT_INTERVAL = float(os.getenv("BROADCAST_CHAT_INTERVAL", "1.0"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "100"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "5"))
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "300"))
+BROADCAST_REQUEST_TIMEOUT = float(os.getenv("BROADCAST_REQUEST_TIMEOUT", "10"))
+
+STATUS_RUNNING = 'running'
+STATUS_PAUSED = 'paused'
+STATUS_CANCELLED = 'cancelled'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+RESULT_SENT = 'sent'
+RESULT_FAILED = 'failed'
+RESULT_BLOCKED = 'blocked'
+
+# Рассылки, которые ведет текущий процесс
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+class BotApiError(Exception):
+    """Ошибка Bot API с кодом ответа и, для 429, временем ожидания"""
+
+    def __init__(self, code, description, retry_after=None):
+        super().__init__(f"{code}: {description}")
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+
+class BotApiClient:
+    """Минимальный клиент Bot API с пулом HTTP-соединений"""
+
+    def __init__(self, token, base_url=TELEGRAM_API_URL, timeout=BROADCAST_REQUEST_TIMEOUT,
+                 pool_size=BROADCAST_WORKERS):
+        self.api_url = f"{base_url}/bot{token}"
+        self.timeout = timeout
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        payload = {"chat_id": chat_id, "text": text}
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        try:
+            response = self.http.post(f"{self.api_url}/sendMessage", json=payload, timeout=self.timeout)
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise BotApiError(None, str(e))
+        if not result.get("ok"):
+            parameters = result.get("parameters") or {}
+            raise BotApiError(
+                result.get("error_code", response.status_code),
+                result.get("description", ""),
+                parameters.get("retry_after")
+            )
+        return result.get("result")
+
+
+class BroadcastRateLimiter(RateLimiter):
+    """Общий ограничитель рассылок с настройками BROADCAST_* (см. bot/rate_limit.py)"""
+
+    def __init__(self, rate=BROADCAST_GLOBAL_RATE, burst=BROADCAST_BURST, chat_interval=BROADCAST_CHAT_INTERVAL):
+        super().__init__(rate, burst, chat_interval)
+
+
+def build_url_button_markup(button_text, button_url):
+    """Разметка с одной URL-кнопкой или None"""
+    if not button_text or not button_url:
+        return None
+    return {"inline_keyboard": [[{"text": button_text, "url": button_url}]]}
+
+
+def _recipients_query(session, broadcast):
+    query = session.query(User.id, User.user_id).filter(User.user_id.isnot(None))
+    if broadcast.max_user_id:
+        query = query.filter(User.id <= broadcast.max_user_id)
+    if broadcast.audience == 'subscribers':
+        query = query.filter(User.is_subscribed == True)
+    elif broadcast.audience == 'custom':
+        ids = json.loads(broadcast.recipient_ids or "[]")
+        query = query.filter(User.id.in_(ids or [-1]))
+    return query
+
+
+def create_broadcast(text, audience='all', recipient_ids=None, reply_markup=None, parse_mode=None, created_by=None):
+    """
+    Создает рассылку и подсчитывает получателей
+
+    Returns:
+        int: ID рассылки
+    """
+    session = Session()
+    try:
+        broadcast = Broadcast(
+            text=text,
+            parse_mode=parse_mode,
+            reply_markup=json.dumps(reply_markup, ensure_ascii=False) if reply_markup else None,
+            audience=audience,
+            recipient_ids=json.dumps([int(user_id) for user_id in recipient_ids or []]),
+            status=STATUS_RUNNING,
+            last_user_id=0,
+            sent=0,
+            failed=0,
+            blocked=0,
+            created_by=created_by
+        )
+        broadcast.max_user_id = session.query(func.max(User.id)).scalar() or 0
+        broadcast.total = _recipients_query(session, broadcast).count()
+        session.add(broadcast)
+        session.commit()
+        logger.info(f"[BROADCAST] Создана рассылка {broadcast.id} ({audience}), получателей: {broadcast.total}")
+        return broadcast.id
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+class BroadcastRunner:
+    """Ведет одну рассылку от сохраненного курсора до конца"""
+
+    def __init__(self, broadcast_id, client, limiter=None, chunk_size=BROADCAST_CHUNK_SIZE,
+                 workers=BROADCAST_WORKERS, lease_seconds=BROADCAST_LEASE_SECONDS):
+        self.broadcast_id = broadcast_id
+        self.client = client
+        self.limiter = limiter or BroadcastRateLimiter()
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.started = None
+        self.processed = 0
+        self._thread = None
+
+    def _claim(self):
+        """Берет рассылку в аренду; False, если ее уже ведет другой процесс"""
+        now = datetime.now()
+        session = Session()
+        try:
+            updated = session.query(Broadcast)\
+                .filter(Broadcast.id == self.broadcast_id,
+                        Broadcast.status == STATUS_RUNNING,
+                        or_(Broadcast.locked_until.is_(None), Broadcast.locked_until < now))\
+                .update({Broadcast.locked_until: now + timedelta(seconds=self.lease_seconds),
+                         Broadcast.started_at: func.coalesce(Broadcast.started_at, now),
+                         Broadcast.updated_at: now},
+                        synchronize_session=False)
+            session.commit()
+            return bool(updated)
+        except Exception as e:
+            logger.error(f"[BROADCAST] Ошибка при захвате рассылки {self.broadcast_id}: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def _next_chunk(self, broadcast, cursor):
+        session = Session()
+        try:
+            return _recipients_query(session, broadcast)\
+                .filter(User.id > cursor)\
+                .order_by(User.id)\
+                .limit(self.chunk_size)\
+                .all()
+        finally:
+            session.close()
+
+    def _save_progress(self, cursor, counts):
+        """Сохраняет курсор и счетчики, продлевает аренду; возвращает текущий статус рассылки"""
+        now = datetime.now()
+        session = Session()
+        try:
+            session.query(Broadcast)\
+                .filter(Broadcast.id == self.broadcast_id)\
+                .update({
+                    Broadcast.last_user_id: cursor,
+                    Broadcast.sent: Broadcast.sent + counts[RESULT_SENT],
+                    Broadcast.failed: Broadcast.failed + counts[RESULT_FAILED],
+                    Broadcast.blocked: Broadcast.blocked + counts[RESULT_BLOCKED],
+                    Broadcast.updated_at: now,
+                    Broadcast.locked_until: now + timedelta(seconds=self.lease_seconds)
+                }, synchronize_session=False)
+            session.commit()
+            return session.query(Broadcast.status).filter(Broadcast.id == self.broadcast_id).scalar()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _finish(self, status=None, error=None):
+        now = datetime.now()
+        values = {Broadcast.locked_until: None, Broadcast.updated_at: now}
+        if status:
+            values[Broadcast.status] = status
+            values[Broadcast.finished_at] = now
+        if error:
+            values[Broadcast.last_error] = error
+        session = Session()
+        try:
+            session.query(Broadcast).filter(Broadcast.id == self.broadcast_id).update(values, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            logger.error(f"[BROADCAST] Ошибка при завершении рассылки {self.broadcast_id}: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def send_one(self, chat_id, text, reply_markup, parse_mode):
+        """Отправляет сообщение одному получателю с учетом ограничений; возвращает результат"""
+        attempt = 0
+        while True:
+            self.limiter.acquire(chat_id)
+            try:
+                self.client.send_message(chat_id, text, reply_markup, parse_mode)
+                return RESULT_SENT
+            except BotApiError as e:
+                if e.code == 403:
+                    # Пользователь заблокировал бота или удалил аккаунт
+                    return RESULT_BLOCKED
+                if e.code == 400:
+                    return RESULT_FAILED
+                # 429 тоже расходует попытку, иначе чат, который постоянно
+                # получает retry_after, навсегда занимает поток
+                attempt += 1
+                if attempt >= BROADCAST_MAX_ATTEMPTS:
+                    logger.error(f"[BROADCAST] Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    return RESULT_FAILED
+                if e.retry_after:
+                    logger.warning(f"[BROADCAST] Telegram просит подождать {e.retry_after} с")
+                    self.limiter.pause(float(e.retry_after))
+                    continue
+                time.sleep(min(2 ** attempt, 30))
+
+    def run(self):
+        if not self._claim():
+            logger.info(f"[BROADCAST] Рассылка {self.broadcast_id} уже выполняется или завершена")
+            return
+        self.started = monotonic()
+        self.processed = 0
+
+        session = Session()
+        try:
+            broadcast = session.query(Broadcast).filter(Broadcast.id == self.broadcast_id).first()
+            session.expunge(broadcast)
+        finally:
+            session.close()
+
+        reply_markup = json.loads(broadcast.reply_markup) if broadcast.reply_markup else None
+        cursor = broadcast.last_user_id or 0
+        logger.info(f"[BROADCAST] Рассылка {self.broadcast_id} запущена с курсора {cursor}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"broadcast-{self.broadcast_id}") as executor:
+                while True:
+                    chunk = self._next_chunk(broadcast, cursor)
+                    if not chunk:
+                        self._finish(STATUS_COMPLETED)
+                        logger.info(f"[BROADCAST] Рассылка {self.broadcast_id} завершена")
+                        return
+                    results = executor.map(
+                        lambda row: self.send_one(row.user_id, broadcast.text, reply_markup, broadcast.parse_mode),
+                        chunk
+                    )
+                    counts = {RESULT_SENT: 0, RESULT_FAILED: 0, RESULT_BLOCKED: 0}
+                    for result in results:
+                        counts[result] += 1
+                    cursor = chunk[-1].id
+                    self.processed += len(chunk)
+                    status = self._save_progress(cursor, counts)
+                    if status != STATUS_RUNNING:
+                        logger.info(f"[BROADCAST] Рассылка {self.broadcast_id} остановлена: {status}")
+                        self._finish()
+                        return
+        except Exception as e:
+            logger.error(f"[BROADCAST] Ошибка рассылки {self.broadcast_id}: {e}")
+            # Аренда истечет, и рассылка продолжится с сохраненного курсора
+            self._finish(error=str(e))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"broadcast-{self.broadcast_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def throughput(self):
+        """Сообщений в секунду с момента запуска в этом процессе"""
+        if not self.started or not self.processed:
+            return None
+        return self.processed / max(monotonic() - self.started, 1e-6)
+
+
+_client = None
+_limiter = BroadcastRateLimiter()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from bot.config import get_bot_token
+        token = os.getenv("TELEGRAM_TOKEN") or get_bot_token()
+        if not token:
+            raise RuntimeError("Не указан токен бота (TELEGRAM_TOKEN или bot_config.json)")
+        _client = BotApiClient(token)
+    return _client
+
+
+def start_broadcast(broadcast_id):
+    """Запускает рассылку в фоновом потоке текущего процесса"""
+    with _runners_lock:
+        runner = _runners.get(broadcast_id)
+        if runner is not None and runner.is_alive():
+            return runner
+        # Ограничитель общий: все рассылки процесса делят лимит бота
+        runner = BroadcastRunner(broadcast_id, get_client(), _limiter).start()
+        _runners[broadcast_id] = runner
+        return runner
+
+
+def resume_broadcasts():
+    """Продолжает рассылки, прерванные падением процесса (аренда истекла)"""
+    session = Session()
+    try:
+        ids = [row.id for row in session.query(Broadcast.id).filter(
+            Broadcast.status == STATUS_RUNNING,
+            or_(Broadcast.locked_until.is_(None), Broadcast.locked_until < datetime.now())
+        )]
+    except Exception as e:
+        logger.error(f"[BROADCAST] Ошибка при поиске незавершенных рассылок: {e}")
+        return []
+    finally:
+        session.close()
+
+    for broadcast_id in ids:
+        logger.info(f"[BROADCAST] Продолжаем рассылку {broadcast_id}")
+        try:
+            start_broadcast(broadcast_id)
+        except Exception as e:
+            logger.error(f"[BROADCAST] Не удалось продолжить рассылку {broadcast_id}: {e}")
+    return ids
+
+
+def set_broadcast_status(broadcast_id, status):
+    """Пауза, продолжение или отмена рассылки; раннер видит изменение после текущей порции"""
+    session = Session()
+    try:
+        broadcast = session.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+        if broadcast is None or broadcast.status in (STATUS_COMPLETED, STATUS_CANCELLED):
+            return False
+        broadcast.status = status
+        broadcast.updated_at = datetime.now()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    if status == STATUS_RUNNING:
+        start_broadcast(broadcast_id)
+    return True
+
+
+def get_broadcast_progress(broadcast_id):
+    """Прогресс рассылки: счетчики, скорость (сообщений/с) и оценка оставшегося времени"""
+    session = Session()
+    try:
+        broadcast = session.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+        if broadcast is None:
+            return None
+        processed = (broadcast.sent or 0) + (broadcast.failed or 0) + (broadcast.blocked or 0)
+        remaining = max((broadcast.total or 0) - processed, 0)
+
+        runner = _runners.get(broadcast_id)
+        throughput = runner.throughput() if runner is not None and runner.is_alive() else None
+        if throughput is None and broadcast.started_at and broadcast.updated_at and processed:
+            elapsed = (broadcast.updated_at - broadcast.started_at).total_seconds()
+            throughput = processed / elapsed if elapsed > 0 else None
+
+        eta = None
+        if broadcast.status == STATUS_RUNNING and throughput:
+            eta = round(remaining / throughput)
+
+        return {
+            "id": broadcast.id,
+            "status": broadcast.status,
+            "audience": broadcast.audience,
+            "total": broadcast.total or 0,
+            "processed": processed,
+            "sent": broadcast.sent or 0,
+            "failed": broadcast.failed or 0,
+            "blocked": broadcast.blocked or 0,
+            "percent": round(processed * 100 / broadcast.total, 1) if broadcast.total else 100.0,
+            "throughput": round(throughput, 2) if throughput else None,
+            "eta_seconds": eta,
+            "created_at": broadcast.created_at.isoformat() if broadcast.created_at else None,
+            "finished_at": broadcast.finished_at.isoformat() if broadcast.finished_at else None,
+            "last_error": broadcast.last_error
+        }
+    finally:
+        session.close()
+
+
+def get_recent_broadcasts(limit=10):
+    session = Session()
+    try:
+        ids = [row.id for row in session.query(Broadcast.id).order_by(Broadcast.id.desc()).limit(limit)]
+    finally:
+        session.close()
+    return [get_broadcast_progress(broadcast_id) for broadcast_id in ids]
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Данные страницы реферальной системы админ-панели
+
+Раньше страница загружала все реферальные коды и все использования, а для
+каждой строки отдельно считала использования и искала пользователей
+(4N+1 запросов). Теперь:
+
+- страница кодов - один запрос с LEFT JOIN владельца и один GROUP BY
+  referral_code_id по кодам этой страницы (использования и оплаты через
+  условную сумму по subscription_purchased);
+- страница использований - один запрос с JOIN кода, приглашенного и
+  пригласившего;
+- обе таблицы листаются keyset-пагинацией по id (новые первыми);
+- итоги (коды, переходы, оплаты, конверсия) считаются одним запросом и
+  кэшируются на REFERRAL_SUMMARY_CACHE_TTL секунд.
+"""
+
+import os
+import threading
+from time import monotonic
+
+from sqlalchemy import String, and_, case, cast, func, select
+from sqlalchemy.orm import aliased
+
+from database.models import ReferralCode, ReferralUse, User
+
+REFERRALS_PAGE_SIZE = int(os.getenv("REFERRALS_PAGE_SIZE", "50"))
+REFERRAL_SUMMARY_CACHE_TTL = float(os.getenv("REFERRAL_SUMMARY_CACHE_TTL", "60"))
+
+_summary_lock = threading.Lock()
+_summary_cache = {'expires_at': 0.0, 'value': None}
+
+
+def _paid_sum():
+    return func.coalesce(func.sum(case((ReferralUse.subscription_purchased == True, 1), else_=0)), 0)
+
+
+def _page(rows, limit):
+    """Обрезает лишнюю строку и возвращает (строки, курсор следующей страницы)"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if has_more and rows else None)
+
+
+def get_referral_codes_page(db_session, cursor=None, limit=REFERRALS_PAGE_SIZE):
+    """
+    Страница реферальных кодов со счетчиками использований и оплат.
+
+    Returns:
+        tuple: (список словарей для шаблона, курсор следующей страницы или None)
+    """
+    # Владелец кода: users.id, для старых записей - Telegram ID
+    owner = aliased(User)
+    owner_by_telegram = aliased(User)
+    query = db_session.query(
+        ReferralCode.id,
+        ReferralCode.user_id,
+        ReferralCode.code,
+        ReferralCode.is_active,
+        ReferralCode.created_at,
+        func.coalesce(owner.username, owner_by_telegram.username,
+                      owner.user_id, owner_by_telegram.user_id).label('username'),
+    ).outerjoin(
+        owner, owner.id == ReferralCode.user_id
+    ).outerjoin(
+        owner_by_telegram, and_(owner.id == None, owner_by_telegram.user_id == cast(ReferralCode.user_id, String))
+    )
+    if cursor is not None:
+        query = query.filter(ReferralCode.id < cursor)
+    rows, next_cursor = _page(query.order_by(ReferralCode.id.desc()).limit(limit + 1).all(), limit)
+
+    counts = {}
+    if rows:
+        counts = {
+            code_id: (uses, paid)
+            for code_id, uses, paid in db_session.query(
+                ReferralUse.referral_code_id, func.count(ReferralUse.id), _paid_sum()
+            ).filter(
+                ReferralUse.referral_code_id.in_([row.id for row in rows])
+            ).group_by(ReferralUse.referral_code_id).all()
+        }
+
+    codes = []
+    for row in rows:
+        referral_count, paid_count = counts.get(row.id, (0, 0))
+        codes.append({
+            'id': row.id,
+            'user_id': row.user_id,
+            'username': row.username or "Неизвестно",
+            'code': row.code,
+            'is_active': bool(row.is_active),
+            'created_at': row.created_at,
+            'referral_count': referral_count,
+            'paid_count': paid_count,
+        })
+    return codes, next_cursor
+
+
+def get_referral_uses_page(db_session, cursor=None, limit=REFERRALS_PAGE_SIZE):
+    """
+    Страница истории использований реферальных кодов.
+
+    Returns:
+        tuple: (список словарей для шаблона, курсор следующей страницы или None)
+    """
+    referred = aliased(User)
+    referred_legacy = aliased(User)
+    referrer = aliased(User)
+    referrer_by_telegram = aliased(User)
+    query = db_session.query(
+        ReferralUse.id,
+        ReferralUse.referrer_id,
+        ReferralUse.referred_id,
+        ReferralUse.created_at,
+        ReferralUse.status,
+        ReferralUse.subscription_purchased,
+        ReferralUse.purchase_date,
+        ReferralUse.reward_processed,
+        ReferralUse.discount_applied,
+        ReferralCode.code,
+        func.coalesce(referred.username, referred_legacy.username).label('referred_username'),
+        func.coalesce(referrer.username, referrer_by_telegram.username).label('referrer_username'),
+    ).outerjoin(
+        ReferralCode, ReferralCode.id == ReferralUse.referral_code_id
+    ).outerjoin(
+        referred, referred.id == ReferralUse.user_id
+    ).outerjoin(
+        # Старые записи хранят Telegram ID приглашенного в referred_id
+        referred_legacy, and_(referred.id == None, referred_legacy.user_id == cast(ReferralUse.referred_id, String))
+    ).outerjoin(
+        referrer, referrer.id == ReferralUse.referrer_id
+    ).outerjoin(
+        referrer_by_telegram, and_(referrer.id == None,
+                                   referrer_by_telegram.user_id == cast(ReferralUse.referrer_id, String))
+    )
+    if cursor is not None:
+        query = query.filter(ReferralUse.id < cursor)
+    rows, next_cursor = _page(query.order_by(ReferralUse.id.desc()).limit(limit + 1).all(), limit)
+
+    uses = []
+    for row in rows:
+        payment_status = "Не оплачено"
+        if row.subscription_purchased:
+            payment_status = "Оплачено"
+            if row.reward_processed:
+                payment_status += " (бонус выплачен)"
+        uses.append({
+            'id': row.id,
+            'referral_code': row.code or 'Неизвестно',
+            'username': row.referred_username or 'Неизвестно',
+            'referrer_id': row.referrer_id,
+            'referrer_username': row.referrer_username or 'Неизвестно',
+            'referred_id': row.referred_id,
+            'referred_username': row.referred_username or 'Неизвестно',
+            'used_at': row.created_at,
+            'status': row.status or 'registered',
+            'subscription_purchased': bool(row.subscription_purchased),
+            'purchase_date': row.purchase_date if row.subscription_purchased else None,
+            'payment_status': payment_status,
+            'payment_date': row.purchase_date if row.subscription_purchased else None,
+            'reward_processed': bool(row.reward_processed),
+            'discount_applied': row.discount_applied or 0,
+        })
+    return uses, next_cursor
+
+
+def get_referral_summary(db_session):
+    """
+    Итоги реферальной системы (кэш на REFERRAL_SUMMARY_CACHE_TTL секунд):
+    {'total_referral_codes', 'total_referral_uses', 'total_paid', 'conversion_rate'}
+    """
+    now = monotonic()
+    with _summary_lock:
+        if _summary_cache['value'] is not None and _summary_cache['expires_at'] > now:
+            return dict(_summary_cache['value'])
+
+    total_codes, total_uses, total_paid = db_session.query(
+        select(func.count(ReferralCode.id)).scalar_subquery(),
+        func.count(ReferralUse.id),
+        _paid_sum(),
+    ).one()
+    summary = {
+        'total_referral_codes': total_codes,
+        'total_referral_uses': total_uses,
+        'total_paid': total_paid,
+        'conversion_rate': round(total_paid / total_uses * 100, 2) if total_uses else 0,
+    }
+    with _summary_lock:
+        _summary_cache['value'] = summary
+        _summary_cache['expires_at'] = monotonic() + REFERRAL_SUMMARY_CACHE_TTL
+    return dict(summary)
+
+
+def invalidate_referral_summary():
+    """Сбрасывает кэш итогов (после изменения данных из админ-панели)"""
+    with _summary_lock:
+        _summary_cache['value'] = None
+        _summary_cache['expires_at'] = 0.0
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Список пользователей для админ-панели (/api/users)
+
+Страница пользователей раньше загружала всю таблицу users со всеми
+колонками. Теперь она запрашивает пользователей порциями:
+
+- keyset-пагинация по users.id (WHERE id < курсор ORDER BY id DESC LIMIT n):
+  время ответа не зависит от номера страницы, в отличие от OFFSET;
+- фильтры по статусу подписки, цели, дате регистрации и поиск выполняются
+  в базе;
+- выбираются только запрошенные колонки (fields), объекты User не создаются.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from database.models import User
+
+USERS_PAGE_SIZE = 50
+USERS_PAGE_MAX_SIZE = 200
+
+# Колонки, которые можно запросить через fields (имя в ответе -> колонка)
+USER_LIST_FIELDS = {
+    'id': User.id,
+    'telegram_id': User.user_id,
+    'username': User.username,
+    'first_name': User.first_name,
+    'last_name': User.last_name,
+    'email': User.email,
+    'phone': User.phone,
+    'gender': User.gender,
+    'age': User.age,
+    'main_goal': User.main_goal,
+    'registration_date': User.registration_date,
+    'registered': User.registered,
+    'is_subscribed': User.is_subscribed,
+    'subscription_type': User.subscription_type,
+    'subscription_expires': User.subscription_expires,
+    'blogger_ref_code': User.blogger_ref_code,
+}
+
+# Колонки таблицы на странице пользователей
+USER_LIST_DEFAULT_FIELDS = ('id', 'username', 'registration_date', 'is_subscribed', 'subscription_expires')
+
+# Цели из анкеты бота (main_goal хранит выбранные цели через запятую)
+USER_GOALS = (
+    'Снижение веса',
+    'Набор мышечной массы',
+    'Коррекция осанки',
+    'Убрать зажатость в теле',
+    'Общий тонус/рельеф мышц',
+    'Восстановиться после родов',
+    'Снять эмоциональное напряжение',
+    'Улучшить качество сна',
+    'Стать более энергичным',
+)
+
+SUBSCRIPTION_FILTERS = ('active', 'expired', 'none')
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Неверный формат даты {field}, ожидается ГГГГ-ММ-ДД")
+
+
+def parse_user_list_args(args):
+    """
+    Разбирает параметры запроса /api/users.
+
+    Raises:
+        ValueError: при неверных значениях параметров
+    """
+    fields = [f.strip() for f in (args.get('fields') or '').split(',') if f.strip()]
+    unknown = [f for f in fields if f not in USER_LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+
+    subscription = args.get('subscription') or None
+    if subscription and subscription not in SUBSCRIPTION_FILTERS:
+        raise ValueError(f"subscription: ожидается одно из {', '.join(SUBSCRIPTION_FILTERS)}")
+
+    try:
+        limit = int(args.get('limit') or USERS_PAGE_SIZE)
+        cursor = int(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        raise ValueError("limit и cursor должны быть числами")
+
+    registered_from = args.get('registered_from')
+    registered_to = args.get('registered_to')
+    return {
+        'fields': fields or list(USER_LIST_DEFAULT_FIELDS),
+        'subscription': subscription,
+        'goal': (args.get('goal') or '').strip() or None,
+        'registered_from': _parse_date(registered_from, 'registered_from') if registered_from else None,
+        # Включительно: до начала следующего дня
+        'registered_to': _parse_date(registered_to, 'registered_to') + timedelta(days=1) if registered_to else None,
+        'search': (args.get('q') or '').strip() or None,
+        'limit': max(1, min(limit, USERS_PAGE_MAX_SIZE)),
+        'cursor': cursor,
+    }
+
+
+def _filter_conditions(params, now):
+    conditions = []
+
+    subscription = params.get('subscription')
+    if subscription == 'active':
+        conditions.append(User.is_subscribed == True)
+        conditions.append(or_(User.subscription_expires == None, User.subscription_expires > now))
+    elif subscription == 'expired':
+        conditions.append(User.subscription_expires != None)
+        conditions.append(User.subscription_expires <= now)
+    elif subscription == 'none':
+        conditions.append(or_(User.is_subscribed == False, User.is_subscribed == None))
+        conditions.append(User.subscription_expires == None)
+
+    if params.get('goal'):
+        conditions.append(User.main_goal.contains(params['goal'], autoescape=True))
+
+    if params.get('registered_from'):
+        conditions.append(User.registration_date >= params['registered_from'])
+    if params.get('registered_to'):
+        conditions.append(User.registration_date < params['registered_to'])
+
+    search = params.get('search')
+    if search:
+        search = search.lstrip('@')
+        if search.isdigit():
+            # Telegram ID или id записи - точное совпадение по индексу
+            conditions.append(or_(User.user_id == search, User.id == int(search)))
+        else:
+            pattern = f"%{search}%"
+            conditions.append(or_(
+                User.username.ilike(pattern),
+                User.first_name.ilike(pattern),
+                User.last_name.ilike(pattern),
+                User.email.ilike(pattern),
+            ))
+    return conditions
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def list_users(db_session, params, now=None):
+    """
+    Одна страница пользователей, новые первыми.
+
+    Args:
+        params: результат parse_user_list_args
+    Returns:
+        dict: {'users': [...], 'next_cursor': id или None, 'fields': [...]}
+    """
+    fields = list(params['fields'])
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    limit = params['limit']
+
+    conditions = _filter_conditions(params, now or datetime.now())
+    if params.get('cursor') is not None:
+        conditions.append(User.id < params['cursor'])
+
+    query = db_session.query(*[USER_LIST_FIELDS[f].label(f) for f in fields])
+    if conditions:
+        query = query.filter(and_(*conditions))
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    rows = query.order_by(User.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'users': [{f: _serialize(getattr(row, f)) for f in fields} for row in rows],
+        'next_cursor': rows[-1].id if has_more else None,
+        'fields': fields,
+    }